@@ -0,0 +1,56 @@
+"""
+Benchmark per-turn latency with a fresh client per turn versus one pooled
+session client, against a local stub Ollama server.
+
+    python -m benchmarks.bench_connection_pool
+"""
+
+import asyncio
+import statistics
+import time
+from src.core.llm import Message, OllamaClient
+from .stub_ollama import StubOllama
+
+TURNS = 200
+
+
+async def _turn(client: OllamaClient) -> float:
+    messages = [Message(role="user", content="ping")]
+    start = time.perf_counter()
+    async for _ in client.generate("stub", messages, delta=True):
+        pass
+    return time.perf_counter() - start
+
+
+async def _per_turn_clients(base_url: str):
+    timings = []
+    for _ in range(TURNS):
+        async with OllamaClient(base_url=base_url) as client:
+            timings.append(await _turn(client))
+    return timings
+
+
+async def _shared_client(base_url: str):
+    timings = []
+    async with OllamaClient(base_url=base_url) as client:
+        for _ in range(TURNS):
+            timings.append(await _turn(client))
+    return timings
+
+
+def _report(label: str, timings, connections: int) -> None:
+    print(f"{label:<18} mean {statistics.mean(timings) * 1e3:7.3f} ms  "
+          f"p50 {statistics.median(timings) * 1e3:7.3f} ms  "
+          f"connections {connections}")
+
+
+async def main() -> None:
+    for label, runner in (("client per turn", _per_turn_clients),
+                          ("shared client", _shared_client)):
+        with StubOllama(tokens=20) as stub:
+            timings = await runner(stub.base_url)
+            _report(label, timings, stub.connections)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
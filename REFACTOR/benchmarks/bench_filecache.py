@@ -0,0 +1,59 @@
+"""
+Benchmark an agent session re-reading the same hot files every turn:
+reading them from disk each time, versus through the content cache.
+
+    python -m benchmarks.bench_filecache
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from src.core.filecache import FileContentCache
+from src.core.reader import FileReader
+
+FILES = 200
+FILE_LINES = 600
+TURNS = 20
+
+
+def _from_disk(paths) -> None:
+    for path in paths:
+        with open(path, "rb") as f:
+            f.read().decode("utf-8", errors="replace")
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="bench-filecache-")
+    try:
+        paths = []
+        for n in range(FILES):
+            path = os.path.join(root, f"module_{n}.py")
+            with open(path, "w") as f:
+                f.write("".join(f"    value_{i} = compute(value_{i - 1}, {n})\n" for i in range(FILE_LINES)))
+            paths.append(path)
+        size = sum(os.path.getsize(path) for path in paths)
+        print(f"{FILES} files, {size / 2**20:.1f} MiB, read {TURNS} times each")
+
+        cache = FileContentCache()
+        reader = FileReader(file_cache=cache)
+        # A cache taking no files leaves the reader on mmap
+        mmap_reader = FileReader(file_cache=FileContentCache(max_file_bytes=-1))
+        for label, read in (
+            ("from disk", lambda: _from_disk(paths)),
+            ("read_text", lambda: [cache.read_text(path) for path in paths]),
+            ("read, mmap", lambda: [mmap_reader.read(path, max_bytes=10**6) for path in paths]),
+            ("read, cache", lambda: [reader.read(path, max_bytes=10**6) for path in paths]),
+        ):
+            start = time.perf_counter()
+            for _ in range(TURNS):
+                read()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<12} {elapsed / TURNS * 1e3:7.2f} ms per turn")
+        print(f"cache: {cache.stats()}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
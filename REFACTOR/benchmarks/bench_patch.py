@@ -0,0 +1,94 @@
+"""
+Benchmark applying a patch with many chunks to a large file, locating
+each chunk with a plain scan from the top of the file versus the line
+index searching forward from the previous chunk while parsing, then
+copying the file in one pass.
+
+    python -m benchmarks.bench_patch
+"""
+
+import random
+import time
+from typing import List, Tuple
+from src.core.patch import DiffError, patch_to_commit, text_to_patch
+
+FILE_LINES = 50_000
+CHUNKS = 200
+RUNS = 3
+
+
+def _make_file(rng: random.Random) -> List[str]:
+    """Source-like lines, with the repetition real code has."""
+    common = ["    return result", "        pass", "    }", "else:", "# ----"]
+    lines = []
+    for i in range(FILE_LINES):
+        if rng.random() < 0.3:
+            lines.append(rng.choice(common))
+        else:
+            lines.append(f"    value_{i % 5000} = compute({rng.randrange(1000)})")
+    return lines
+
+
+def _make_patch(lines: List[str], rng: random.Random) -> str:
+    """A patch changing one line in each of CHUNKS evenly spread places."""
+    out = ["*** Begin Patch", "*** Update File: big.py"]
+    step = len(lines) // CHUNKS
+    for n in range(CHUNKS):
+        at = n * step + rng.randrange(3, step - 3)
+        out.append("@@ ")
+        out += lines[at - 3:at]
+        out.append(f"-{lines[at]}")
+        out.append(f"+{lines[at]}  # changed")
+        out += lines[at + 1:at + 4]
+    out.append("*** End Patch")
+    return "\n".join(out)
+
+
+def _scan_from_start(lines: List[str], context: List[str]) -> Tuple[int, int]:
+    """The old lookup: compare line by line from the top for every chunk."""
+    for i in range(len(lines)):
+        for j, ctx_line in enumerate(context):
+            if i + j >= len(lines) or lines[i + j] != ctx_line:
+                break
+        else:
+            return i, i + len(context)
+    raise DiffError("Context not found")
+
+
+def _apply_scanning(text: str, patch) -> str:
+    lines = text.splitlines()
+    new_lines = lines.copy()
+    shift = 0
+    for chunk in patch.actions["big.py"].chunks:
+        start, end = _scan_from_start(lines, chunk.del_lines)
+        new_lines[start + shift:end + shift] = chunk.ins_lines
+        shift += len(chunk.ins_lines) - (end - start)
+    return "\n".join(new_lines) + "\n"
+
+
+def main() -> None:
+    rng = random.Random(0)
+    lines = _make_file(rng)
+    text = "\n".join(lines) + "\n"
+    patch_text = _make_patch(lines, rng)
+    orig = {"big.py": text}
+    patch, _ = text_to_patch(patch_text, orig)
+
+    results = {}
+    for label, apply in (
+        ("scan", lambda: _apply_scanning(text, patch)),
+        # Chunks are located while parsing, so that is part of the cost
+        ("indexed", lambda: patch_to_commit(text_to_patch(patch_text, orig)[0],
+                                            orig).changes["big.py"].new_content),
+    ):
+        best = float("inf")
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            results[label] = apply()
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:<8} {CHUNKS} chunks on {FILE_LINES} lines in {best * 1e3:8.1f} ms")
+    assert results["scan"] == results["indexed"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark committing a refactor patch that updates 100 files: writing
+each file in place as the patch is processed, versus one transaction
+staging, syncing and renaming all files, sequentially and in parallel.
+
+    python -m benchmarks.bench_patch_commit
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from src.core import patch as patch_module
+from src.core.patch import FileTransaction, process_patch
+
+FILES = 100
+FILE_LINES = 200
+RUNS = 5
+
+
+def _make_tree(root: str) -> str:
+    """Create the files and a patch renaming a function in all of them."""
+    out = ["*** Begin Patch"]
+    for n in range(FILES):
+        lines = [f"value_{i} = old_name({i})" for i in range(FILE_LINES)]
+        with open(os.path.join(root, f"module_{n}.py"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        out.append(f"*** Update File: module_{n}.py")
+        out.append("@@ ")
+        out += [lines[99], f"-{lines[100]}", f"+{lines[100].replace('old_name', 'new_name')}", lines[101]]
+    out.append("*** End Patch")
+    return "\n".join(out)
+
+
+def _in_place(root: str, text: str) -> None:
+    """Write and remove files one by one, as the tool used to."""
+    def open_fn(path: str) -> str:
+        with open(os.path.join(root, path)) as f:
+            return f.read()
+
+    def write_fn(path: str, content: str) -> None:
+        with open(os.path.join(root, path), "w") as f:
+            f.write(content)
+
+    process_patch(text, open_fn, write_fn, lambda path: os.remove(os.path.join(root, path)))
+
+
+def _transaction(root: str, text: str, fsync: bool = True) -> None:
+    transaction = FileTransaction(root, fsync=fsync)
+
+    def open_fn(path: str) -> str:
+        with open(transaction.path(path)) as f:
+            return f.read()
+
+    process_patch(text, open_fn, transaction.write, transaction.remove)
+    transaction.commit()
+
+
+def main() -> None:
+    # On the working directory's file system, which is rarely tmpfs
+    root = tempfile.mkdtemp(dir=os.getcwd(), prefix=".bench-")
+    parallel_min = patch_module.PARALLEL_STAGING_MIN_FILES
+    try:
+        text = _make_tree(root)
+        for label, apply, sequential in (
+            ("in place", _in_place, False),
+            ("transaction, no fsync", lambda r, t: _transaction(r, t, fsync=False), False),
+            ("transaction, sequential", _transaction, True),
+            ("transaction, parallel", _transaction, False),
+        ):
+            patch_module.PARALLEL_STAGING_MIN_FILES = FILES + 1 if sequential else parallel_min
+            best = float("inf")
+            for _ in range(RUNS):
+                _make_tree(root)
+                start = time.perf_counter()
+                apply(root, text)
+                best = min(best, time.perf_counter() - start)
+            print(f"{label:<24} {FILES} files in {best * 1e3:7.1f} ms")
+    finally:
+        patch_module.PARALLEL_STAGING_MIN_FILES = parallel_min
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
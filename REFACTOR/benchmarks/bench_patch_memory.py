@@ -0,0 +1,71 @@
+"""
+Benchmark peak memory of applying a patch that updates many large files:
+reading every file and building the whole commit up front, versus
+streaming the patch one file at a time into a transaction.
+
+    python -m benchmarks.bench_patch_memory
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from src.core.patch import (FileTransaction, apply_patch_to_files, identify_files_needed,
+                            patch_to_commit, text_to_patch)
+
+FILES = 20
+FILE_LINES = 100_000
+
+
+def _make_tree(root: str) -> str:
+    """Create the files and a patch changing one line in each."""
+    out = ["*** Begin Patch"]
+    for n in range(FILES):
+        lines = [f"{n}:{i} " + "x" * 30 for i in range(FILE_LINES)]
+        with open(os.path.join(root, f"data_{n}.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        out += [f"*** Update File: data_{n}.txt", "@@", f"-{lines[500]}", f"+{lines[500]} changed"]
+    out.append("*** End Patch")
+    return "\n".join(out)
+
+
+def _up_front(root: str, text: str) -> None:
+    """Load all files, build the whole commit, then write it."""
+    orig = {}
+    for path in identify_files_needed(text):
+        with open(os.path.join(root, path)) as f:
+            orig[path] = f.read()
+    patch, _ = text_to_patch(text, orig)
+    commit = patch_to_commit(patch, orig)
+    transaction = FileTransaction(root, fsync=False)
+    for path, change in commit.changes.items():
+        transaction.write(path, change.new_content)
+    transaction.commit()
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(dir=os.getcwd(), prefix=".bench-")
+    try:
+        text = _make_tree(root)
+        size = sum(os.path.getsize(os.path.join(root, name)) for name in os.listdir(root))
+        print(f"{FILES} files, {size / 2**20:.0f} MiB in total, "
+              f"{size / FILES / 2**20:.1f} MiB each")
+        for label, apply in (
+            ("up front", _up_front),
+            ("streaming", lambda r, t: apply_patch_to_files(t, cwd=r)),
+        ):
+            _make_tree(root)
+            tracemalloc.start()
+            start = time.perf_counter()
+            apply(root, text)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{label:<10} peak {peak / 2**20:7.1f} MiB  in {elapsed:5.2f}s")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark reading 100 lines deep into a large log: reading the whole file
+and slicing its lines, versus a ranged read through mmap, the first time
+and with the line index already built.
+
+    python -m benchmarks.bench_read
+"""
+
+import os
+import tempfile
+import time
+from src.core.reader import FileReader
+
+LINES = 2_000_000
+RANGES = [(40_000, 40_100), (1_500_000, 1_500_100)]
+
+
+def _whole_file(path: str, start: int, end: int) -> str:
+    with open(path) as f:
+        return "".join(f.read().splitlines(keepends=True)[start - 1:end])
+
+
+def main() -> None:
+    fd, path = tempfile.mkstemp(suffix=".log")
+    try:
+        with os.fdopen(fd, "w") as f:
+            for i in range(LINES):
+                f.write(f"2024-01-01T00:00:{i % 60:02d} INFO request {i} served in {i % 97} ms\n")
+        print(f"{LINES} lines, {os.path.getsize(path) / 2**20:.0f} MiB")
+
+        for start, end in RANGES:
+            file_reader = FileReader()
+            timings = []
+            for label, read in (
+                ("whole file", lambda: _whole_file(path, start, end)),
+                ("mmap, first", lambda: file_reader.read(path, start_line=start, end_line=end)),
+                ("mmap, cached", lambda: file_reader.read(path, start_line=start, end_line=end)),
+            ):
+                t = time.perf_counter()
+                text = read()
+                timings.append((label, time.perf_counter() - t, text))
+            assert len({text for _, _, text in timings}) == 1
+            print(f"lines {start}-{end}: " + "  ".join(
+                f"{label} {elapsed * 1e3:8.2f} ms" for label, elapsed, _ in timings
+            ))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
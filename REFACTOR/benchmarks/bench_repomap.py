@@ -0,0 +1,70 @@
+"""
+Benchmark the repository map of a generated project: outlining every file
+in this process and in a process pool, then rendering again with the
+outlines cached, against the tokens it would take to read every file.
+
+    python -m benchmarks.bench_repomap
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+from src.core.context import estimate_tokens
+from src.core.repomap import RepoMap
+from src.core.search import get_index
+
+MODULES = 3000
+FUNCTIONS = 12
+
+
+def _make_project(root: str) -> int:
+    """Write the project and return its size in tokens."""
+    rng = random.Random(0)
+    tokens = 0
+    for n in range(MODULES):
+        package = os.path.join(root, "app", f"pkg{n % 30}")
+        os.makedirs(package, exist_ok=True)
+        imports = sorted({rng.randrange(MODULES) for _ in range(4)})
+        lines = [f"from app.pkg{i % 30}.mod{i} import func_{i}_0" for i in imports]
+        lines += ["", f"class Model{n}:", "    def save(self, force=False):", "        return force", ""]
+        for f in range(FUNCTIONS):
+            lines += [f"def func_{n}_{f}(value, *, retries=3):",
+                      f"    result = value * {f}",
+                      "    for _ in range(retries):",
+                      "        result += 1",
+                      "    return result", ""]
+        source = "\n".join(lines)
+        tokens += estimate_tokens(source)
+        with open(os.path.join(package, f"mod{n}.py"), "w") as f:
+            f.write(source)
+    return tokens
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="bench-repomap-")
+    try:
+        tokens = _make_project(root)
+        print(f"{MODULES} modules, ~{tokens} tokens to read them all")
+        start = time.perf_counter()
+        get_index(root).files()
+        print(f"file list    {(time.perf_counter() - start) * 1e3:7.0f} ms")
+        # At least two workers, so the pool is used even on one CPU
+        workers = max(os.cpu_count() or 1, 2)
+        for label, repo in (("inline", RepoMap(root, workers=1)),
+                            (f"{workers} processes", RepoMap(root, workers=workers))):
+            start = time.perf_counter()
+            text = repo.render()
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            repo.render()
+            warm = time.perf_counter() - start
+            print(f"{label:<12} cold {cold * 1e3:7.0f} ms  cached {warm * 1e3:6.0f} ms  "
+                  f"map ~{estimate_tokens(text)} tokens")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark small commands unconfined and confined by the platform's
+sandbox backend: a new process per command, a pool of pre-started
+confined workers and one persistent confined session.
+
+    python -m benchmarks.bench_sandbox_backends
+"""
+
+import asyncio
+import os
+import statistics
+import time
+from src.core.sandbox import Sandbox, SandboxType
+
+COMMANDS = ["true", "ls", "cat README.md"]
+RUNS = 300
+
+
+async def _run(sandbox: Sandbox, cwd: str):
+    await sandbox.warm_up(cwd=cwd)
+    timings = []
+    for i in range(RUNS):
+        start = time.perf_counter()
+        result = await sandbox.exec(COMMANDS[i % len(COMMANDS)], cwd=cwd)
+        timings.append(time.perf_counter() - start)
+        assert result.code == 0, result.stderr
+    return timings
+
+
+async def main() -> None:
+    cwd = os.getcwd()
+    confined = Sandbox().sandbox_type
+    print(f"backend: {confined.value}")
+    configs = [
+        ("unconfined", dict(sandbox_type=SandboxType.NONE)),
+        ("confined", dict()),
+        ("confined pool", dict(pool_size=4)),
+        ("confined session", dict(persistent=True)),
+    ]
+    for label, kwargs in configs:
+        sandbox = Sandbox(writable_paths=[cwd], **kwargs)
+        start = time.perf_counter()
+        timings = await _run(sandbox, cwd)
+        wall = time.perf_counter() - start
+        await sandbox.aclose()
+        print(f"{label:<17} {RUNS} commands in {wall:5.2f}s  "
+              f"mean {statistics.mean(timings) * 1e3:6.2f} ms  "
+              f"p50 {statistics.median(timings) * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark content and filename queries on a generated workspace: grep -r
+over the whole tree, versus the search index once it is built.
+
+    python -m benchmarks.bench_search
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from src.core.search import SearchIndex
+
+FILES = 20_000
+FILE_LINES = 80
+QUERIES = [r"handle_request_\d+", r"RareToken4242", r"def compute_\w+\(self", r"TODO\(alice\)"]
+WORDS = ["self", "value", "result", "request", "index", "config", "buffer", "item",
+         "count", "name", "data", "path", "error", "return", "yield", "None"]
+
+
+def _make_tree(root: str) -> None:
+    rng = random.Random(0)
+    for n in range(FILES):
+        directory = os.path.join(root, f"pkg{n % 50}", f"mod{n % 7}")
+        os.makedirs(directory, exist_ok=True)
+        lines = [f"def compute_{n}_{i}(self, {rng.choice(WORDS)}):" if i % 10 == 0 else
+                 "    " + " ".join(rng.choice(WORDS) for _ in range(8))
+                 for i in range(FILE_LINES)]
+        if n % 1000 == 0:
+            lines.append(f"    handle_request_{n}(value)  # TODO(alice)")
+        if n == 4242:
+            lines.append("RareToken4242 = None")
+        with open(os.path.join(directory, f"file_{n}.py"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _grep(root: str, pattern: str) -> int:
+    out = subprocess.run(["grep", "-rnE", "--exclude-dir=.git", pattern, "."],
+                         cwd=root, capture_output=True, text=True).stdout
+    return len(out.splitlines())
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="bench-search-")
+    try:
+        _make_tree(root)
+        print(f"{FILES} files of {FILE_LINES} lines")
+        index = SearchIndex(root)
+        start = time.perf_counter()
+        index.refresh()
+        print(f"index build {time.perf_counter() - start:6.2f} s")
+        start = time.perf_counter()
+        index.refresh()
+        print(f"refresh, nothing changed {(time.perf_counter() - start) * 1e3:7.1f} ms")
+
+        for pattern in QUERIES:
+            grep_pattern = pattern.replace(r"\d", "[0-9]").replace(r"\w", "[[:alnum:]_]")
+            start = time.perf_counter()
+            grep_count = _grep(root, grep_pattern)
+            grep_time = time.perf_counter() - start
+            start = time.perf_counter()
+            results = index.search(pattern, max_results=10**6)
+            index_time = time.perf_counter() - start
+            assert len(results) == grep_count, (pattern, len(results), grep_count)
+            print(f"{pattern:<24} {grep_count:6} lines  grep -r {grep_time * 1e3:8.1f} ms  "
+                  f"index {index_time * 1e3:8.1f} ms")
+
+        start = time.perf_counter()
+        found = index.find_files(r"pkg3/mod2/file_\d+3\.py$")
+        print(f"{'filename query':<24} {len(found):6} files  "
+              f"index {(time.perf_counter() - start) * 1e3:8.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
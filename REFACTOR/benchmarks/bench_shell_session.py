@@ -0,0 +1,42 @@
+"""
+Benchmark small shell commands run one-shot (a new /bin/sh per command)
+versus in one persistent shell session.
+
+    python -m benchmarks.bench_shell_session
+"""
+
+import asyncio
+import os
+import statistics
+import time
+from src.core.sandbox import Sandbox
+
+COMMANDS = ["ls", "cat README.md", "git status --short"]
+RUNS = 500
+
+
+async def _run(sandbox: Sandbox, cwd: str):
+    timings = []
+    for i in range(RUNS):
+        start = time.perf_counter()
+        result = await sandbox.exec(COMMANDS[i % len(COMMANDS)], cwd=cwd)
+        timings.append(time.perf_counter() - start)
+        assert result.code == 0, result.stderr
+    return timings
+
+
+async def main() -> None:
+    cwd = os.getcwd()
+    for label, persistent in (("one-shot", False), ("persistent", True)):
+        sandbox = Sandbox(persistent=persistent)
+        start = time.perf_counter()
+        timings = await _run(sandbox, cwd)
+        wall = time.perf_counter() - start
+        await sandbox.aclose()
+        print(f"{label:<11} {RUNS} commands in {wall:6.2f}s  "
+              f"mean {statistics.mean(timings) * 1e3:6.2f} ms  "
+              f"p50 {statistics.median(timings) * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
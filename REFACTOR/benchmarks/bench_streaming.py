@@ -0,0 +1,73 @@
+"""
+Benchmark per-token cost of streaming a response and rendering it.
+
+Compares the accumulated mode (every chunk carries the whole text and the
+CLI re-renders it as Markdown) against delta mode with the incremental
+renderer. Run from the REFACTOR directory:
+
+    python -m benchmarks.bench_streaming
+"""
+
+import asyncio
+import io
+import json
+import time
+import httpx
+from rich.console import Console
+from rich.markdown import Markdown
+from src.core.llm import Message, OllamaClient
+from src.cli.render import MarkdownStreamRenderer
+
+SIZES = [500, 1000, 2000, 4000]
+WORDS = ["token", "stream", "render", "ollama", "model", "delta"]
+
+
+def _make_body(n_tokens: int) -> bytes:
+    lines = []
+    for i in range(n_tokens):
+        word = WORDS[i % len(WORDS)]
+        content = f" {word}" + ("\n\n" if i % 40 == 39 else "")
+        lines.append(json.dumps({"message": {"content": content}, "done": False}))
+    lines.append(json.dumps({"message": {"content": ""}, "done": True}))
+    return "\n".join(lines).encode()
+
+
+def _make_client(body: bytes) -> OllamaClient:
+    client = OllamaClient()
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    client._client = httpx.AsyncClient(transport=transport)
+    return client
+
+
+async def _run_accumulated(body: bytes) -> float:
+    console = Console(file=io.StringIO(), width=100)
+    messages = [Message(role="user", content="bench")]
+    start = time.perf_counter()
+    async with _make_client(body) as client:
+        async for response in client.generate("bench", messages):
+            console.print(Markdown(response.content))
+    return time.perf_counter() - start
+
+
+async def _run_delta(body: bytes) -> float:
+    console = Console(file=io.StringIO(), width=100)
+    messages = [Message(role="user", content="bench")]
+    start = time.perf_counter()
+    async with _make_client(body) as client:
+        with MarkdownStreamRenderer(console) as renderer:
+            async for response in client.generate("bench", messages, delta=True):
+                renderer.feed(response.content)
+    return time.perf_counter() - start
+
+
+async def main() -> None:
+    print(f"{'tokens':>8} {'accumulated us/tok':>20} {'delta us/tok':>14}")
+    for n in SIZES:
+        body = _make_body(n)
+        accumulated = await _run_accumulated(body)
+        delta = await _run_delta(body)
+        print(f"{n:>8} {accumulated / n * 1e6:>20.1f} {delta / n * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
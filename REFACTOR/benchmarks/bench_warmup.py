@@ -0,0 +1,70 @@
+"""
+Startup timing report: time to first token with and without model warm-up,
+and the cost of letting the model unload between turns.
+
+Uses a stub Ollama server that takes LOAD_DELAY seconds to load a model.
+
+    python -m benchmarks.bench_warmup
+"""
+
+import asyncio
+import time
+from src.core.config import load_config
+from src.core.llm import Message, OllamaClient
+from .stub_ollama import StubOllama
+
+LOAD_DELAY = 1.0
+MODEL = "stub"
+
+
+async def _first_token(client: OllamaClient) -> float:
+    messages = [Message(role="user", content="hello")]
+    start = time.perf_counter()
+    async for response in client.generate(MODEL, messages, delta=True):
+        if response.content:
+            break
+    return time.perf_counter() - start
+
+
+async def _startup(warm: bool, think_time: float) -> float:
+    """Time from process start to the first token of the first prompt."""
+    with StubOllama(load_delay=LOAD_DELAY) as stub:
+        start = time.perf_counter()
+        async with OllamaClient(base_url=stub.base_url, keep_alive="30m") as client:
+            if warm:
+                warm_up = asyncio.create_task(client.warm_up(MODEL))
+            await asyncio.to_thread(load_config, provider="ollama")
+            # Time the user spends typing the first prompt
+            await asyncio.sleep(think_time)
+            await _first_token(client)
+            if warm:
+                await warm_up
+        return time.perf_counter() - start
+
+
+async def _second_turn(keep_alive: str, idle: float) -> float:
+    """Time to first token of a turn that follows an idle pause."""
+    with StubOllama(load_delay=LOAD_DELAY) as stub:
+        async with OllamaClient(base_url=stub.base_url, keep_alive=keep_alive) as client:
+            await _first_token(client)
+            await asyncio.sleep(idle)
+            return await _first_token(client)
+
+
+async def main() -> None:
+    print(f"model load time: {LOAD_DELAY * 1000:.0f}ms\n")
+    print(f"{'first prompt':<28} {'cold TTFT':>10} {'warm TTFT':>10}")
+    for label, think_time in (("from the command line", 0.0),
+                              ("typed after 0.8s", 0.8)):
+        cold = await _startup(False, think_time)
+        warm = await _startup(True, think_time)
+        print(f"{label:<28} {cold * 1000:>8.0f}ms {warm * 1000:>8.0f}ms")
+
+    print(f"\n{'keep_alive':<12} {'TTFT after 1.5s idle':>22}")
+    for keep_alive in ("1s", "30m"):
+        ttft = await _second_turn(keep_alive, 1.5)
+        print(f"{keep_alive:<12} {ttft * 1000:>20.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
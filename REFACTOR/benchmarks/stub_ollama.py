@@ -0,0 +1,161 @@
+"""
+Minimal local stand-in for the Ollama HTTP API used by the benchmarks.
+
+Serves ``/api/chat`` as a chunked NDJSON stream and ``/api/tags``, and counts
+the TCP connections it accepts so benchmarks can show connection reuse.
+Models take ``load_delay`` seconds to load and stay resident for the
+request's ``keep_alive`` (5m by default, like Ollama).
+"""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Union
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_keep_alive(value: Union[str, int, float, None]) -> float:
+    """Convert an Ollama keep_alive value to seconds (inf for forever)."""
+    if value is None:
+        return 300.0
+    if isinstance(value, str):
+        for unit in sorted(DURATION_UNITS, key=len, reverse=True):
+            if value.endswith(unit):
+                value = float(value[:-len(unit)]) * DURATION_UNITS[unit]
+                break
+        else:
+            value = float(value)
+    return float("inf") if value < 0 else float(value)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def setup(self):
+        # Go's net/http (and so Ollama) disables Nagle by default
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith("/tags"):
+            body = json.dumps({"models": [{"name": "stub"}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat"):
+            self.send_error(404)
+            return
+        self.server.stub.requests.append(request)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in self.server.stub.chat_chunks(request):
+            data = (json.dumps(chunk) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, stub: "StubOllama"):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.stub = stub
+        self.lock = threading.Lock()
+        self.connections = 0
+
+
+class StubOllama:
+    """Threaded stub Ollama server.
+
+    Args:
+        tokens: Number of content chunks streamed per chat request
+        token_delay: Seconds to sleep between chunks
+        load_delay: Seconds it takes to load a model that is not resident
+    """
+
+    def __init__(self, tokens: int = 20, token_delay: float = 0.0,
+                 load_delay: float = 0.0):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.load_delay = load_delay
+        self.requests: List[Dict] = []
+        self._resident_until: Dict[str, float] = {}
+        self._load_lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    def _load(self, request: Dict) -> int:
+        """Load the requested model if needed and return the load time in ns."""
+        start = time.perf_counter_ns()
+        model = request.get("model", "")
+        with self._load_lock:
+            if self._resident_until.get(model, 0) < time.monotonic():
+                time.sleep(self.load_delay)
+            keep_alive = parse_keep_alive(request.get("keep_alive"))
+            self._resident_until[model] = time.monotonic() + keep_alive
+        return time.perf_counter_ns() - start
+
+    def chat_chunks(self, request: Dict):
+        """Produce the NDJSON chunks for a chat request."""
+        start = time.perf_counter_ns()
+        load_duration = self._load(request)
+        if not request.get("messages"):
+            yield {"message": {"role": "assistant", "content": ""},
+                   "done": True, "done_reason": "load"}
+            return
+        for i in range(self.tokens):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield {"message": {"role": "assistant", "content": f" tok{i}"}, "done": False}
+        elapsed = time.perf_counter_ns() - start
+        yield {
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "total_duration": elapsed,
+            "load_duration": load_duration,
+            "prompt_eval_count": sum(len(m.get("content", "")) // 4
+                                     for m in request.get("messages", [])),
+            "prompt_eval_duration": 0,
+            "eval_count": self.tokens,
+            "eval_duration": elapsed - load_duration,
+        }
+
+    def __enter__(self) -> "StubOllama":
+        self._server = _Server(self)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._server.shutdown()
+        self._server.server_close()
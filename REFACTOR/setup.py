@@ -5,6 +5,7 @@ setup(
     version="0.1.0",
     packages=find_packages(),
     include_package_data=True,
+    python_requires='>=3.10',
     install_requires=[
         'click>=8.1.0',
         'python-dotenv>=1.0.0',
@@ -13,6 +14,12 @@ setup(
         'httpx>=0.24.0',  # Async HTTP client
     ],
     extras_require={
+        'speed': [
+            'orjson>=3.6.0',  # Faster decoding of the streamed NDJSON
+        ],
+        'images': [
+            'Pillow>=9.0.0',  # Downscale oversized --image inputs
+        ],
         'test': [
             'pytest>=7.0.0',
             'pytest-asyncio>=0.21.0',
@@ -3,47 +3,68 @@ Interactive mode and prompt processing for the CLI.
 """
 
 import asyncio
-from typing import Optional
+from typing import List, Optional
 import click
 from rich.console import Console
-from rich.markdown import Markdown
-from ..core.executor import CommandExecutor, ExecResult
+from ..core.executor import CommandExecutor, ExecResult, OutputChunk
+from .render import MarkdownStreamRenderer
 
 console = Console()
 
-async def process_prompt(executor: CommandExecutor, prompt: str) -> None:
+async def process_prompt(executor: CommandExecutor, prompt: str,
+                         images: Optional[List[str]] = None) -> None:
     """Process a single prompt and display results.
     
     Args:
         executor: Command executor to use
         prompt: Prompt to process
+        images: Paths of images to attach to the prompt
     """
+    renderer = MarkdownStreamRenderer(console)
+    last_chunk = None
     try:
-        async for response in executor.process_message(prompt):
+        async for response in executor.process_message(prompt, images=images,
+                                                       stream_output=True):
             if isinstance(response, str):
-                # Regular text response
-                console.print(Markdown(response))
+                # Streamed text fragment
+                renderer.feed(response)
+            elif isinstance(response, OutputChunk):
+                # Live command output
+                renderer.finish()
+                _display_output_chunk(response)
+                last_chunk = response
             else:
                 # Command execution result
-                await _display_exec_result(response)
+                renderer.finish()
+                if last_chunk is not None and not last_chunk.text.endswith("\n"):
+                    console.print()
+                await _display_exec_result(
+                    response, streamed=last_chunk is not None,
+                    full_stdout=executor.context.env.get('FULL_STDOUT') == '1')
+                last_chunk = None
+        renderer.finish()
+        
+        if executor.context.env.get('DEBUG') == '1' and executor.prompt.reports:
+            console.print(f"[dim]{executor.prompt.reports[-1]}[/dim]")
                 
     except Exception as e:
+        renderer.finish()
         console.print(f"[red]Error processing prompt: {e}[/red]")
         if executor.context.env.get('DEBUG') == '1':
             import traceback
             console.print(traceback.format_exc())
 
-async def interactive_mode(executor: CommandExecutor) -> None:
+async def interactive_mode(executor: CommandExecutor,
+                           images: Optional[List[str]] = None) -> None:
     """Run in interactive mode.
     
     Args:
         executor: Command executor to use
+        images: Paths of images to attach to the first prompt
     """
     console.print("[bold]Open Codex CLI - Interactive Mode[/bold]")
     console.print("Type 'exit' or press Ctrl+C to quit\n")
     
-    history = []
-    
     while True:
         try:
             # Get input with history support
@@ -60,11 +81,9 @@ async def interactive_mode(executor: CommandExecutor) -> None:
             if prompt.lower() in ('exit', 'quit'):
                 break
                 
-            # Add to history
-            history.append(prompt)
-            
-            # Process the prompt
-            await process_prompt(executor, prompt)
+            # Process the prompt; the executor keeps the conversation history
+            await process_prompt(executor, prompt, images=images)
+            images = None
             console.print()  # Add spacing between interactions
             
         except click.Abort:
@@ -75,27 +94,43 @@ async def interactive_mode(executor: CommandExecutor) -> None:
                 import traceback
                 console.print(traceback.format_exc())
 
-async def _display_exec_result(result: ExecResult) -> None:
+def _display_output_chunk(chunk: OutputChunk) -> None:
+    """Display command output as it arrives.
+    
+    Args:
+        chunk: Output to display
+    """
+    style = "yellow" if chunk.stream == "stderr" else None
+    console.print(chunk.text, end="", style=style, markup=False, highlight=False)
+
+async def _display_exec_result(result: ExecResult, streamed: bool = False,
+                               full_stdout: bool = False) -> None:
     """Display a command execution result.
     
     Args:
         result: Execution result to display
+        streamed: Whether the output was already shown while it arrived
+        full_stdout: Whether to show long output without truncating it
     """
     if result.error:
         console.print(f"[red]Error: {result.error}[/red]")
         
-    if result.stdout:
-        # Check if we should show full output
-        if (len(result.stdout) > 1000 and 
-            not result.context.env.get('FULL_STDOUT') == '1'):
-            # Show truncated output
-            console.print(
-                result.stdout[:500] + 
-                "\n... [dim](output truncated, use --full-stdout to see all)[/dim] ...\n" +
-                result.stdout[-500:]
-            )
-        else:
-            console.print(result.stdout, end="")
+    if not streamed:
+        if result.stdout:
+            # Check if we should show full output
+            if len(result.stdout) > 1000 and not full_stdout:
+                # Show truncated output
+                console.print(
+                    result.stdout[:500] + 
+                    "\n... [dim](output truncated, use --full-stdout to see all)[/dim] ...\n" +
+                    result.stdout[-500:]
+                )
+            else:
+                console.print(result.stdout, end="")
+                
+        if result.stderr:
+            console.print(f"[yellow]{result.stderr}[/yellow]", end="")
             
-    if result.stderr:
-        console.print(f"[yellow]{result.stderr}[/yellow]", end="")
+    omitted = result.stdout_omitted + result.stderr_omitted
+    if omitted:
+        console.print(f"[dim]({omitted} bytes of output were not kept)[/dim]")
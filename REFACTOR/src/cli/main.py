@@ -6,14 +6,19 @@ A lightweight coding agent that runs in your terminal.
 
 import os
 import sys
-from typing import Optional, List
+import time
+from typing import Any, Dict, Optional, List, Union
 import asyncio
 from pathlib import Path
 import click
 from rich.console import Console
 from dotenv import load_dotenv
-from ..core.config import load_config
+from ..core.config import load_config, load_stored_config, resolve_model_settings
 from ..core.executor import CommandExecutor, ExecutionContext
+from ..core.filecache import default_file_cache
+from ..core.llm import OllamaClient
+from ..core.sandbox import DEFAULT_COMMAND_TIMEOUT, ResourceLimits
+from ..core.search import get_index
 from .interactive import process_prompt, interactive_mode
 
 console = Console()
@@ -21,6 +26,15 @@ console = Console()
 # Load environment variables early
 load_dotenv()
 
+def _parse_keep_alive(ctx, param, value: Optional[str]) -> Union[str, int, None]:
+    """Send plain numbers as seconds, as Ollama expects, and durations as-is."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
 @click.command()
 @click.argument('prompt', required=False)
 @click.option('-m', '--model', 
@@ -58,27 +72,58 @@ load_dotenv()
               type=click.Path(exists=True))
 @click.option('--full-stdout', is_flag=True,
               help='Do not truncate stdout/stderr from command outputs')
+@click.option('--keep-alive',
+              help='How long Ollama keeps the model loaded, e.g. 30m or -1 for forever (default: 30m)',
+              callback=_parse_keep_alive,
+              default=None)
+@click.option('--context-size', type=int,
+              help='Context window size in tokens sent to Ollama as num_ctx (default: 8192)',
+              default=None)
+@click.option('--stats', is_flag=True,
+              help='Print latency and throughput statistics when the session ends')
+@click.option('--stats-file',
+              help='Append per-turn statistics to this file as JSON lines',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None)
+@click.option('--command-timeout', type=float,
+              help='Kill commands running longer than this many seconds (default: 600)',
+              default=DEFAULT_COMMAND_TIMEOUT)
+@click.option('--turn-timeout', type=float,
+              help='Stop handling a prompt after this many seconds, killing running commands',
+              default=None)
+@click.option('--max-cpu-time', type=int,
+              help='CPU time limit in seconds for each process a command starts',
+              default=None)
+@click.option('--max-memory', type=int,
+              help='Address space limit in MB for each process a command starts',
+              default=None)
 def cli(prompt: Optional[str], model: Optional[str], base_url: Optional[str],
         image: List[str], doc: Optional[str], cwd: Optional[str], debug: bool,
         quiet: bool, show_config: bool, approval_mode: Optional[str],
         auto_edit: bool, full_auto: bool, no_project_doc: bool,
-        project_doc: Optional[str], full_stdout: bool) -> None:
+        project_doc: Optional[str], full_stdout: bool,
+        keep_alive: Union[str, int, None], context_size: Optional[int],
+        stats: bool, stats_file: Optional[str], command_timeout: float,
+        turn_timeout: Optional[float], max_cpu_time: Optional[int],
+        max_memory: Optional[int]) -> None:
     """
     Open Codex CLI - A lightweight coding agent that runs in your terminal.
     
     If PROMPT is provided, executes that prompt immediately. Otherwise, starts an interactive session.
     """
     try:
-        # Load configuration
-        config = load_config(
+        config_args = dict(
             provider='ollama',  # Always use Ollama
             model=model,
             base_url=base_url,
+            keep_alive=keep_alive,
+            context_size=context_size,
             disable_project_doc=no_project_doc,
             project_doc_path=project_doc or doc  # Support both --doc and --project-doc
         )
         
         if show_config:
+            config = load_config(**config_args)
             click.echo("Opening configuration file...")
             editor = os.environ.get('EDITOR', 'vi')
             click.edit(filename=config.instructions_path, editor=editor)
@@ -96,25 +141,20 @@ def cli(prompt: Optional[str], model: Optional[str], base_url: Optional[str],
             writable_paths=[str(Path().resolve())]
         )
         
-        # Create executor
-        executor = CommandExecutor(
-            model=config.model or 'qwen2.5-coder',
-            base_url=config.base_url,
-            context=context
+        if quiet and not prompt:
+            console.print("[red]Error: Prompt is required in quiet mode[/red]")
+            sys.exit(1)
+            
+        executor_args = dict(
+            command_timeout=command_timeout or None,
+            turn_timeout=turn_timeout,
+            limits=ResourceLimits(
+                cpu_seconds=max_cpu_time,
+                memory_bytes=max_memory * 1024 * 1024 if max_memory else None
+            ) if max_cpu_time or max_memory else None
         )
-        
-        if quiet:
-            # Process single prompt and exit
-            if not prompt:
-                console.print("[red]Error: Prompt is required in quiet mode[/red]")
-                sys.exit(1)
-            asyncio.run(_process_prompt(executor, prompt))
-        else:
-            # Interactive mode
-            if prompt:
-                # Process initial prompt
-                asyncio.run(process_prompt(executor, prompt))
-            asyncio.run(interactive_mode(executor))
+        asyncio.run(_run_session(config_args, context, prompt, quiet, debug,
+                                 stats, stats_file, list(image), executor_args))
 
     except KeyboardInterrupt:
         console.print("\n[yellow]Interrupted by user[/yellow]")
@@ -126,5 +166,106 @@ def cli(prompt: Optional[str], model: Optional[str], base_url: Optional[str],
             console.print(traceback.format_exc())
         sys.exit(1)
 
+async def _run_session(config_args: Dict[str, Any], context: ExecutionContext,
+                       prompt: Optional[str], quiet: bool, debug: bool,
+                       stats: bool = False, stats_file: Optional[str] = None,
+                       images: Optional[List[str]] = None,
+                       executor_args: Optional[Dict[str, Any]] = None) -> None:
+    """Run a CLI session.
+    
+    The session owns a single Ollama client so every turn reuses the same
+    pooled keep-alive connection; it is closed when the session ends. The
+    model is preloaded while the configuration and project docs are read.
+    
+    Args:
+        config_args: Arguments for load_config
+        context: Execution context for commands
+        prompt: Optional initial prompt
+        quiet: Process the prompt and exit without an interactive session
+        debug: Print startup timings
+        stats: Print a statistics summary when the session ends
+        stats_file: File to append per-turn statistics to as JSONL
+        images: Paths of images to attach to the first prompt
+        executor_args: Extra arguments for CommandExecutor, such as timeouts
+    """
+    start = time.perf_counter()
+    stored_config = load_stored_config()
+    model, base_url, keep_alive = resolve_model_settings(
+        config_args['provider'],
+        model=config_args['model'],
+        base_url=config_args['base_url'],
+        keep_alive=config_args['keep_alive'],
+        stored_config=stored_config
+    )
+    
+    async with OllamaClient(base_url=base_url, keep_alive=keep_alive) as client:
+        warm_up = asyncio.create_task(client.warm_up(model))
+        warm_up.add_done_callback(
+            lambda task: _report_warm_up(task, model, start, debug)
+        )
+        config = await asyncio.to_thread(
+            load_config, stored_config=stored_config, **config_args
+        )
+        if debug:
+            console.print(
+                f"[dim]Startup: config loaded in "
+                f"{(time.perf_counter() - start) * 1000:.0f}ms[/dim]"
+            )
+        
+        executor = CommandExecutor(
+            model=config.model or 'qwen2.5-coder',
+            base_url=config.base_url,
+            context=context,
+            client=client,
+            context_size=config.context_size,
+            instructions=config.instructions,
+            stats_path=stats_file,
+            **(executor_args or {})
+        )
+        
+        # Start the confined shell while the user types
+        shell_warm_up = asyncio.create_task(
+            executor.sandbox.warm_up(cwd=context.cwd, env=context.env)
+        )
+        # Index the workspace for the search tool in the background
+        get_index(context.cwd)
+        
+        try:
+            if prompt:
+                # Process initial prompt
+                await process_prompt(executor, prompt, images=images)
+                images = None
+            if not quiet:
+                await interactive_mode(executor, images=images)
+        finally:
+            warm_up.cancel()
+            shell_warm_up.cancel()
+            # Don't leave the shell session or commands behind
+            await executor.aclose()
+            if stats:
+                console.print(executor.metrics.format_summary())
+                cache = default_file_cache.stats()
+                console.print(f"  file cache:          {cache['hits']} hits, "
+                              f"{cache['misses']} misses")
+
+def _report_warm_up(task: asyncio.Task, model: str, start: float, debug: bool) -> None:
+    """Report the outcome of the model warm-up in debug mode.
+    
+    A failed warm-up is not fatal; the first real request reports any
+    connection problem to the user.
+    """
+    if task.cancelled():
+        return
+    error = task.exception()
+    if not debug:
+        return
+    if error:
+        console.print(f"[dim]Startup: warm-up of {model} failed: {error}[/dim]")
+    else:
+        console.print(
+            f"[dim]Startup: {model} loaded in {task.result() * 1000:.0f}ms "
+            f"({(time.perf_counter() - start) * 1000:.0f}ms after start)[/dim]"
+        )
+
 if __name__ == '__main__':
     cli()
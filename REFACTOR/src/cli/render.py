@@ -0,0 +1,118 @@
+"""
+Incremental rendering of streamed model output.
+"""
+
+from typing import List, Optional
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.live import Live
+from rich.markdown import Markdown
+
+FENCE_MARKERS = ("```", "~~~")
+
+
+class _PendingBlock:
+    """Lazily rendered view of the block that is still streaming.
+
+    The markdown is only parsed when Live refreshes the display, so feeding a
+    fragment costs an append regardless of how often tokens arrive.
+    """
+
+    def __init__(self, renderer: "MarkdownStreamRenderer"):
+        self._renderer = renderer
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        text = self._renderer.pending_text
+        if text:
+            yield Markdown(text)
+
+
+class MarkdownStreamRenderer:
+    """Render streamed markdown append-only.
+
+    Text is split into blocks at blank lines outside fenced code blocks. Each
+    completed block is rendered exactly once and printed above the live area,
+    which only ever shows the block currently being streamed. The cost per
+    fragment therefore depends on the size of the current block rather than
+    on the length of the whole response.
+    """
+
+    def __init__(self, console: Console, refresh_per_second: float = 8):
+        """Initialize the renderer.
+
+        Args:
+            console: Console to render to
+            refresh_per_second: Refresh rate of the live area
+        """
+        self.console = console
+        self._lines: List[str] = []
+        self._partial = ""
+        self._in_fence = False
+        self._live: Optional[Live] = None
+        self._refresh_per_second = refresh_per_second
+
+    @property
+    def pending_text(self) -> str:
+        """Text of the block that has not been committed yet."""
+        if not self._lines:
+            return self._partial
+        return "\n".join(self._lines + [self._partial])
+
+    def __enter__(self) -> "MarkdownStreamRenderer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.finish()
+
+    def feed(self, fragment: str) -> None:
+        """Append a streamed fragment.
+
+        Args:
+            fragment: Newly generated text
+        """
+        if not fragment:
+            return
+        if "\n" not in fragment:
+            self._partial += fragment
+        else:
+            parts = fragment.split("\n")
+            self._add_line(self._partial + parts[0])
+            for line in parts[1:-1]:
+                self._add_line(line)
+            self._partial = parts[-1]
+        self._ensure_live()
+
+    def finish(self) -> None:
+        """Commit whatever is left and stop the live display."""
+        if self._partial:
+            self._lines.append(self._partial)
+            self._partial = ""
+        self._commit()
+        if self._live is not None:
+            self._live.stop()
+            self._live = None
+        self._in_fence = False
+
+    def _add_line(self, line: str) -> None:
+        if line.lstrip().startswith(FENCE_MARKERS):
+            self._in_fence = not self._in_fence
+        if not line.strip() and not self._in_fence:
+            self._commit()
+            return
+        self._lines.append(line)
+
+    def _commit(self) -> None:
+        if not self._lines:
+            return
+        block = "\n".join(self._lines)
+        self._lines = []
+        self.console.print(Markdown(block))
+
+    def _ensure_live(self) -> None:
+        if self._live is None and self.console.is_terminal:
+            self._live = Live(
+                _PendingBlock(self),
+                console=self.console,
+                refresh_per_second=self._refresh_per_second,
+                transient=True,
+            )
+            self._live.start()
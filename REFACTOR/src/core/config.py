@@ -8,7 +8,7 @@ import json
 import yaml
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Union
 
 # Default settings
 DEFAULT_PROVIDER = "ollama"
@@ -18,6 +18,14 @@ CONFIG_YAML_PATH = CONFIG_DIR / "config.yaml"
 CONFIG_YML_PATH = CONFIG_DIR / "config.yml"
 INSTRUCTIONS_PATH = CONFIG_DIR / "instructions.md"
 
+# How long Ollama keeps the model loaded after a request. Ollama's own
+# default of 5m is shorter than a typical pause between coding turns.
+DEFAULT_KEEP_ALIVE = "30m"
+
+# Context window requested from Ollama (num_ctx). Ollama's default of 2048
+# silently truncates the prompt of any multi-turn coding session.
+DEFAULT_CONTEXT_SIZE = 8192
+
 # Provider-specific settings
 PROVIDER_CONFIGS = {
     "ollama": {
@@ -40,6 +48,8 @@ class Config:
     instructions_path: Path
     memory_enabled: bool = False
     full_auto_error_mode: Optional[str] = None
+    keep_alive: Union[str, int, None] = DEFAULT_KEEP_ALIVE
+    context_size: int = DEFAULT_CONTEXT_SIZE
 
 def get_api_key_for_provider(provider: str) -> Optional[str]:
     """Get the API key for the specified provider."""
@@ -83,11 +93,70 @@ def load_project_doc(cwd: Path, explicit_path: Optional[str] = None,
         print(f"Warning: Failed to read {doc_path}: {e}")
         return None
 
+def load_stored_config() -> Dict[str, Any]:
+    """Load the stored config file, trying JSON first, then YAML."""
+    config_paths = [CONFIG_JSON_PATH, CONFIG_YAML_PATH, CONFIG_YML_PATH]
+    
+    for path in config_paths:
+        if path.exists():
+            try:
+                content = path.read_text()
+                if path.suffix in ['.yaml', '.yml']:
+                    return yaml.safe_load(content) or {}
+                return json.loads(content)
+            except Exception as e:
+                print(f"Warning: Failed to load {path}: {e}")
+    return {}
+
+def resolve_model_settings(provider: str,
+                           model: Optional[str] = None,
+                           base_url: Optional[str] = None,
+                           keep_alive: Union[str, int, None] = None,
+                           stored_config: Optional[Dict[str, Any]] = None
+                           ) -> Tuple[str, str, Union[str, int, None]]:
+    """Resolve the model, API base URL and keep-alive for a provider.
+    
+    This is cheap enough to run before the rest of the configuration is
+    loaded, so the model can be warmed up in the meantime.
+    
+    Args:
+        provider: Effective provider
+        model: Override the model from config
+        base_url: Override the provider base URL
+        keep_alive: Override the model keep-alive duration
+        stored_config: Stored config, loaded from disk if omitted
+        
+    Returns:
+        Tuple of (model, base_url, keep_alive)
+    """
+    if stored_config is None:
+        stored_config = load_stored_config()
+    provider_config = PROVIDER_CONFIGS.get(provider, {})
+    
+    # Priority: argument > stored > provider default
+    effective_model = (
+        model or
+        stored_config.get('model') or
+        provider_config.get('models', {}).get('agentic', '')
+    )
+    effective_keep_alive = (
+        keep_alive if keep_alive is not None else
+        stored_config.get('keepAlive', DEFAULT_KEEP_ALIVE)
+    )
+    return (
+        effective_model,
+        base_url or provider_config.get('base_url', ''),
+        effective_keep_alive
+    )
+
 def load_config(provider: Optional[str] = None,
                model: Optional[str] = None,
                base_url: Optional[str] = None,
                disable_project_doc: bool = False,
-               project_doc_path: Optional[str] = None) -> Config:
+               project_doc_path: Optional[str] = None,
+               keep_alive: Union[str, int, None] = None,
+               context_size: Optional[int] = None,
+               stored_config: Optional[Dict[str, Any]] = None) -> Config:
     """
     Load configuration from disk, environment variables, and arguments.
     
@@ -96,25 +165,16 @@ def load_config(provider: Optional[str] = None,
         model: Override the model from config
         disable_project_doc: Skip loading project documentation
         project_doc_path: Explicit path to project documentation
+        keep_alive: Override how long Ollama keeps the model loaded
+        context_size: Override the context window size in tokens
+        stored_config: Already loaded stored config, read from disk if omitted
     """
     # Ensure config directory exists
     CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     
     # Load stored config (try JSON first, then YAML)
-    stored_config: Dict[str, Any] = {}
-    config_paths = [CONFIG_JSON_PATH, CONFIG_YAML_PATH, CONFIG_YML_PATH]
-    
-    for path in config_paths:
-        if path.exists():
-            try:
-                content = path.read_text()
-                if path.suffix in ['.yaml', '.yml']:
-                    stored_config = yaml.safe_load(content) or {}
-                else:
-                    stored_config = json.loads(content)
-                break
-            except Exception as e:
-                print(f"Warning: Failed to load {path}: {e}")
+    if stored_config is None:
+        stored_config = load_stored_config()
     
     # Determine provider (priority: argument > env > stored > default)
     effective_provider = (
@@ -126,14 +186,13 @@ def load_config(provider: Optional[str] = None,
         DEFAULT_PROVIDER
     )
     
-    # Get provider-specific settings
-    provider_config = PROVIDER_CONFIGS.get(effective_provider, {})
-    
-    # Determine model (priority: argument > stored > provider default)
-    effective_model = (
-        model or
-        stored_config.get('model') or
-        provider_config.get('models', {}).get('agentic', '')
+    # Determine model, endpoint and keep-alive
+    effective_model, effective_base_url, effective_keep_alive = resolve_model_settings(
+        effective_provider,
+        model=model,
+        base_url=base_url,
+        keep_alive=keep_alive,
+        stored_config=stored_config
     )
     
     # Get API key
@@ -162,9 +221,11 @@ def load_config(provider: Optional[str] = None,
         provider=effective_provider,
         model=effective_model,
         api_key=api_key,
-        base_url=base_url or provider_config.get('base_url', ''),
+        base_url=effective_base_url,
         instructions=instructions,
         instructions_path=INSTRUCTIONS_PATH,
         memory_enabled=stored_config.get('memory', {}).get('enabled', False),
-        full_auto_error_mode=stored_config.get('fullAutoErrorMode')
+        full_auto_error_mode=stored_config.get('fullAutoErrorMode'),
+        keep_alive=effective_keep_alive,
+        context_size=context_size or stored_config.get('contextSize', DEFAULT_CONTEXT_SIZE)
     )
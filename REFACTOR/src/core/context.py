@@ -0,0 +1,197 @@
+"""
+Conversation history and context-window budgeting.
+Keeps per-message token estimates and compacts old turns so the prompt
+fits the model's context window.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+from .config import DEFAULT_CONTEXT_SIZE
+from .llm import Message
+
+# Rough average for code and English text with BPE tokenizers
+CHARS_PER_TOKEN = 4
+# Chat template tokens added around every message (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Rough prompt cost of one image for common vision models
+IMAGE_TOKENS = 768
+# Longest excerpt of a dropped request kept in the summary
+SUMMARY_LINE_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text.
+
+    Args:
+        text: Text to estimate
+
+    Returns:
+        Approximate token count
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """Shorten a text to a token budget, keeping its head and tail.
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token budget for the result
+
+    Returns:
+        The text itself if it fits, otherwise head and tail with a marker
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max_tokens * CHARS_PER_TOKEN // 2
+    omitted = len(text) - 2 * keep
+    return f"{text[:keep]}\n... [{omitted} characters omitted] ...\n{text[-keep:]}"
+
+
+@dataclass
+class ContextBudget:
+    """Token budget for the prompt sent to the model."""
+    context_size: int = DEFAULT_CONTEXT_SIZE
+    # Room left for the model's answer
+    reserve_tokens: int = 1024
+    # Tool outputs larger than this are cut down to head and tail
+    max_tool_output_tokens: int = 2048
+    # Compaction trims down to this fraction of the budget, so history
+    # is not rewritten again on the very next turn
+    low_water_ratio: float = 0.75
+    # Budget for the summary of compacted turns
+    summary_tokens: int = 256
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Tokens available for the prompt."""
+        return max(self.context_size - self.reserve_tokens, 0)
+
+
+class Conversation:
+    """Conversation history with cached token estimates.
+
+    Each message's estimate is computed once when it is added. System
+    messages added before the first turn are pinned; when the history
+    exceeds the budget the oldest turns are replaced by a short summary.
+    """
+
+    def __init__(self, budget: Optional[ContextBudget] = None):
+        """Initialize the conversation.
+
+        Args:
+            budget: Context budget to enforce
+        """
+        self.budget = budget or ContextBudget()
+        self._messages: List[Message] = []
+        self._tokens: List[int] = []
+        self._total = 0
+        self._pinned = 0
+        self._summary: Optional[Message] = None
+        self._dropped_requests: List[str] = []
+        self._dropped_count = 0
+
+    @property
+    def messages(self) -> List[Message]:
+        """Messages in the conversation, oldest first."""
+        return list(self._messages)
+
+    @property
+    def total_tokens(self) -> int:
+        """Estimated tokens of the whole conversation."""
+        return self._total
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def tokens_before(self, index: int) -> int:
+        """Estimated tokens of the messages before an index.
+
+        Args:
+            index: Message index
+
+        Returns:
+            Sum of the cached estimates of messages[:index]
+        """
+        return sum(self._tokens[:index])
+
+    def append(self, message: Message) -> None:
+        """Add a message, shortening oversized tool output.
+
+        Args:
+            message: Message to add
+        """
+        if message.role == "tool":
+            content = truncate_middle(message.content, self.budget.max_tool_output_tokens)
+            if content is not message.content:
+                message = Message(role=message.role, content=content,
+                                  images=message.images, tool_calls=message.tool_calls)
+        if message.role == "system" and self._pinned == len(self._messages):
+            self._pinned += 1
+        tokens = estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+        if message.images:
+            tokens += IMAGE_TOKENS * len(message.images)
+        self._messages.append(message)
+        self._tokens.append(tokens)
+        self._total += tokens
+
+    def fit(self) -> List[Message]:
+        """Compact the history if needed and return the messages to send.
+
+        Returns:
+            Messages that fit the budget
+        """
+        if self._total > self.budget.prompt_tokens:
+            self._compact()
+        return self.messages
+
+    def _compact(self) -> None:
+        """Replace the oldest turns with a summary."""
+        start = self._pinned
+        target = int(self.budget.prompt_tokens * self.budget.low_water_ratio)
+        target -= self.budget.summary_tokens
+        total = self._total
+        cut = start
+        # Never drop the latest message, it is what the model must answer
+        while cut < len(self._messages) - 1 and total > target:
+            total -= self._tokens[cut]
+            cut += 1
+        # Don't start the kept history with an orphaned tool result
+        while cut < len(self._messages) - 1 and self._messages[cut].role == "tool":
+            total -= self._tokens[cut]
+            cut += 1
+        if cut == start:
+            return
+
+        for message in self._messages[start:cut]:
+            if message is self._summary:
+                continue
+            self._dropped_count += 1
+            if message.role == "user" and message.content.strip():
+                self._dropped_requests.append(message.content.strip().splitlines()[0])
+
+        self._summary = Message(role="system", content=self._summarize())
+        summary_tokens = estimate_tokens(self._summary.content) + MESSAGE_OVERHEAD_TOKENS
+        self._messages[start:cut] = [self._summary]
+        self._tokens[start:cut] = [summary_tokens]
+        self._total = total + summary_tokens
+
+    def _summarize(self) -> str:
+        """Build a cheap extractive summary of everything dropped so far.
+
+        Lists the first line of the most recent dropped user requests that
+        fit the summary budget.
+        """
+        header = f"[{self._dropped_count} earlier messages were removed to fit the context window."
+        budget = self.budget.summary_tokens - estimate_tokens(header) - 8
+        requests: List[str] = []
+        for request in reversed(self._dropped_requests):
+            line = f"- {request[:SUMMARY_LINE_CHARS]}"
+            budget -= estimate_tokens(line) + 1
+            if budget < 0:
+                break
+            requests.append(line)
+        if not requests:
+            return header + "]"
+        requests.reverse()
+        return "\n".join([header, "Most recent earlier requests from the user:"] + requests) + "]"
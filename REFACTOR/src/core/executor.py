@@ -5,12 +5,19 @@ Command execution and tool handling for the LLM.
 import asyncio
 import json
 import os
+import time
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Any, Dict, List, Optional, Union, AsyncIterator
 from rich.console import Console
-from .sandbox import Sandbox, ExecResult
-from .llm import Message, ModelResponse, OllamaClient
-from .tools import ToolCall, registry
+from .sandbox import DEFAULT_COMMAND_TIMEOUT, ExecResult, OutputChunk, ResourceLimits, Sandbox
+from .config import DEFAULT_CONTEXT_SIZE
+from .context import ContextBudget, Conversation
+from .llm import Message, OllamaClient
+from .metrics import SessionMetrics
+from .prompt import PromptBuilder, build_system_prompt
+from .search import invalidate_all
+from .tools import ToolCallAssembler, ToolResult, ToolScheduler, registry, set_sandbox
 from .approvals import ApprovalPolicy, ApplyPatchCommand, CommandReview
 
 console = Console()
@@ -23,6 +30,32 @@ class ExecutionContext:
     writable_paths: List[str]
     approval_policy: Optional[ApprovalPolicy] = None
 
+async def _until(deadline: Optional[float], iterable: AsyncIterator) -> AsyncIterator:
+    """Iterate until a deadline.
+    
+    Args:
+        deadline: time.monotonic() by which iteration must end, or None
+        iterable: Async iterable to pass through
+        
+    Yields:
+        The items of the iterable
+        
+    Raises:
+        asyncio.TimeoutError: If the deadline passes first
+    """
+    if deadline is None:
+        async for item in iterable:
+            yield item
+        return
+    iterator = iterable.__aiter__()
+    while True:
+        try:
+            item = await asyncio.wait_for(iterator.__anext__(), deadline - time.monotonic())
+        except StopAsyncIteration:
+            return
+        yield item
+
+
 class CommandExecutor:
     """Handles command execution and tool calls from the LLM."""
 
@@ -31,7 +64,16 @@ class CommandExecutor:
         context: Optional[ExecutionContext] = None,
         approval_policy: Optional[ApprovalPolicy] = None,
         model: str = "qwen2.5-coder",
-        base_url: str = "http://localhost:11434/api"
+        base_url: str = "http://localhost:11434/api",
+        client: Optional[OllamaClient] = None,
+        context_size: int = DEFAULT_CONTEXT_SIZE,
+        instructions: str = "",
+        stats_path: Optional[str] = None,
+        max_tool_concurrency: int = 4,
+        max_iterations: int = 10,
+        command_timeout: Optional[float] = DEFAULT_COMMAND_TIMEOUT,
+        turn_timeout: Optional[float] = None,
+        limits: Optional[ResourceLimits] = None
     ):
         """Initialize executor.
 
@@ -40,6 +82,19 @@ class CommandExecutor:
             approval_policy: Optional approval policy
             model: Name of the Ollama model to use
             base_url: Base URL for the Ollama API
+            client: Session-scoped Ollama client. When omitted the executor
+                creates its own on first use and closes it in ``aclose``.
+            context_size: Context window of the model in tokens
+            instructions: User instructions and project documentation,
+                placed in the fixed system prompt
+            stats_path: File to append per-turn metrics to as JSONL
+            max_tool_concurrency: Maximum read-only tool calls run at once
+            max_iterations: Maximum model calls per message before the
+                agent loop stops, even if the model keeps calling tools
+            command_timeout: Wall-clock limit for each command in seconds
+            turn_timeout: Wall-clock limit for handling one message in
+                seconds, including model calls and the commands they run
+            limits: CPU and memory limits applied to commands
         """
         self.model = model
         self.base_url = base_url
@@ -49,8 +104,42 @@ class CommandExecutor:
             writable_paths=[str(Path().resolve())],
             approval_policy=approval_policy or ApprovalPolicy()
         )
-        self.sandbox = Sandbox(writable_paths=self.context.writable_paths)
-        self.client = OllamaClient()
+        self.command_timeout = command_timeout
+        self.turn_timeout = turn_timeout
+        self.limits = limits
+        self.sandbox = self._create_sandbox()
+        self._client = client
+        self._owns_client = client is None
+        self.conversation = Conversation(ContextBudget(context_size=context_size))
+        self.prompt = PromptBuilder(
+            self.conversation,
+            build_system_prompt(instructions, registry.descriptions())
+        )
+        self.metrics = SessionMetrics(model, jsonl_path=stats_path)
+        self.max_tool_concurrency = max_tool_concurrency
+        self.max_iterations = max_iterations
+
+    @property
+    def client(self) -> OllamaClient:
+        """Ollama client shared by every turn of the session."""
+        if self._client is None or self._client.is_closed:
+            self._client = OllamaClient(base_url=self.base_url)
+            self._owns_client = True
+        return self._client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Stop the shell session and close the Ollama client if the
+        executor created it."""
+        await self.sandbox.aclose()
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def execute_command(self, command: str) -> ExecResult:
         """Execute a command in the sandbox.
@@ -61,73 +150,186 @@ class CommandExecutor:
         Returns:
             ExecResult containing command output
         """
-        return await self.sandbox.exec(
-            command,
-            cwd=self.context.cwd,
-            env=self.context.env
-        )
+        try:
+            return await self.sandbox.exec(
+                command,
+                cwd=self.context.cwd,
+                env=self.context.env
+            )
+        finally:
+            # The command may have changed any file
+            invalidate_all()
         
-    def _parse_tool_calls(self, response: ModelResponse) -> Optional[List[ToolCall]]:
-        """Parse tool calls from response.
+    def _format_tool_result(self, result: ToolResult) -> str:
+        """Format a tool result for the model.
         
         Args:
-            response: Response from LLM
+            result: Result of a tool call
             
         Returns:
-            List of tool calls if present, None otherwise
+            Content of the tool message
         """
-        # Convert ModelResponse to dict format expected by ToolCall
-        response_dict = {
-            'message': {
-                'content': response.content,
-                'tool_calls': response.tool_calls
-            }
-        }
-        return ToolCall.from_response(response_dict)
+        if result.error is not None:
+            return f"Error executing tool {result.call.name}: {result.error}"
+        output = result.output
+        if isinstance(output, ExecResult):
+            parts = [f"exit code: {output.code}"]
+            if output.stdout:
+                parts.append(f"stdout:\n{output.stdout}")
+            if output.stderr:
+                parts.append(f"stderr:\n{output.stderr}")
+            if output.error:
+                parts.append(f"error: {output.error}")
+            return "\n".join(parts)
+        return str(output)
+        
+    async def process_message(self, message: str,
+                              images: Optional[List[str]] = None,
+                              stream_output: bool = False
+                              ) -> AsyncIterator[Union[str, OutputChunk, ExecResult]]:
+        """Process a message, running tools until the model is done.
         
-    async def process_message(self, message: str) -> AsyncIterator[Union[str, ExecResult]]:
-        """Process a message and execute any commands.
+        Each iteration streams a model response, runs the tool calls it
+        requested and feeds their results back with the ``tool`` role. The
+        loop ends when a response requests no tools, after
+        ``max_iterations`` model calls or when ``turn_timeout`` runs out;
+        commands still running then are killed.
         
         Args:
             message: User message to process
+            images: Paths of images to attach to the message
+            stream_output: Also yield the output of commands as OutputChunks
+                while they run, before their ExecResult
             
         Yields:
-            Either string responses or ExecResults from command execution
+            Either string fragments of the streamed response or ExecResults
+            from command execution, and OutputChunks if requested
         """
-        async with OllamaClient(base_url=self.base_url) as client:
-            messages = [Message(role="user", content=message)]
-            
-            async for response in client.generate(self.model, messages):
-                # Check for tool calls
-                tool_calls = self._parse_tool_calls(response)
+        self.conversation.append(Message(role="user", content=message, images=images or None))
+        timer = self.metrics.start_turn()
+        output: Optional[asyncio.Queue] = None
+        if stream_output:
+            output = asyncio.Queue()
+            self.sandbox.on_output = output.put_nowait
+        deadline = None
+        if self.turn_timeout is not None:
+            deadline = time.monotonic() + self.turn_timeout
+            # Commands get at most the time left in the turn
+            self.sandbox.deadline = deadline
+        scheduler = None
+        text = ""
+        
+        try:
+            for _ in range(self.max_iterations):
+                messages = self.prompt.build()
+                scheduler = ToolScheduler(registry, self.max_tool_concurrency)
+                assembler = ToolCallAssembler()
+                text = ""
+                started = time.perf_counter()
                 
-                if tool_calls:
-                    for tool in tool_calls:
-                        try:
-                            # Execute tool
-                            result = await registry.execute(tool)
-                            
-                            if isinstance(result, ExecResult):
-                                yield result
-                            
-                            # Add result to conversation
-                            messages.append(Message(
-                                role="assistant",
-                                content=f"Tool {tool.name} output: {result}"
-                            ))
-                        except Exception as e:
-                            messages.append(Message(
-                                role="assistant",
-                                content=f"Error executing tool {tool.name}: {e}"
-                            ))
-                            
-                # Always yield the response content
-                if response.content:
-                    yield response.content
-                    
-                if response.done:
-                    break
+                async for response in _until(deadline, self.client.generate(
+                    self.model,
+                    messages,
+                    delta=True,
+                    num_ctx=self.conversation.budget.context_size,
+                    tools=registry.schemas()
+                )):
+                    # Start each tool call as soon as it is complete, it runs
+                    # while the rest of the response streams
+                    for tool in assembler.feed(response.tool_calls):
+                        timer.first_token()
+                        scheduler.submit(tool)
+                                
+                    # Yield only the new fragment; the CLI renders incrementally
+                    if response.content:
+                        timer.first_token()
+                        yield response.content
+                    text = response.text
+                        
+                    if response.done:
+                        self.prompt.record(response.stats)
+                        if response.stats:
+                            timer.metrics.add_stats(response.stats)
+                        break
+                        
+                for tool in assembler.finish():
+                    scheduler.submit(tool)
+                generated = time.perf_counter()
+                self.conversation.append(Message(
+                    role="assistant",
+                    content=text,
+                    tool_calls=[call.to_dict() for call in assembler.calls] or None
+                ))
+                calls = len(scheduler)
+                # Already in the conversation if the turn times out from here
+                text = ""
+                if not calls:
+                    timer.record_iteration(generated - started)
+                    return
                     
+                # Feed results back in the order the model asked for them
+                async for result in _until(deadline, self._tool_results(scheduler, output)):
+                    if isinstance(result, OutputChunk):
+                        yield result
+                        continue
+                    if isinstance(result.output, ExecResult):
+                        yield result.output
+                    self.conversation.append(Message(
+                        role="tool",
+                        content=self._format_tool_result(result)
+                    ))
+                timer.record_iteration(
+                    generated - started,
+                    time.perf_counter() - generated,
+                    calls
+                )
+                
+            yield f"\n\n*Stopped after {self.max_iterations} model calls.*"
+        except asyncio.TimeoutError:
+            if text:
+                # Keep what the model said before it was cut off
+                self.conversation.append(Message(role="assistant", content=text))
+            yield f"\n\n*Stopped after the turn's time limit of {self.turn_timeout:g}s.*"
+        finally:
+            if scheduler is not None:
+                scheduler.cancel()
+            self.sandbox.on_output = None
+            self.sandbox.deadline = None
+            self.metrics.finish_turn(timer)
+            
+    async def _tool_results(self, scheduler: ToolScheduler,
+                            output: Optional[asyncio.Queue]
+                            ) -> AsyncIterator[Union[OutputChunk, ToolResult]]:
+        """Wait for tool results, passing on command output meanwhile.
+        
+        Args:
+            scheduler: Scheduler the calls were submitted to
+            output: Queue the sandbox puts OutputChunks into, if any
+            
+        Yields:
+            OutputChunks as they arrive and ToolResults in submission order;
+            a command's output always comes before its result
+        """
+        results = scheduler.results()
+        try:
+            while True:
+                next_result = asyncio.ensure_future(results.__anext__())
+                while output is not None and not next_result.done():
+                    chunk = asyncio.ensure_future(output.get())
+                    await asyncio.wait([next_result, chunk], return_when=asyncio.FIRST_COMPLETED)
+                    if chunk.done():
+                        yield chunk.result()
+                    else:
+                        chunk.cancel()
+                while output is not None and not output.empty():
+                    yield output.get_nowait()
+                try:
+                    yield await next_result
+                except StopAsyncIteration:
+                    return
+        finally:
+            await results.aclose()
+                
     def update_context(self, 
                       cwd: Optional[str] = None,
                       env: Optional[Dict[str, str]] = None,
@@ -145,4 +347,18 @@ class CommandExecutor:
             self.context.env.update(env)
         if writable_paths:
             self.context.writable_paths = writable_paths
-            self.sandbox = Sandbox(writable_paths=writable_paths)
+        if env or writable_paths:
+            # The shell session was started with the old settings
+            self.sandbox.close()
+            self.sandbox = self._create_sandbox()
+            
+    def _create_sandbox(self) -> Sandbox:
+        """Create the sandbox commands and the shell tool run in."""
+        sandbox = Sandbox(
+            writable_paths=self.context.writable_paths,
+            persistent=True,
+            timeout=self.command_timeout,
+            limits=self.limits
+        )
+        set_sandbox(sandbox)
+        return sandbox
@@ -0,0 +1,189 @@
+"""
+Session-wide cache of file contents for the read, search and patch tools.
+Entries are keyed by path and validated against the file's mtime, size
+and inode, so a repeated read of an unchanged file costs one stat.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# Total bytes of cached contents, decoded text included
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+# Larger files are read without being cached
+MAX_CACHED_FILE_BYTES = 4 * 1024 * 1024
+
+
+@dataclass
+class _Entry:
+    """Cached contents of one file version."""
+    version: Tuple[int, int, int]
+    data: bytes
+    text: Optional[str] = None
+
+    @property
+    def cost(self) -> int:
+        """Bytes the entry counts against the budget."""
+        return len(self.data) + (len(self.text) if self.text is not None else 0)
+
+
+def _version(st: os.stat_result) -> Tuple[int, int, int]:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class FileContentCache:
+    """LRU cache of file contents within a byte budget.
+
+    A file is served from the cache while its mtime, size and inode match
+    the cached version. Writes through the patch tool drop their entries
+    right away; changes made any other way are caught by the stat.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES,
+                 max_file_bytes: int = MAX_CACHED_FILE_BYTES):
+        """Initialize the cache.
+
+        Args:
+            max_bytes: Budget for all cached contents
+            max_file_bytes: Largest file to cache
+        """
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, path: str, st: os.stat_result) -> Optional[_Entry]:
+        """Get the cached entry of a file version, counting the hit or miss."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.version == _version(st):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def _store(self, path: str, entry: _Entry) -> None:
+        """Add or replace an entry and evict down to the budget."""
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._size -= old.cost
+            if len(entry.data) > self.max_file_bytes:
+                return
+            self._entries[path] = entry
+            self._size += entry.cost
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.cost
+
+    def load(self, path: str, store: bool = True,
+             st: Optional[os.stat_result] = None) -> Tuple[os.stat_result, bytes]:
+        """Read a file's contents along with the stat they belong to.
+
+        Args:
+            path: Path to the file
+            store: Whether to cache the contents on a miss; scans of many
+                files pass False so they don't evict the hot ones
+            st: The file's stat, if the caller just took it
+
+        Returns:
+            The file's stat and contents
+
+        Raises:
+            OSError: If the file can't be read
+        """
+        path = os.path.abspath(path)
+        # A hit costs only the stat
+        if st is None:
+            st = os.stat(path)
+        entry = self._lookup(path, st)
+        if entry is not None:
+            return st, entry.data
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        # A file growing while read isn't the version the stat describes
+        if store and len(data) == st.st_size:
+            self._store(path, _Entry(_version(st), data))
+        return st, data
+
+    def read_bytes(self, path: str, store: bool = True) -> bytes:
+        """Read a file's contents.
+
+        Args:
+            path: Path to the file
+            store: Whether to cache the contents on a miss
+
+        Returns:
+            The contents
+
+        Raises:
+            OSError: If the file can't be read
+        """
+        return self.load(path, store)[1]
+
+    def read_text(self, path: str) -> str:
+        """Read a file as text, like open() in text mode does.
+
+        The contents are decoded as UTF-8 with any CRLF or CR newlines
+        translated to LF, and the text is cached along with the bytes.
+
+        Args:
+            path: Path to the file
+
+        Returns:
+            The text
+
+        Raises:
+            OSError: If the file can't be read
+            UnicodeDecodeError: If the file isn't valid UTF-8
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self._lookup(path, st)
+        if entry is None:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                entry = _Entry(_version(st), f.read())
+        if entry.text is None:
+            text = entry.data.decode("utf-8")
+            if "\r" in text:
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            # A new entry, since the cached one's cost is on the budget
+            entry = _Entry(entry.version, entry.data, text)
+            if len(entry.data) == st.st_size:
+                self._store(path, entry)
+        return entry.text
+
+    def invalidate(self, path: str) -> None:
+        """Drop a file's entry, after writing or removing it.
+
+        Args:
+            path: Path to the file
+        """
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._size -= entry.cost
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get the hit and miss counters and the cache's size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "files": len(self._entries), "bytes": self._size}
+
+
+# Shared by the tools for the whole session
+default_file_cache = FileContentCache()
@@ -0,0 +1,105 @@
+"""
+Image encoding for multimodal messages.
+Images are sent base64-encoded through Ollama's ``images`` field, encoded
+once per file version and optionally downscaled first.
+"""
+
+import base64
+import io
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, images are then sent as-is
+    Image = None
+
+# Vision models tile or resize large inputs anyway; sending more pixels
+# only costs bandwidth and encoding time.
+DEFAULT_MAX_IMAGE_SIZE = 1344
+
+# Multiple of 3 so every block encodes without padding
+ENCODE_BLOCK_SIZE = 3 * 64 * 1024
+
+
+class ImageEncoder:
+    """Base64 image encoder with a cache keyed by path, mtime and size."""
+
+    def __init__(self, max_size: Optional[int] = DEFAULT_MAX_IMAGE_SIZE):
+        """Initialize the encoder.
+
+        Args:
+            max_size: Longest side in pixels; larger images are downscaled
+                when Pillow is installed. None disables downscaling.
+        """
+        self.max_size = max_size
+        self._cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, path: str) -> str:
+        """Get the base64 encoding of an image file.
+
+        Args:
+            path: Path to the image
+
+        Returns:
+            Base64-encoded image data
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        encoded = self._downscaled(path) or self._encode_file(path)
+        with self._lock:
+            self._cache[path] = (version, encoded)
+        return encoded
+
+    def encode_all(self, paths: List[str]) -> List[str]:
+        """Encode several images.
+
+        Args:
+            paths: Paths to the images
+
+        Returns:
+            Base64-encoded images in the same order
+        """
+        return [self.encode(path) for path in paths]
+
+    def _encode_file(self, path: str) -> str:
+        """Encode a file block by block without holding all its bytes."""
+        parts = []
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(ENCODE_BLOCK_SIZE)
+                if not block:
+                    break
+                parts.append(base64.b64encode(block).decode("ascii"))
+        return "".join(parts)
+
+    def _downscaled(self, path: str) -> Optional[str]:
+        """Encode a downscaled copy if the image is larger than max_size."""
+        if Image is None or not self.max_size:
+            return None
+        try:
+            with Image.open(path) as image:
+                if max(image.size) <= self.max_size:
+                    return None
+                image_format = image.format or "PNG"
+                image.thumbnail((self.max_size, self.max_size))
+                if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                buffer = io.BytesIO()
+                image.save(buffer, format=image_format)
+        except Exception:
+            # Unknown format or broken file, let the model see the original
+            return None
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+# Shared by all messages so repeated references to a file are encoded once
+default_encoder = ImageEncoder()
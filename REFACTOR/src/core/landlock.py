@@ -0,0 +1,193 @@
+"""
+Minimal Landlock bindings for confining commands on Linux.
+Landlock lets an unprivileged process restrict its own file system access;
+the restriction is inherited by everything it starts and cannot be lifted.
+"""
+
+import ctypes
+import os
+import sys
+# Run as a script before every confined command, so it avoids importing
+# typing, which would take longer than the rest of its startup
+from collections.abc import Iterable
+
+# Generic syscall numbers, the same on x86_64 and arm64
+_SYS_CREATE_RULESET = 444
+_SYS_ADD_RULE = 445
+_SYS_RESTRICT_SELF = 446
+
+_CREATE_RULESET_VERSION = 1 << 0
+_RULE_PATH_BENEATH = 1
+_PR_SET_NO_NEW_PRIVS = 38
+
+ACCESS_FS_WRITE_FILE = 1 << 1
+ACCESS_FS_REMOVE_DIR = 1 << 4
+ACCESS_FS_REMOVE_FILE = 1 << 5
+ACCESS_FS_MAKE_CHAR = 1 << 6
+ACCESS_FS_MAKE_DIR = 1 << 7
+ACCESS_FS_MAKE_REG = 1 << 8
+ACCESS_FS_MAKE_SOCK = 1 << 9
+ACCESS_FS_MAKE_FIFO = 1 << 10
+ACCESS_FS_MAKE_BLOCK = 1 << 11
+ACCESS_FS_MAKE_SYM = 1 << 12
+ACCESS_FS_REFER = 1 << 13  # ABI 2
+ACCESS_FS_TRUNCATE = 1 << 14  # ABI 3
+
+# Rights that modify the file system; reading and executing stay allowed
+_WRITE_ACCESS = (
+    ACCESS_FS_WRITE_FILE | ACCESS_FS_REMOVE_DIR | ACCESS_FS_REMOVE_FILE
+    | ACCESS_FS_MAKE_CHAR | ACCESS_FS_MAKE_DIR | ACCESS_FS_MAKE_REG
+    | ACCESS_FS_MAKE_SOCK | ACCESS_FS_MAKE_FIFO | ACCESS_FS_MAKE_BLOCK
+    | ACCESS_FS_MAKE_SYM
+)
+# Rights that may be granted on a file rather than a directory
+_FILE_ACCESS = ACCESS_FS_WRITE_FILE | ACCESS_FS_TRUNCATE
+
+# Writable for every command, like the seatbelt profile
+DEFAULT_WRITABLE_DIRS = ("/tmp", "/var/tmp", "/dev/shm")
+DEFAULT_WRITABLE_FILES = ("/dev/null", "/dev/zero", "/dev/tty")
+
+
+class _RulesetAttr(ctypes.Structure):
+    _fields_ = [("handled_access_fs", ctypes.c_uint64)]
+
+
+class _PathBeneathAttr(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [("allowed_access", ctypes.c_uint64), ("parent_fd", ctypes.c_int32)]
+
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _syscall = _libc.syscall
+    _prctl = _libc.prctl
+except (OSError, AttributeError):  # Not a glibc/musl system
+    _syscall = _prctl = None
+
+
+def abi_version() -> int:
+    """Get the Landlock ABI version of the running kernel.
+
+    Returns:
+        The version, or 0 if Landlock is unsupported or disabled
+    """
+    if _syscall is None or not os.uname().sysname == "Linux":
+        return 0
+    version = _syscall(_SYS_CREATE_RULESET, None, ctypes.c_size_t(0),
+                       ctypes.c_uint32(_CREATE_RULESET_VERSION))
+    return max(version, 0)
+
+
+def restrict_self(ruleset_fd: int) -> None:
+    """Confine the calling process and its future children.
+
+    Args:
+        ruleset_fd: Descriptor of the ruleset to apply
+
+    Raises:
+        OSError: If the restriction cannot be applied
+    """
+    _check(_prctl(_PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), "set no_new_privs")
+    _check(_syscall(_SYS_RESTRICT_SELF, ruleset_fd, ctypes.c_uint32(0)), "restrict self")
+
+
+def _check(result: int, action: str) -> int:
+    if result < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"Landlock: {action} failed: {os.strerror(errno)}")
+    return result
+
+
+class WriteRuleset:
+    """A Landlock ruleset that only allows writing beneath given paths.
+
+    The ruleset is built once in the parent; a child applies it with two
+    system calls before running the command.
+    """
+
+    def __init__(self, writable_paths: Iterable[str], abi: int | None = None):
+        """Build the ruleset.
+
+        Args:
+            writable_paths: Directories and files that stay writable
+            abi: Landlock ABI version, detected if omitted
+
+        Raises:
+            OSError: If Landlock is unavailable or a rule cannot be added
+        """
+        abi = abi_version() if abi is None else abi
+        if abi < 1:
+            raise OSError("Landlock is not supported by this kernel")
+        self.handled = _WRITE_ACCESS
+        if abi >= 2:
+            self.handled |= ACCESS_FS_REFER
+        if abi >= 3:
+            self.handled |= ACCESS_FS_TRUNCATE
+        attr = _RulesetAttr(self.handled)
+        self.fd = _check(_syscall(_SYS_CREATE_RULESET, ctypes.byref(attr),
+                                  ctypes.c_size_t(ctypes.sizeof(attr)), ctypes.c_uint32(0)),
+                         "create ruleset")
+        try:
+            for path in list(writable_paths) + list(DEFAULT_WRITABLE_DIRS) + list(DEFAULT_WRITABLE_FILES):
+                self._allow(path)
+        except OSError:
+            self.close()
+            raise
+
+    def _allow(self, path: str) -> None:
+        """Allow writing beneath a path; missing paths are skipped."""
+        try:
+            fd = os.open(path, os.O_PATH | os.O_CLOEXEC)
+        except FileNotFoundError:
+            return
+        try:
+            access = self.handled if os.path.isdir(path) else self.handled & _FILE_ACCESS
+            rule = _PathBeneathAttr(access, fd)
+            _check(_syscall(_SYS_ADD_RULE, self.fd, _RULE_PATH_BENEATH,
+                            ctypes.byref(rule), ctypes.c_uint32(0)),
+                   f"add rule for {path}")
+        finally:
+            os.close(fd)
+
+    def command_prefix(self) -> list[str]:
+        """Command line prefix running a command confined by the ruleset.
+
+        The prefix runs this module, which confines itself with the
+        ruleset and then execs the command. The ruleset's descriptor must
+        be passed to the child, e.g. with ``pass_fds``.
+
+        Confining the child between fork and exec instead, as a
+        ``preexec_fn``, isn't safe in a process that runs other threads.
+
+        Returns:
+            The prefix
+        """
+        # Isolated and without site, since only the standard library is needed
+        return [sys.executable, "-I", "-S", os.path.abspath(__file__), str(self.fd)]
+
+    def close(self) -> None:
+        """Release the ruleset."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def main(argv: list[str]) -> None:
+    """Confine this process with an inherited ruleset and exec a command.
+
+    Args:
+        argv: The ruleset's descriptor followed by the command line
+    """
+    if len(argv) < 2:
+        sys.exit("usage: landlock.py RULESET_FD COMMAND [ARG...]")
+    fd = int(argv[0])
+    try:
+        restrict_self(fd)
+        os.close(fd)
+        os.execvp(argv[1], argv[1:])
+    except OSError as e:
+        sys.exit(f"{argv[1]}: {e}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
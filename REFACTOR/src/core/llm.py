@@ -3,52 +3,242 @@ Core LLM functionality using Ollama as the backend.
 Handles model interaction, streaming, and response processing.
 """
 
-import json
-from typing import AsyncIterator, Dict, List, Optional, Union
+import socket
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
 import httpx
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from .images import default_encoder
+from ..utils import fastjson
 
-@dataclass
+class StreamBuffer:
+    """Append-only buffer of streamed text fragments.
+
+    Fragments are kept as a list and only joined when the accumulated text is
+    requested; the joined result is cached until the next append, so consumers
+    that only look at deltas never pay for copying the whole response.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0
+
+    def append(self, fragment: str) -> None:
+        """Append a fragment to the buffer.
+
+        Args:
+            fragment: Newly streamed text
+        """
+        if fragment:
+            self._chunks.append(fragment)
+            self._length += len(fragment)
+
+    @property
+    def text(self) -> str:
+        """Full text accumulated so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def __len__(self) -> int:
+        return self._length
+
+@dataclass(slots=True)
 class Message:
     """Represents a message in the conversation."""
     role: str
     content: str
     images: Optional[List[str]] = None
     tool_calls: Optional[List[Dict]] = None
+    _formatted: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
 
-@dataclass
+    def to_dict(self) -> Dict:
+        """Format the message for the Ollama API.
+        
+        The result is cached, so a message re-sent on every turn is
+        formatted once and serializes to the same bytes each time.
+        """
+        if self._formatted is None:
+            formatted = {"role": self.role, "content": self.content}
+            if self.images:
+                formatted["images"] = default_encoder.encode_all(self.images)
+            if self.tool_calls:
+                formatted["tool_calls"] = self.tool_calls
+            self._formatted = formatted
+        return self._formatted
+
+@dataclass(slots=True)
+class GenerationStats:
+    """Statistics Ollama reports in the final chunk of a response.
+    
+    Durations are in nanoseconds.
+    """
+    total_duration: Optional[int] = None
+    load_duration: Optional[int] = None
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_duration: Optional[int] = None
+    eval_count: Optional[int] = None
+    eval_duration: Optional[int] = None
+
+    @classmethod
+    def from_chunk(cls, chunk: Dict) -> "GenerationStats":
+        """Extract statistics from a final (done) chunk."""
+        return cls(
+            total_duration=chunk.get("total_duration"),
+            load_duration=chunk.get("load_duration"),
+            prompt_eval_count=chunk.get("prompt_eval_count"),
+            prompt_eval_duration=chunk.get("prompt_eval_duration"),
+            eval_count=chunk.get("eval_count"),
+            eval_duration=chunk.get("eval_duration")
+        )
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Generation throughput."""
+        if not self.eval_count or not self.eval_duration:
+            return None
+        return self.eval_count / (self.eval_duration / 1e9)
+
+    @property
+    def prompt_tokens_per_second(self) -> Optional[float]:
+        """Prompt evaluation throughput."""
+        if not self.prompt_eval_count or not self.prompt_eval_duration:
+            return None
+        return self.prompt_eval_count / (self.prompt_eval_duration / 1e9)
+
+@dataclass(slots=True)
 class ModelResponse:
     """Represents a response from the model."""
     content: str
     tool_calls: Optional[List[Dict]] = None
     done: bool = False
+    buffer: Optional[StreamBuffer] = field(default=None, repr=False, compare=False)
+    stats: Optional[GenerationStats] = None
+
+    @property
+    def text(self) -> str:
+        """Full text generated so far.
+
+        In delta mode ``content`` only holds the newest fragment and the
+        accumulated text is joined lazily from the shared stream buffer.
+        """
+        if self.buffer is None:
+            return self.content
+        return self.buffer.text
+
+class ChatChunk:
+    """One decoded line of the /api/chat NDJSON stream."""
+    __slots__ = ("content", "tool_calls", "done", "error")
+
+    def __init__(self, content: str = "", tool_calls: Optional[List[Dict]] = None,
+                 done: bool = False, error: Optional[str] = None):
+        self.content = content
+        self.tool_calls = tool_calls
+        self.done = done
+        self.error = error
+
+    @classmethod
+    def from_dict(cls, chunk: Dict) -> "ChatChunk":
+        """Build a chunk from a decoded JSON object."""
+        message = chunk.get("message")
+        if message is not None:
+            content = message.get("content") or ""
+            # Ollama puts tool calls inside the message
+            tool_calls = message.get("tool_calls") or chunk.get("tool_calls")
+        else:
+            content = chunk.get("content") or ""
+            tool_calls = chunk.get("tool_calls")
+        return cls(
+            content=content,
+            tool_calls=tool_calls,
+            done=chunk.get("done", False),
+            error=chunk.get("error")
+        )
+
+async def _iter_lines(response: httpx.Response) -> AsyncIterator[bytes]:
+    """Split a streamed response into raw lines without decoding to str."""
+    pending = b""
+    async for data in response.aiter_bytes():
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+# Interactive turns are usually further apart than httpx's default 5s
+# keep-alive expiry, so keep idle connections around for the whole session.
+DEFAULT_POOL_LIMITS = httpx.Limits(
+    max_connections=4,
+    max_keepalive_connections=4,
+    keepalive_expiry=300.0
+)
+
+# Requests are small writes on a reused connection; don't let Nagle hold them.
+SOCKET_OPTIONS = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
 
 class OllamaClient:
-    """Client for interacting with Ollama API."""
+    """Client for interacting with Ollama API.
+    
+    One client is meant to be shared for a whole session so that consecutive
+    turns and tool round-trips reuse the same pooled keep-alive connection.
+    """
     
-    def __init__(self, base_url: str = "http://localhost:11434/api", timeout: int = 60):
+    def __init__(self,
+                 base_url: str = "http://localhost:11434/api",
+                 timeout: int = 60,
+                 limits: Optional[httpx.Limits] = None,
+                 http_client: Optional[httpx.AsyncClient] = None,
+                 keep_alive: Union[str, int, None] = None):
         """Initialize the Ollama client.
         
         Args:
             base_url: Base URL for the Ollama API
             timeout: Request timeout in seconds
+            limits: Connection pool limits (defaults to DEFAULT_POOL_LIMITS)
+            http_client: Existing HTTP client to use. It is not closed by
+                this client, its owner remains responsible for it.
+            keep_alive: How long Ollama keeps the model loaded after each
+                request (e.g. "30m", seconds, or -1 for forever). Sent with
+                every chat request; None leaves Ollama's default.
         """
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
-        self._client = httpx.AsyncClient(timeout=timeout)
+        self.keep_alive = keep_alive
+        self._owns_client = http_client is None
+        self._client = http_client or httpx.AsyncClient(
+            timeout=timeout,
+            transport=httpx.AsyncHTTPTransport(
+                limits=limits or DEFAULT_POOL_LIMITS,
+                socket_options=SOCKET_OPTIONS
+            )
+        )
         
     async def __aenter__(self):
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self._client.aclose()
+        await self.aclose()
+
+    @property
+    def is_closed(self) -> bool:
+        """Whether the underlying HTTP client has been closed."""
+        return self._client.is_closed
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client if this client owns it."""
+        if self._owns_client and not self._client.is_closed:
+            await self._client.aclose()
 
     async def generate(self, 
                       model: str,
                       messages: List[Message],
                       stream: bool = True,
                       temperature: float = 0.7,
-                      max_tokens: Optional[int] = None) -> AsyncIterator[ModelResponse]:
+                      max_tokens: Optional[int] = None,
+                      delta: bool = False,
+                      num_ctx: Optional[int] = None,
+                      tools: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[ModelResponse]:
         """Generate responses from the model.
         
         Args:
@@ -57,26 +247,19 @@ class OllamaClient:
             stream: Whether to stream the response
             temperature: Sampling temperature (0.0 to 1.0)
             max_tokens: Maximum tokens to generate
+            delta: Yield only the newly generated fragment in ``content``
+                instead of the whole accumulated text. The accumulated text
+                stays available through ``ModelResponse.text``.
+            num_ctx: Context window size. Without it Ollama falls back to
+                its small default and silently truncates longer prompts.
+            tools: Tool schemas the model may call, in Ollama's ``tools``
+                format (see ``ToolRegistry.schemas``)
             
         Yields:
             ModelResponse objects containing generated content
         """
         # Convert messages to Ollama format
-        formatted_messages = []
-        for msg in messages:
-            content = msg.content
-            # Handle images if present
-            if msg.images:
-                content = f"{content}\n"
-                for img in msg.images:
-                    with open(img, 'rb') as f:
-                        img_data = f.read()
-                        content += f"\n<img>{img_data}</img>"
-            
-            formatted_messages.append({
-                "role": msg.role,
-                "content": content
-            })
+        formatted_messages = [msg.to_dict() for msg in messages]
         
         # Prepare the request
         url = f"{self.base_url}/chat"
@@ -90,49 +273,78 @@ class OllamaClient:
         }
         if max_tokens:
             data["options"]["num_predict"] = max_tokens
+        if num_ctx:
+            data["options"]["num_ctx"] = num_ctx
+        if tools:
+            data["tools"] = tools
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
             
         # Make the request
-        async with self._client.stream("POST", url, json=data) as response:
+        async with self._client.stream(
+            "POST",
+            url,
+            content=fastjson.dumps(data),
+            headers={"Content-Type": "application/json"}
+        ) as response:
             response.raise_for_status()
-            current_content = ""
+            buffer = StreamBuffer()
+            loads = fastjson.loads
+            decode_error = fastjson.DecodeError
             
-            async for line in response.aiter_lines():
+            async for line in _iter_lines(response):
                 if not line.strip():
                     continue
                     
                 try:
-                    chunk = json.loads(line)
-                    if "error" in chunk:
-                        raise ValueError(f"Ollama error: {chunk['error']}")
-                        
-                    # Extract content
-                    if "message" in chunk:
-                        content = chunk["message"].get("content", "")
-                    else:
-                        content = chunk.get("content", "")
-                        
-                    current_content += content
+                    raw = loads(line)
+                except decode_error:
+                    continue
                     
-                    # Check for tool calls in the response
-                    tool_calls = None
-                    if "tool_calls" in chunk:
-                        tool_calls = chunk["tool_calls"]
+                chunk = ChatChunk.from_dict(raw)
+                if chunk.error is not None:
+                    raise ValueError(f"Ollama error: {chunk.error}")
                     
-                    # Yield the response
-                    yield ModelResponse(
-                        content=current_content,
-                        tool_calls=tool_calls,
-                        done=chunk.get("done", False)
-                    )
+                buffer.append(chunk.content)
+                
+                # Yield the response
+                yield ModelResponse(
+                    content=chunk.content if delta else buffer.text,
+                    tool_calls=chunk.tool_calls,
+                    done=chunk.done,
+                    buffer=buffer,
+                    stats=GenerationStats.from_chunk(raw) if chunk.done else None
+                )
                     
-                except json.JSONDecodeError:
-                    continue
+    async def warm_up(self, model: str) -> float:
+        """Preload a model so the first real request skips the load cost.
+        
+        Ollama loads the model and returns without generating anything when
+        it receives a chat request with no messages.
+        
+        Args:
+            model: Name of the Ollama model to load
+            
+        Returns:
+            Seconds spent waiting for the model to load
+        """
+        data = {"model": model, "messages": [], "stream": False}
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+        start = time.perf_counter()
+        # Loading a large model from disk can take longer than a normal read
+        response = await self._client.post(
+            f"{self.base_url}/chat",
+            json=data,
+            timeout=httpx.Timeout(self.timeout, read=None)
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start
                     
     async def get_model_list(self) -> List[str]:
         """Get list of available models from Ollama."""
         url = f"{self.base_url}/tags"
-        async with self._client as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            return [model["name"] for model in data.get("models", [])]
+        response = await self._client.get(url)
+        response.raise_for_status()
+        data = response.json()
+        return [model["name"] for model in data.get("models", [])]
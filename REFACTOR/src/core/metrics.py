@@ -0,0 +1,197 @@
+"""
+Per-turn and per-session latency and throughput metrics.
+Combines client-side timings with the statistics Ollama reports in the
+final chunk of each response.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+from .llm import GenerationStats
+
+
+def _add(total: Optional[int], value: Optional[int]) -> Optional[int]:
+    if value is None:
+        return total
+    return (total or 0) + value
+
+
+@dataclass
+class IterationMetrics:
+    """Timing of one model call and the tool calls it requested."""
+    iteration: int
+    generate_time: float
+    tool_time: float = 0.0
+    tool_calls: int = 0
+
+
+@dataclass
+class TurnMetrics:
+    """Metrics for a single turn.
+
+    A turn may issue several generate requests; Ollama's counters are summed
+    over all of them. Client-side times are in seconds, Ollama's durations
+    in nanoseconds.
+    """
+    turn: int
+    model: str
+    started_at: float = field(default_factory=time.time)
+    wall_time: Optional[float] = None
+    time_to_first_token: Optional[float] = None
+    requests: int = 0
+    total_duration: Optional[int] = None
+    load_duration: Optional[int] = None
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_duration: Optional[int] = None
+    eval_count: Optional[int] = None
+    eval_duration: Optional[int] = None
+    iterations: List[IterationMetrics] = field(default_factory=list)
+
+    def add_stats(self, stats: GenerationStats) -> None:
+        """Add the statistics of one generate request.
+
+        Args:
+            stats: Statistics from the final chunk
+        """
+        self.requests += 1
+        self.total_duration = _add(self.total_duration, stats.total_duration)
+        self.load_duration = _add(self.load_duration, stats.load_duration)
+        self.prompt_eval_count = _add(self.prompt_eval_count, stats.prompt_eval_count)
+        self.prompt_eval_duration = _add(self.prompt_eval_duration, stats.prompt_eval_duration)
+        self.eval_count = _add(self.eval_count, stats.eval_count)
+        self.eval_duration = _add(self.eval_duration, stats.eval_duration)
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Generation throughput reported by Ollama."""
+        return GenerationStats(eval_count=self.eval_count,
+                               eval_duration=self.eval_duration).tokens_per_second
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the metrics as a JSON-serializable dict."""
+        data = asdict(self)
+        data["tokens_per_second"] = self.tokens_per_second
+        return data
+
+
+class TurnTimer:
+    """Measures client-side timings of a turn while it streams."""
+
+    def __init__(self, metrics: TurnMetrics):
+        self.metrics = metrics
+        self._start = time.perf_counter()
+
+    def first_token(self) -> None:
+        """Mark the arrival of output; only the first call counts."""
+        if self.metrics.time_to_first_token is None:
+            self.metrics.time_to_first_token = time.perf_counter() - self._start
+
+    def record_iteration(self, generate_time: float, tool_time: float = 0.0,
+                         tool_calls: int = 0) -> IterationMetrics:
+        """Record one iteration of the agent loop.
+
+        Args:
+            generate_time: Seconds spent streaming the model's response
+            tool_time: Seconds spent waiting for tool results afterwards
+            tool_calls: Number of tool calls requested
+
+        Returns:
+            The iteration's metrics
+        """
+        iteration = IterationMetrics(
+            iteration=len(self.metrics.iterations) + 1,
+            generate_time=generate_time,
+            tool_time=tool_time,
+            tool_calls=tool_calls
+        )
+        self.metrics.iterations.append(iteration)
+        return iteration
+
+    def stop(self) -> TurnMetrics:
+        """Stop the timer and return the turn's metrics."""
+        self.metrics.wall_time = time.perf_counter() - self._start
+        return self.metrics
+
+
+class SessionMetrics:
+    """Collects turn metrics for a session and optionally writes JSONL."""
+
+    def __init__(self, model: str, jsonl_path: Optional[str] = None):
+        """Initialize session metrics.
+
+        Args:
+            model: Model used for the session
+            jsonl_path: File to append one JSON line per finished turn to
+        """
+        self.model = model
+        self.jsonl_path = jsonl_path
+        self.turns: List[TurnMetrics] = []
+
+    def start_turn(self) -> TurnTimer:
+        """Start measuring a new turn."""
+        return TurnTimer(TurnMetrics(turn=len(self.turns) + 1, model=self.model))
+
+    def finish_turn(self, timer: TurnTimer) -> TurnMetrics:
+        """Record a finished turn.
+
+        Args:
+            timer: Timer returned by start_turn
+
+        Returns:
+            The turn's metrics
+        """
+        metrics = timer.stop()
+        self.turns.append(metrics)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a") as f:
+                f.write(json.dumps(metrics.to_dict()) + "\n")
+        return metrics
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate metrics over the session."""
+        ttfts = [t.time_to_first_token for t in self.turns if t.time_to_first_token is not None]
+        total = TurnMetrics(turn=len(self.turns), model=self.model)
+        for turn in self.turns:
+            total.add_stats(GenerationStats(
+                total_duration=turn.total_duration,
+                load_duration=turn.load_duration,
+                prompt_eval_count=turn.prompt_eval_count,
+                prompt_eval_duration=turn.prompt_eval_duration,
+                eval_count=turn.eval_count,
+                eval_duration=turn.eval_duration
+            ))
+        return {
+            "model": self.model,
+            "turns": len(self.turns),
+            "wall_time": sum(t.wall_time or 0 for t in self.turns),
+            "iterations": sum(len(t.iterations) for t in self.turns),
+            "tool_calls": sum(i.tool_calls for t in self.turns for i in t.iterations),
+            "mean_time_to_first_token": sum(ttfts) / len(ttfts) if ttfts else None,
+            "max_time_to_first_token": max(ttfts) if ttfts else None,
+            "prompt_eval_count": total.prompt_eval_count,
+            "prompt_eval_duration": total.prompt_eval_duration,
+            "eval_count": total.eval_count,
+            "load_duration": total.load_duration,
+            "tokens_per_second": total.tokens_per_second,
+        }
+
+    def format_summary(self) -> str:
+        """Human-readable session summary."""
+        summary = self.summary()
+        lines = [f"Session stats ({summary['model']}, {summary['turns']} turns)",
+                 f"  wall time:           {summary['wall_time']:.2f}s",
+                 f"  model calls:         {summary['iterations']} "
+                 f"({summary['tool_calls']} tool calls)"]
+        if summary["mean_time_to_first_token"] is not None:
+            lines.append(f"  time to first token: {summary['mean_time_to_first_token'] * 1000:.0f}ms mean, "
+                         f"{summary['max_time_to_first_token'] * 1000:.0f}ms max")
+        if summary["prompt_eval_count"] is not None:
+            duration = (summary["prompt_eval_duration"] or 0) / 1e9
+            lines.append(f"  prompt eval:         {summary['prompt_eval_count']} tokens in {duration:.2f}s")
+        if summary["load_duration"]:
+            lines.append(f"  model load:          {summary['load_duration'] / 1e9:.2f}s")
+        if summary["tokens_per_second"] is not None:
+            lines.append(f"  generation:          {summary['eval_count']} tokens, "
+                         f"{summary['tokens_per_second']:.1f} tokens/s")
+        return "\n".join(lines)
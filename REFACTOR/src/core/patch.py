@@ -1,8 +1,15 @@
 """File patching utilities."""
+import bisect
 import os
+import secrets
+import shutil
+import tempfile
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Callable
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from .filecache import default_file_cache
 
 
 class ActionType(Enum):
@@ -61,16 +68,24 @@ class DiffError(Exception):
 
 
 class Parser:
-    """Parser for patch text."""
+    """Parser for patch text.
 
-    def __init__(self, current_files: Dict[str, str], lines: List[str]):
+    Files are read when their section is reached, so the patch can be
+    processed one file at a time.
+    """
+
+    def __init__(self, current_files: Optional[Dict[str, str]], lines: List[str],
+                 open_fn: Optional[Callable[[str], str]] = None):
         """Initialize parser.
         
         Args:
             current_files: Map of file paths to their current contents
             lines: Lines of the patch
+            open_fn: Function reading a file's current content, used
+                instead of current_files
         """
         self.current_files = current_files
+        self.open_fn = open_fn
         self.lines = lines
         self.index = 0
         self.patch = Patch(actions={})
@@ -128,44 +143,79 @@ class Parser:
 
     def parse(self) -> None:
         """Parse patch text."""
+        for path, action, _ in self.iter_actions():
+            self.patch.actions[path] = action
+
+    def iter_actions(self) -> Iterator[Tuple[str, PatchAction, Optional[str]]]:
+        """Parse patch text one file section at a time.
+        
+        Yields:
+            Tuples of (path, action, current content of the file); the
+            content is None for added files
+            
+        Raises:
+            DiffError: On parse error
+        """
         # Skip begin patch line
         if self.startswith("*** Begin Patch"):
             self.index += 1
+        seen = set()
             
         while not self.is_done(["*** End Patch"]):
             path = self.read_str("*** Update File: ")
             if path:
-                if path in self.patch.actions:
+                if path in seen:
                     raise DiffError(f"Update File Error: Duplicate Path: {path}")
+                seen.add(path)
                 move_to = self.read_str("*** Move to: ")
-                if path not in self.current_files:
-                    raise DiffError(f"Update File Error: Missing File: {path}")
-                text = self.current_files[path]
+                text = self.read_file(path, "Update File Error")
                 action = self.parse_update_file(text)
                 if move_to:
                     action.move_path = move_to
-                self.patch.actions[path] = action
+                yield path, action, text
                 continue
 
             path = self.read_str("*** Add File: ")
             if path:
-                if path in self.patch.actions:
+                if path in seen:
                     raise DiffError(f"Add File Error: Duplicate Path: {path}")
-                action = self.parse_add_file()
-                self.patch.actions[path] = action
+                seen.add(path)
+                yield path, self.parse_add_file(), None
                 continue
 
             path = self.read_str("*** Delete File: ")
             if path:
-                if path in self.patch.actions:
+                if path in seen:
                     raise DiffError(f"Delete File Error: Duplicate Path: {path}")
-                if path not in self.current_files:
-                    raise DiffError(f"Delete File Error: Missing File: {path}")
-                self.patch.actions[path] = PatchAction(type=ActionType.DELETE)
+                seen.add(path)
+                text = self.read_file(path, "Delete File Error")
+                yield path, PatchAction(type=ActionType.DELETE), text
                 continue
 
             raise DiffError(f"Parse Error: {self.lines[self.index]}")
 
+    def read_file(self, path: str, error: str) -> str:
+        """Get the current content of a file.
+        
+        Args:
+            path: File path
+            error: Prefix of the error message if the file is missing
+            
+        Returns:
+            File content
+            
+        Raises:
+            DiffError: If the file does not exist
+        """
+        if self.open_fn is not None:
+            try:
+                return self.open_fn(path)
+            except (FileNotFoundError, KeyError):
+                raise DiffError(f"{error}: Missing File: {path}")
+        if path not in self.current_files:
+            raise DiffError(f"{error}: Missing File: {path}")
+        return self.current_files[path]
+
     def parse_update_file(self, text: str) -> PatchAction:
         """Parse update file action.
         
@@ -180,27 +230,61 @@ class Parser:
         """
         action = PatchAction(type=ActionType.UPDATE)
         lines = text.splitlines()
+        matcher = ContextMatcher(lines)
+        # Chunks come in file order, so each is searched after the previous one
+        position = 0
 
         while not self.is_done(["*** "]):
-            if self.startswith("@@ "):
-                # Skip chunk header
+            # The header of the first chunk may be left out
+            if _is_chunk_header(self.lines[self.index]):
                 self.index += 1
 
-                chunk = Chunk(orig_index=0, del_lines=[], ins_lines=[])
-                action.chunks.append(chunk)
-
-                # Parse chunk content
-                while not self.is_done(["@@ ", "*** "]):
-                    line = self.read_str("", return_everything=True)
-                    if not line:
-                        break
-                    if line.startswith("-"):
-                        chunk.del_lines.append(line[1:])
-                    elif line.startswith("+"):
-                        chunk.ins_lines.append(line[1:])
-                    elif not line.startswith("@@ "):
-                        chunk.del_lines.append(line)
-                        chunk.ins_lines.append(line)
+            chunk = Chunk(orig_index=0, del_lines=[], ins_lines=[])
+            action.chunks.append(chunk)
+            # Positions of each context line in del_lines and ins_lines
+            context_lines = []
+
+            # Parse chunk content
+            while not self.is_done(["*** "]) and not _is_chunk_header(self.lines[self.index]):
+                line = self.read_str("", return_everything=True)
+                if line.startswith("-"):
+                    chunk.del_lines.append(line[1:])
+                elif line.startswith("+"):
+                    chunk.ins_lines.append(line[1:])
+                else:
+                    context_lines.append((len(chunk.del_lines), len(chunk.ins_lines)))
+                    chunk.del_lines.append(line)
+                    chunk.ins_lines.append(line)
+
+            # A trailing empty line stands for the end of the file
+            eof = chunk.del_lines[-1:] == [""]
+            try:
+                try:
+                    start, position, fuzz = matcher.find(chunk.del_lines, position, eof)
+                except DiffError:
+                    trailing = (len(chunk.del_lines) - 1, len(chunk.ins_lines) - 1)
+                    if not eof or context_lines[-1:] != [trailing]:
+                        raise
+                    # Or is only a blank line before the next section
+                    chunk.del_lines.pop()
+                    chunk.ins_lines.pop()
+                    context_lines.pop()
+                    start, position, fuzz = matcher.find(chunk.del_lines, position, False)
+            except DiffError:
+                context = "\n".join(chunk.del_lines[:3])
+                raise DiffError(f"Update File Error: Context not found:\n{context}")
+            if fuzz:
+                # Context only matched loosely, so keep the file's own text
+                for del_index, ins_index in context_lines:
+                    if start + del_index < len(lines):
+                        chunk.del_lines[del_index] = lines[start + del_index]
+                        chunk.ins_lines[ins_index] = lines[start + del_index]
+            if position - start < len(chunk.del_lines):
+                chunk.del_lines.pop()
+                if chunk.ins_lines[-1:] == [""]:
+                    chunk.ins_lines.pop()
+            chunk.orig_index = start
+            self.fuzz += fuzz
 
         return action
 
@@ -214,13 +298,152 @@ class Parser:
         lines = []
         while not self.is_done(["*** "]):
             line = self.read_str()
-            if line:
+            if line.startswith("+"):
+                # Every line of a new file is written as an insertion
+                lines.append(line[1:])
+            elif line:
                 lines.append(line)
-        action.new_file = "\n".join(lines)
+        action.new_file = "".join(line + "\n" for line in lines)
         return action
 
 
-def find_context(lines: List[str], context: List[str], start: int, eof: bool) -> Tuple[int, int]:
+def _is_chunk_header(line: str) -> bool:
+    return line == "@@" or line.startswith("@@ ")
+
+
+class LineIndex:
+    """Positions of every distinct line of a file.
+
+    Built once per file, so a chunk's context is located by looking up its
+    rarest line instead of scanning the whole file.
+    """
+
+    def __init__(self, lines: List[str]):
+        """Index file lines.
+
+        Args:
+            lines: File lines
+        """
+        self.lines = lines
+        self.positions: Dict[str, List[int]] = {}
+        for i, line in enumerate(lines):
+            self.positions.setdefault(line, []).append(i)
+
+    def find(self, context: List[str], start: int, eof: bool) -> Tuple[int, int]:
+        """Find the first occurrence of context lines at or after a line.
+
+        Args:
+            context: Context lines to find
+            start: Start line
+            eof: Allow the last context line to be past the end of the file
+
+        Returns:
+            Tuple of (start, end) line numbers
+
+        Raises:
+            DiffError: If context not found
+        """
+        if not context:
+            return start, start
+
+        lines = self.lines
+        size = len(context)
+        # Anchor on the line with the fewest occurrences; positions are
+        # ascending, so the first candidate that matches is the first match
+        offset, anchor = min(
+            ((j, self.positions.get(line, ())) for j, line in enumerate(context)),
+            key=lambda item: len(item[1])
+        )
+        for pos in anchor[bisect.bisect_left(anchor, start + offset):]:
+            i = pos - offset
+            if i + size > len(lines):
+                break
+            if lines[i:i + size] == context:
+                return i, i + size
+
+        # Only the last context line may hang over the end of the file
+        i = len(lines) - size + 1
+        if eof and i >= start and lines[i:] == context[:-1]:
+            return i, len(lines)
+        raise DiffError("Context not found")
+
+
+# Typographic characters models tend to swap for their ASCII lookalikes
+_PUNCTUATION = str.maketrans({
+    **dict.fromkeys("\u2010\u2011\u2012\u2013\u2014\u2015\u2212", "-"),
+    **dict.fromkeys("\u2018\u2019\u201a\u201b", "'"),
+    **dict.fromkeys("\u201c\u201d\u201e\u201f", '"'),
+    **dict.fromkeys("\u00a0\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a"
+                    "\u202f\u205f\u3000", " "),
+})
+
+
+def _normalize_unicode(line: str) -> str:
+    """Strip a line and map look-alike Unicode punctuation to ASCII."""
+    return unicodedata.normalize("NFKC", line).translate(_PUNCTUATION).strip()
+
+
+# Ways of comparing lines, tried in order, with the fuzz a match adds
+MATCH_TIERS: Tuple[Tuple[Optional[Callable[[str], str]], int], ...] = (
+    (None, 0),
+    (str.rstrip, 1),
+    (str.strip, 100),
+    (_normalize_unicode, 1000),
+)
+
+
+class ContextMatcher:
+    """Finds chunk context in one file, tolerating whitespace drift.
+
+    Each tier compares lines after a more lenient normalization. The
+    normalized lines and their index are computed once per tier, on first
+    use.
+    """
+
+    def __init__(self, lines: List[str]):
+        """Initialize the matcher.
+
+        Args:
+            lines: File lines
+        """
+        self.lines = lines
+        self._indexes: Dict[int, LineIndex] = {}
+
+    def _index(self, tier: int) -> LineIndex:
+        """Get the line index of a tier."""
+        index = self._indexes.get(tier)
+        if index is None:
+            normalize = MATCH_TIERS[tier][0]
+            lines = self.lines if normalize is None else [normalize(line) for line in self.lines]
+            index = self._indexes[tier] = LineIndex(lines)
+        return index
+
+    def find(self, context: List[str], start: int, eof: bool) -> Tuple[int, int, int]:
+        """Find context lines, trying stricter comparisons first.
+
+        Args:
+            context: Context lines to find
+            start: Start line
+            eof: Allow end of file
+
+        Returns:
+            Tuple of (start, end, fuzz); fuzz is 0 for an exact match
+
+        Raises:
+            DiffError: If context not found with any comparison
+        """
+        for tier, (normalize, fuzz) in enumerate(MATCH_TIERS):
+            wanted = context if normalize is None else [normalize(line) for line in context]
+            try:
+                found_start, found_end = self._index(tier).find(wanted, start, eof)
+            except DiffError:
+                continue
+            return found_start, found_end, fuzz
+        raise DiffError("Context not found")
+
+
+def find_context(lines: List[str], context: List[str], start: int, eof: bool,
+                 index: Optional[LineIndex] = None) -> Tuple[int, int]:
     """Find context lines in file.
     
     Args:
@@ -228,6 +451,7 @@ def find_context(lines: List[str], context: List[str], start: int, eof: bool) ->
         context: Context lines to find
         start: Start line
         eof: Allow end of file
+        index: Index of the lines, to reuse across searches in one file
         
     Returns:
         Tuple of (start, end) line numbers
@@ -235,24 +459,9 @@ def find_context(lines: List[str], context: List[str], start: int, eof: bool) ->
     Raises:
         DiffError: If context not found
     """
-    if not context:
-        return start, start
-
-    for i in range(start, len(lines)):
-        match = True
-        for j, ctx_line in enumerate(context):
-            if i + j >= len(lines):
-                if eof and j == len(context) - 1:
-                    return i, i + j
-                match = False
-                break
-            if lines[i + j] != ctx_line:
-                match = False
-                break
-        if match:
-            return i, i + len(context)
-
-    raise DiffError("Context not found")
+    if index is None:
+        index = LineIndex(lines)
+    return index.find(context, start, eof)
 
 
 def text_to_patch(text: str, orig: Dict[str, str]) -> Tuple[Patch, int]:
@@ -263,10 +472,11 @@ def text_to_patch(text: str, orig: Dict[str, str]) -> Tuple[Patch, int]:
         orig: Map of file paths to contents
         
     Returns:
-        Tuple of (patch, fuzz)
+        Tuple of (patch, fuzz); fuzz sums how leniently each chunk's
+        context had to be compared to be found, 0 if all matched exactly
         
     Raises:
-        DiffError: On parse error
+        DiffError: On parse error or if a chunk's context is not found
     """
     if not text.startswith("*** Begin Patch"):
         raise DiffError("Patch must start with *** Begin Patch")
@@ -314,18 +524,9 @@ def identify_files_added(text: str) -> List[str]:
 def _get_updated_file(text: str, action: PatchAction, path: str) -> str:
     """Apply patch chunks to file content.
     
-    Args:
-        text: Original file content
-        action: Patch action
-        path: File path
-        
-    Returns:
-        Updated file content with proper line endings
-        
-    Raises:
-        DiffError: If patch cannot be applied
-    """
-    """Apply patch chunks to file content.
+    Chunks must be in file order and start at their ``orig_index``, as
+    recorded by the parser. The result is built in one pass from the
+    unchanged slices of the file between chunks.
     
     Args:
         text: Original file content
@@ -333,7 +534,7 @@ def _get_updated_file(text: str, action: PatchAction, path: str) -> str:
         path: File path
         
     Returns:
-        Updated file content
+        Updated file content with proper line endings
         
     Raises:
         DiffError: If patch cannot be applied
@@ -342,17 +543,20 @@ def _get_updated_file(text: str, action: PatchAction, path: str) -> str:
         raise DiffError(f"Invalid action type for {path}: {action.type}")
 
     lines = text.splitlines()
-    new_lines = lines.copy()
+    new_lines: List[str] = []
+    # First original line not yet copied or replaced
+    position = 0
 
     for chunk in action.chunks:
-        # Find chunk location
-        try:
-            start, end = find_context(lines, chunk.del_lines, 0, False)
-        except DiffError:
-            raise DiffError(f"Failed to apply chunk in {path}")
-
-        # Apply chunk
-        new_lines[start:end] = chunk.ins_lines
+        start = chunk.orig_index
+        end = start + len(chunk.del_lines)
+        if start < position or end > len(lines):
+            raise DiffError(f"Failed to apply chunk in {path}: "
+                            f"lines {start + 1}-{end} overlap another chunk or the end of the file")
+        new_lines.extend(lines[position:start])
+        new_lines.extend(chunk.ins_lines)
+        position = end
+    new_lines.extend(lines[position:])
 
     # Preserve original line endings
     if text.endswith("\n"):
@@ -372,33 +576,44 @@ def patch_to_commit(patch: Patch, orig: Dict[str, str]) -> Commit:
     """
     commit = Commit(changes={})
     for path, action in patch.actions.items():
-        if action.type == ActionType.DELETE:
-            commit.changes[path] = FileChange(
-                type=ActionType.DELETE,
-                old_content=orig[path]
-            )
-        elif action.type == ActionType.ADD:
-            commit.changes[path] = FileChange(
-                type=ActionType.ADD,
-                new_content=action.new_file
-            )
-        elif action.type == ActionType.UPDATE:
-            new_content = _get_updated_file(orig[path], action, path)
-            commit.changes[path] = FileChange(
-                type=ActionType.UPDATE,
-                old_content=orig[path],
-                new_content=new_content,
-                move_path=action.move_path
-            )
+        commit.changes[path] = _action_to_change(path, action, orig.get(path))
     return commit
 
 
+def _action_to_change(path: str, action: PatchAction, content: Optional[str]) -> FileChange:
+    """Compute the change a patch action makes to a file.
+    
+    Args:
+        path: File path
+        action: Patch action
+        content: Current content of the file, None for added files
+        
+    Returns:
+        The file change
+    """
+    if action.type == ActionType.DELETE:
+        return FileChange(type=ActionType.DELETE, old_content=content)
+    if action.type == ActionType.ADD:
+        return FileChange(type=ActionType.ADD, new_content=action.new_file)
+    return FileChange(
+        type=ActionType.UPDATE,
+        old_content=content,
+        new_content=_get_updated_file(content, action, path),
+        move_path=action.move_path
+    )
+
+
 def process_patch(text: str,
                  open_fn: Callable[[str], str],
                  write_fn: Callable[[str, str], None],
                  remove_fn: Callable[[str], None]) -> str:
     """Process a patch.
     
+    The patch is parsed in one pass. Each file is read when its section
+    is reached and handed to ``write_fn`` or ``remove_fn`` before the
+    next one is read, so only one file is held at a time. A later section
+    can still fail; write into a FileTransaction to apply all or nothing.
+    
     Args:
         text: Patch text
         open_fn: Function to open files
@@ -414,12 +629,9 @@ def process_patch(text: str,
     if not text.startswith("*** Begin Patch"):
         raise DiffError("Patch must start with *** Begin Patch")
 
-    paths = identify_files_needed(text)
-    orig = {p: open_fn(p) for p in paths}
-    patch, _ = text_to_patch(text, orig)
-    commit = patch_to_commit(patch, orig)
-
-    for path, change in commit.changes.items():
+    parser = Parser(None, text.splitlines(), open_fn=open_fn)
+    for path, action, content in parser.iter_actions():
+        change = _action_to_change(path, action, content)
         if change.type == ActionType.DELETE:
             remove_fn(path)
         elif change.type == ActionType.ADD:
@@ -430,5 +642,282 @@ def process_patch(text: str,
                 remove_fn(path)
             else:
                 write_fn(path, change.new_content or "")
+        # Don't keep this file while the next one is read
+        del content, change
 
+    if parser.fuzz:
+        # Tell the model its context was off, so it can be exact next time
+        return f"Done! (context matched only after normalizing whitespace or punctuation, fuzz {parser.fuzz})"
     return "Done!"
+
+
+# Read once, since the umask can only be read by setting it, which
+# would briefly change it for every thread in the process
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Transactions writing at least this many files stage the rest on a
+# thread pool; writing and syncing release the GIL
+PARALLEL_STAGING_MIN_FILES = 8
+STAGING_WORKERS = 8
+
+
+class FileTransaction:
+    """Writes and removes files all together or not at all.
+
+    New contents are staged in temporary files next to their targets as
+    soon as they are written, so the caller doesn't need to keep them,
+    and synced before anything is touched. On commit they are renamed over
+    the targets. Files about to be replaced or removed are kept as hard
+    links until the transaction is done, so a failure at any point
+    restores the tree.
+    """
+
+    def __init__(self, cwd: Optional[str] = None, fsync: bool = True):
+        """Initialize the transaction.
+
+        Args:
+            cwd: Directory relative paths are resolved against, the
+                current directory by default
+            fsync: Sync staged files and their directories to disk
+        """
+        self.cwd = cwd or os.getcwd()
+        self.fsync = fsync
+        # Target path -> staged temporary file, or the Future staging it
+        self._staged: Dict[str, Union[str, Future]] = {}
+        self._removes: List[str] = []
+        self._created: List[str] = []
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def path(self, path: str) -> str:
+        """Resolve a path against the transaction's directory."""
+        return os.path.join(self.cwd, path)
+
+    def write(self, path: str, content: str) -> None:
+        """Stage a file's new content, written when the transaction commits.
+
+        Args:
+            path: File path
+            content: New content
+
+        Raises:
+            OSError: If the content cannot be staged
+        """
+        target = self.path(path)
+        if os.path.islink(target):
+            # Update the file the link points to, like open() would
+            target = os.path.realpath(target)
+        self._discard(self._staged.pop(target, None))
+        self._created += _make_parents(os.path.dirname(target))
+        if len(self._staged) + 1 < PARALLEL_STAGING_MIN_FILES:
+            self._staged[target] = self._stage(target, content)
+            return
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=STAGING_WORKERS)
+        pending = [f for f in self._staged.values() if isinstance(f, Future) and not f.done()]
+        if len(pending) >= STAGING_WORKERS:
+            # Bound the contents waiting in the queue
+            wait(pending, return_when=FIRST_COMPLETED)
+        self._staged[target] = self._pool.submit(self._stage, target, content)
+
+    def remove(self, path: str) -> None:
+        """Remove a file when the transaction commits.
+
+        Args:
+            path: File path
+        """
+        self._removes.append(self.path(path))
+
+    def commit(self) -> None:
+        """Apply all writes and removals.
+
+        Raises:
+            OSError: If a file cannot be staged, replaced or removed; the
+                files are then as they were before
+        """
+        backups: Dict[str, str] = {}
+        applied: List[str] = []
+        try:
+            staged = self._wait_staged()
+            for path in list(staged) + self._removes:
+                if path not in backups and os.path.lexists(path):
+                    backups[path] = _backup(path)
+
+            for target in list(staged):
+                os.replace(staged[target], target)
+                del self._staged[target]
+                applied.append(target)
+            for path in self._removes:
+                os.unlink(path)
+                applied.append(path)
+            if self.fsync:
+                for directory in {os.path.dirname(path) for path in applied}:
+                    _fsync_dir(directory)
+            self._created = []
+        except BaseException:
+            # Each path once, even if it was both written and removed
+            for path in dict.fromkeys(reversed(applied)):
+                if path in backups:
+                    os.replace(backups.pop(path), path)
+                elif os.path.lexists(path):
+                    os.unlink(path)
+            self.abort()
+            raise
+        finally:
+            for backup in backups.values():
+                _unlink_quietly(backup)
+            self._close_pool()
+
+    def abort(self) -> None:
+        """Drop everything staged, leaving the files untouched."""
+        for staged in self._staged.values():
+            self._discard(staged)
+        self._staged = {}
+        self._removes = []
+        for directory in reversed(self._created):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        self._created = []
+        self._close_pool()
+
+    def _wait_staged(self) -> Dict[str, str]:
+        """Wait for staging to finish; raise the first error."""
+        errors = []
+        for target, staged in list(self._staged.items()):
+            if isinstance(staged, Future):
+                if staged.exception() is not None:
+                    errors.append(staged.exception())
+                    del self._staged[target]
+                else:
+                    self._staged[target] = staged.result()
+        if errors:
+            raise errors[0]
+        return dict(self._staged)
+
+    def _stage(self, target: str, content: str) -> str:
+        """Write a file's new content to a temporary file next to it."""
+        try:
+            mode = os.stat(target).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(target),
+                                    prefix=f".{os.path.basename(target)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(temp, mode)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        return temp
+
+    @staticmethod
+    def _discard(staged: Union[str, Future, None]) -> None:
+        """Remove a staged file, once it has been written."""
+        if isinstance(staged, Future):
+            if staged.exception() is not None:
+                return
+            staged = staged.result()
+        if staged is not None:
+            _unlink_quietly(staged)
+
+    def _close_pool(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def _make_parents(directory: str) -> List[str]:
+    """Create a directory and its missing parents.
+
+    Returns:
+        The directories created, outermost first
+    """
+    missing = []
+    while directory and not os.path.isdir(directory):
+        missing.append(directory)
+        directory = os.path.dirname(directory)
+    for path in reversed(missing):
+        os.mkdir(path)
+    return list(reversed(missing))
+
+
+def _unlink_quietly(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _backup(path: str) -> str:
+    """Keep a file reachable under a temporary name in its directory."""
+    backup = os.path.join(os.path.dirname(path),
+                          f".{os.path.basename(path)}.{secrets.token_hex(4)}.orig")
+    try:
+        os.link(path, backup, follow_symlinks=False)
+    except (OSError, NotImplementedError):
+        # No hard links on this file system
+        shutil.copy2(path, backup, follow_symlinks=False)
+    return backup
+
+
+def _fsync_dir(directory: str) -> None:
+    """Sync a directory, making renames and removals in it durable."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Not supported for directories on every platform
+        pass
+    finally:
+        os.close(fd)
+
+
+def apply_patch_to_files(text: str, cwd: Optional[str] = None) -> str:
+    """Apply a patch to files on disk as one transaction.
+
+    Either every file change of the patch is made or none is.
+
+    Args:
+        text: Patch text
+        cwd: Directory relative paths in the patch are resolved against
+
+    Returns:
+        Status message
+
+    Raises:
+        DiffError: If patch cannot be applied
+        OSError: If the files cannot be changed
+    """
+    transaction = FileTransaction(cwd)
+    changed = []
+
+    def open_fn(path: str) -> str:
+        return default_file_cache.read_text(transaction.path(path))
+
+    def write_fn(path: str, content: str) -> None:
+        changed.append(path)
+        transaction.write(path, content)
+
+    def remove_fn(path: str) -> None:
+        changed.append(path)
+        transaction.remove(path)
+
+    try:
+        status = process_patch(text, open_fn, write_fn, remove_fn)
+    except BaseException:
+        transaction.abort()
+        raise
+    transaction.commit()
+    for path in changed:
+        default_file_cache.invalidate(transaction.path(path))
+    return status
@@ -0,0 +1,135 @@
+"""
+Prompt assembly that keeps the prompt prefix stable between turns.
+
+Ollama only reuses its KV cache for the leading part of a prompt that is
+identical to the previous request, so the system prefix is built once per
+session and the history is only ever appended to.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from .context import Conversation
+from .llm import GenerationStats, Message
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are Codex, a coding agent running in the user's terminal. "
+    "You can inspect and change the user's project with the tools below."
+)
+
+
+def build_system_prompt(instructions: str = "", tools: Optional[Dict[str, str]] = None) -> str:
+    """Build the fixed system prompt for a session.
+
+    Args:
+        instructions: User instructions and project documentation
+        tools: Map of tool names to descriptions
+
+    Returns:
+        System prompt text
+    """
+    sections = [DEFAULT_SYSTEM_PROMPT]
+    if tools:
+        sections.append("Available tools:\n" + "\n".join(
+            f"- {name}: {description}" for name, description in tools.items()
+        ))
+    if instructions.strip():
+        sections.append(instructions.strip())
+    return "\n\n".join(sections)
+
+
+@dataclass
+class PromptCacheReport:
+    """How much of a turn's prompt Ollama could serve from its KV cache."""
+    turn: int
+    # Estimated size of the prompt sent
+    prompt_tokens: int
+    # Estimated tokens in the prefix shared with the previous request
+    reused_tokens: int
+    # Tokens Ollama actually evaluated, as reported in the final chunk
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_duration: Optional[int] = None  # nanoseconds
+
+    @property
+    def estimated_cache_hit_ratio(self) -> Optional[float]:
+        """Estimated fraction of the prompt that did not need to be evaluated.
+
+        Ollama only reports the tokens it evaluated, not the size of the
+        whole prompt, so the real count is compared with the estimated
+        prompt size; the ratio is only as good as that estimate.
+        """
+        if self.prompt_eval_count is None or not self.prompt_tokens:
+            return None
+        evaluated = min(self.prompt_eval_count, self.prompt_tokens)
+        return 1 - evaluated / self.prompt_tokens
+
+    def __str__(self) -> str:
+        text = (f"Turn {self.turn}: prompt ~{self.prompt_tokens} tokens, "
+                f"~{self.reused_tokens} in unchanged prefix")
+        if self.prompt_eval_count is not None:
+            text += f", evaluated {self.prompt_eval_count}"
+            if self.prompt_eval_duration:
+                text += f" in {self.prompt_eval_duration / 1e6:.0f}ms"
+            text += f" (~{self.estimated_cache_hit_ratio:.0%} cache hit, estimated)"
+        return text
+
+
+class PromptBuilder:
+    """Assembles the messages for each request from a conversation.
+
+    The system prompt is pinned as the first message of the conversation
+    and messages are sent as the same objects every turn, so their cached
+    formatting serializes to identical bytes.
+    """
+
+    def __init__(self, conversation: Conversation, system_prompt: str):
+        """Initialize the builder.
+
+        Args:
+            conversation: Conversation to assemble prompts from
+            system_prompt: Fixed system prompt for the session
+        """
+        self.conversation = conversation
+        if system_prompt:
+            self.conversation.append(Message(role="system", content=system_prompt))
+        self.reports: List[PromptCacheReport] = []
+        self._last_sent: List[Message] = []
+        self._pending: Optional[PromptCacheReport] = None
+
+    def build(self) -> List[Message]:
+        """Get the messages for the next request.
+
+        Returns:
+            Messages to send
+        """
+        messages = self.conversation.fit()
+        shared = 0
+        for previous, current in zip(self._last_sent, messages):
+            if previous is not current:
+                break
+            shared += 1
+        self._last_sent = messages
+        self._pending = PromptCacheReport(
+            turn=len(self.reports) + 1,
+            prompt_tokens=self.conversation.total_tokens,
+            reused_tokens=self.conversation.tokens_before(shared)
+        )
+        return messages
+
+    def record(self, stats: Optional[GenerationStats]) -> Optional[PromptCacheReport]:
+        """Record Ollama's statistics for the last built request.
+
+        Args:
+            stats: Statistics from the final chunk, if any
+
+        Returns:
+            Cache report for the request
+        """
+        report = self._pending
+        if report is None:
+            return None
+        if stats is not None:
+            report.prompt_eval_count = stats.prompt_eval_count
+            report.prompt_eval_duration = stats.prompt_eval_duration
+        self.reports.append(report)
+        self._pending = None
+        return report
@@ -0,0 +1,187 @@
+"""
+Ranged reads of text files for the read tool.
+Small files come from the content cache and large ones are memory-mapped;
+a sparse index of line offsets is kept per file version, so reading a few
+lines deep into a large file only touches those lines once it is indexed.
+"""
+
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+from .filecache import FileContentCache, default_file_cache
+
+# Most output of a single read; longer ranges end with a marker telling
+# where to continue
+DEFAULT_MAX_READ_BYTES = 32 * 1024
+# A NUL byte in this much of the start of a file marks it as binary
+BINARY_SNIFF_BYTES = 8 * 1024
+# Every this many lines the index records a line's byte offset
+LINE_INDEX_STEP = 128
+# Files whose line index is kept
+MAX_INDEXED_FILES = 32
+
+# Contents of a file, cached or memory-mapped
+Buffer = Union[bytes, mmap.mmap]
+
+
+class LineOffsets:
+    """Byte offsets of every LINE_INDEX_STEP-th line of a file.
+
+    The index is extended only as far as reads need, so the first read of
+    a range costs a scan up to it and later reads near it are cheap.
+    """
+
+    def __init__(self):
+        self.checkpoints = array("q", [0])
+        # Whether the last checkpoint is the last one the file has
+        self.complete = False
+        # Matches the lines between two checkpoints, scanning in C
+        self._step = re.compile(b"(?:[^\n]*\n){%d}" % LINE_INDEX_STEP)
+
+    def line_start(self, mm: Buffer, line: int) -> int:
+        """Get the byte offset at which a line starts.
+
+        Args:
+            mm: File contents
+            line: Line number, starting at 0
+
+        Returns:
+            The offset, or the file size if the file has fewer lines
+        """
+        size = len(mm)
+        self._extend(mm, line // LINE_INDEX_STEP)
+        checkpoint = min(line // LINE_INDEX_STEP, len(self.checkpoints) - 1)
+        pos = self.checkpoints[checkpoint]
+        for _ in range(line - checkpoint * LINE_INDEX_STEP):
+            newline = mm.find(b"\n", pos)
+            if newline < 0:
+                return size
+            pos = newline + 1
+        return pos
+
+    def _extend(self, mm: Buffer, checkpoint: int) -> None:
+        """Scan the file until a checkpoint is known or the file ends."""
+        while len(self.checkpoints) <= checkpoint and not self.complete:
+            match = self._step.match(mm, self.checkpoints[-1])
+            if match is None:
+                self.complete = True
+            else:
+                self.checkpoints.append(match.end())
+
+
+class FileReader:
+    """Reads line or byte ranges of files from the content cache or mmap.
+
+    Line indexes are cached by path and invalidated when the file's mtime
+    or size changes.
+    """
+
+    def __init__(self, max_files: int = MAX_INDEXED_FILES,
+                 file_cache: Optional[FileContentCache] = None):
+        """Initialize the reader.
+
+        Args:
+            max_files: Number of files whose line index is kept
+            file_cache: Cache small files are read through, the shared one
+                by default
+        """
+        self.max_files = max_files
+        self.file_cache = file_cache or default_file_cache
+        self._indexes: "OrderedDict[str, Tuple[Tuple[int, int], LineOffsets]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _line_offsets(self, path: str, st: os.stat_result) -> LineOffsets:
+        """Get the cached line index of a file version."""
+        version = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is not None and cached[0] == version:
+                self._indexes.move_to_end(path)
+                return cached[1]
+            offsets = LineOffsets()
+            self._indexes[path] = (version, offsets)
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_files:
+                self._indexes.popitem(last=False)
+            return offsets
+
+    def read(self, path: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+             offset: Optional[int] = None, length: Optional[int] = None,
+             max_bytes: int = DEFAULT_MAX_READ_BYTES) -> str:
+        """Read part of a text file.
+
+        Files small enough for the content cache are served from it;
+        larger ones are memory-mapped.
+
+        Args:
+            path: Path to the file
+            start_line: First line to read, starting at 1
+            end_line: Last line to read, inclusive
+            offset: First byte to read, instead of a line range
+            length: Number of bytes to read from offset
+            max_bytes: Most bytes to return; a longer range is cut at a
+                line boundary and ends with a marker
+
+        Returns:
+            The text, or a note if the file is binary
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        if st.st_size <= self.file_cache.max_file_bytes:
+            st, data = self.file_cache.load(path, st=st)
+            return self._read(path, st, data, start_line, end_line, offset, length, max_bytes)
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return self._read(path, st, mm, start_line, end_line, offset, length, max_bytes)
+
+    def _read(self, path: str, st: os.stat_result, buf: Buffer,
+              start_line: Optional[int], end_line: Optional[int],
+              offset: Optional[int], length: Optional[int], max_bytes: int) -> str:
+        """Read part of a file's contents, already in memory or mapped."""
+        size = len(buf)
+        if not size:
+            return ""
+        if b"\0" in buf[:BINARY_SNIFF_BYTES]:
+            return f"[Binary file, {size} bytes]"
+
+        by_lines = offset is None and length is None
+        first_line = max(start_line or 1, 1)
+        if by_lines and (first_line > 1 or end_line is not None):
+            offsets = self._line_offsets(path, st)
+            start = offsets.line_start(buf, first_line - 1) if first_line > 1 else 0
+            end = size if end_line is None else offsets.line_start(buf, end_line)
+        elif by_lines:
+            start, end = 0, size
+        else:
+            start = min(max(offset or 0, 0), size)
+            end = size if length is None else min(start + max(length, 0), size)
+        data = buf[start:min(end, start + max_bytes)]
+
+        remaining = max(end - start, 0) - len(data)
+        if not remaining:
+            return data.decode("utf-8", errors="replace")
+
+        # Don't end on half a line, unless the first line alone is too long
+        cut = data.rfind(b"\n") + 1 if by_lines else 0
+        if cut:
+            remaining += len(data) - cut
+            data = data[:cut]
+            next_line = first_line + data.count(b"\n")
+            where = f"continue from line {next_line}"
+        else:
+            where = f"continue from offset {start + len(data)}"
+        text = data.decode("utf-8", errors="replace")
+        if not text.endswith("\n"):
+            text += "\n"
+        return f"{text}... [truncated, {remaining} more bytes; {where}] ..."
+
+
+# Shared by all read tool calls, so indexes survive between calls
+default_reader = FileReader()
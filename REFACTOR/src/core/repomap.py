@@ -0,0 +1,349 @@
+"""
+Repository map for the repo_map tool.
+Outlines the top-level symbols of each file in a workspace, ranks files by
+how often the rest of the project imports them, and trims the outline to
+a token budget, so the model sees the project's shape without reading it.
+"""
+
+import ast
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from .context import estimate_tokens
+from .search import get_index
+
+DEFAULT_MAP_TOKENS = 2048
+# Larger files are listed without an outline
+MAX_OUTLINE_FILE_BYTES = 512 * 1024
+# Below this many files to outline, starting worker processes costs more
+# than it saves
+PARALLEL_MIN_FILES = 64
+MAX_SIGNATURE_CHARS = 100
+
+# Definitions and imports of languages outlined without a parser, by
+# file extension
+_C_FAMILY = (
+    re.compile(r"^(?:(?:public|private|protected|static|final|abstract|export|default|async|"
+               r"inline|virtual|extern)\s+)*(?:class|struct|interface|enum|trait|record|namespace)"
+               r"\s+\w+", re.M),
+    re.compile(r'^\s*#include\s+["<]([^">]+)[">]|^import\s+(?:static\s+)?([\w.]+)', re.M),
+)
+_JS = (
+    re.compile(r"^(?:export\s+(?:default\s+)?)?(?:async\s+)?(?:function\*?|class|interface|type|enum)"
+               r"\s+\w+|^export\s+(?:const|let|var)\s+\w+", re.M),
+    re.compile(r"""^\s*import\s[^'"]*['"]([^'"]+)['"]|require\(\s*['"]([^'"]+)['"]\s*\)""", re.M),
+)
+_LANGUAGES: Dict[str, Tuple["re.Pattern[str]", "re.Pattern[str]"]] = {
+    ".js": _JS, ".jsx": _JS, ".mjs": _JS, ".ts": _JS, ".tsx": _JS,
+    ".go": (
+        re.compile(r"^func\s+(?:\([^)]*\)\s*)?\w+|^type\s+\w+\s+\w+", re.M),
+        re.compile(r'^\s*(?:import\s+)?(?:\w+\s+)?"([\w./-]+)"', re.M),
+    ),
+    ".rs": (
+        re.compile(r"^(?:pub(?:\([\w:]+\))?\s+)?(?:async\s+)?(?:fn|struct|enum|trait|mod|type)\s+\w+"
+                   r"|^impl\b[^{]*", re.M),
+        re.compile(r"^\s*(?:pub\s+)?(?:use|mod)\s+([\w:]+)", re.M),
+    ),
+    ".rb": (
+        re.compile(r"^\s*(?:class|module|def)\s+[\w:.]+", re.M),
+        re.compile(r"""^\s*require(?:_relative)?\s+['"]([^'"]+)['"]""", re.M),
+    ),
+    ".java": _C_FAMILY, ".kt": _C_FAMILY, ".cs": _C_FAMILY, ".scala": _C_FAMILY,
+    ".c": _C_FAMILY, ".h": _C_FAMILY, ".cc": _C_FAMILY, ".cpp": _C_FAMILY, ".hpp": _C_FAMILY,
+}
+# Fallback for Python files that don't parse
+_PYTHON = (
+    re.compile(r"^(?:async\s+)?(?:def|class)\s+\w+", re.M),
+    re.compile(r"^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))", re.M),
+)
+
+
+@dataclass
+class FileOutline:
+    """Top-level symbols of a file and the modules it imports."""
+    symbols: List[str] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+
+
+def _signature(node: ast.AST) -> str:
+    """Render a class or function definition as one short line."""
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        text = f"class {node.name}({bases})" if bases else f"class {node.name}"
+    else:
+        args = node.args
+        names = [arg.arg for arg in args.posonlyargs + args.args]
+        if args.vararg:
+            names.append("*" + args.vararg.arg)
+        elif args.kwonlyargs:
+            names.append("*")
+        names += [arg.arg for arg in args.kwonlyargs]
+        if args.kwarg:
+            names.append("**" + args.kwarg.arg)
+        if names[:1] in (["self"], ["cls"]):
+            names = names[1:]
+        prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        text = f"{prefix} {node.name}({', '.join(names)})"
+    if len(text) > MAX_SIGNATURE_CHARS:
+        text = text[:MAX_SIGNATURE_CHARS - 3] + "..."
+    return text
+
+
+def _statements(body: List[ast.stmt]) -> Iterator[ast.stmt]:
+    """Iterate over statements, nested ones included, skipping expressions.
+
+    Imports are statements, so this finds them all in a fraction of the
+    time ast.walk takes to visit every node.
+    """
+    for node in body:
+        yield node
+        for name in ("body", "orelse", "finalbody", "handlers", "cases"):
+            children = getattr(node, name, None)
+            if children:
+                yield from _statements(children)
+
+
+def _outline_python(source: str, module: str) -> FileOutline:
+    """Outline a Python file from its syntax tree.
+
+    Args:
+        source: File contents
+        module: Dotted module name, to resolve relative imports
+
+    Raises:
+        SyntaxError: If the file doesn't parse
+    """
+    outline = FileOutline()
+    tree = ast.parse(source)
+    definitions = (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+    for node in tree.body:
+        if isinstance(node, definitions) and not node.name.startswith("_"):
+            outline.symbols.append(_signature(node))
+            if isinstance(node, ast.ClassDef):
+                outline.symbols.extend(
+                    "  " + _signature(child) for child in node.body
+                    if isinstance(child, definitions) and not child.name.startswith("_")
+                )
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            outline.symbols.extend(
+                target.id for target in targets
+                if isinstance(target, ast.Name) and target.id.isupper()
+                and not target.id.startswith("_")
+            )
+    for node in _statements(tree.body):
+        if isinstance(node, ast.Import):
+            outline.imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                package = module.split(".")[:-node.level]
+                base = ".".join(package + ([base] if base else []))
+            # The names may be modules of a package as well
+            outline.imports.append(base)
+            outline.imports.extend(f"{base}.{alias.name}" for alias in node.names)
+    return outline
+
+
+def outline_file(root: str, path: str) -> FileOutline:
+    """Outline one file of a workspace.
+
+    Runs in a worker process, so it takes and returns only plain data.
+
+    Args:
+        root: Workspace directory
+        path: File path relative to the root
+
+    Returns:
+        The outline, empty for files of unknown languages or too large
+    """
+    extension = os.path.splitext(path)[1]
+    if extension != ".py" and extension not in _LANGUAGES:
+        return FileOutline()
+    try:
+        if os.path.getsize(os.path.join(root, path)) > MAX_OUTLINE_FILE_BYTES:
+            return FileOutline()
+        with open(os.path.join(root, path), encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError:
+        return FileOutline()
+    if extension == ".py":
+        module = os.path.splitext(path)[0].replace("/", ".")
+        try:
+            return _outline_python(source, module)
+        except (SyntaxError, ValueError, RecursionError):
+            pass
+    symbols, imports = _LANGUAGES.get(extension, _PYTHON)
+    return FileOutline(
+        symbols=[match.group(0).strip() for match in symbols.finditer(source)],
+        imports=[next(filter(None, match.groups()), "") for match in imports.finditer(source)],
+    )
+
+
+_SOURCE_EXTENSION = re.compile(r"\.(py|[jt]sx?|mjs|go|rs|rb|java|kt|cs|scala|c|h|cc|cpp|hpp)$")
+_PATH_SEPARATORS = re.compile(r"[/\\:]+")
+
+
+def _module_keys(name: str) -> List[str]:
+    """Dotted names a file or import may be known by, longest first."""
+    name = _PATH_SEPARATORS.sub(".", _SOURCE_EXTENSION.sub("", name)).strip(".")
+    if name.endswith(".__init__") or name.endswith(".index") or name.endswith(".mod"):
+        name = name.rsplit(".", 1)[0]
+    parts = name.split(".")
+    return [".".join(parts[i:]) for i in range(len(parts)) if parts[i]]
+
+
+def rank_files(outlines: Dict[str, FileOutline]) -> List[str]:
+    """Order files by how many other files import them.
+
+    Imports are matched to files by the longest trailing part of their
+    dotted path, so "pkg.util", "./pkg/util" and "crate::pkg::util" all
+    find pkg/util. Ties go to outlined files, then shallower ones.
+
+    Args:
+        outlines: Outline of each file, by path
+
+    Returns:
+        The paths, most imported first
+    """
+    by_key: Dict[str, List[str]] = {}
+    for path in outlines:
+        for key in _module_keys(path):
+            by_key.setdefault(key, []).append(path)
+    importers: Dict[str, set] = {path: set() for path in outlines}
+    for path, outline in outlines.items():
+        for name in outline.imports:
+            for key in _module_keys(name):
+                if key in by_key:
+                    for target in by_key[key]:
+                        if target != path:
+                            importers[target].add(path)
+                    break
+    return sorted(outlines, key=lambda path: (
+        -len(importers[path]), not outlines[path].symbols, path.count("/"), path
+    ))
+
+
+class RepoMap:
+    """Ranked outline of a workspace, cached per file by mtime and size."""
+
+    def __init__(self, root: str, workers: Optional[int] = None):
+        """Initialize the map.
+
+        Args:
+            root: Workspace directory
+            workers: Processes outlining files, one per CPU by default
+        """
+        self.root = os.path.abspath(root)
+        self.workers = workers or os.cpu_count() or 1
+        self._outlines: Dict[str, Tuple[Tuple[int, int], FileOutline]] = {}
+        # Ranking of the outlines, until a file changes
+        self._ranked: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    def outlines(self) -> Dict[str, FileOutline]:
+        """Outline every file of the workspace, reusing unchanged outlines.
+
+        Returns:
+            Outline of each file not ignored by .gitignore, by path
+        """
+        versions = {}
+        for path in get_index(self.root).files():
+            try:
+                st = os.stat(os.path.join(self.root, path))
+            except OSError:
+                continue
+            versions[path] = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._outlines
+            stale = [path for path, version in versions.items()
+                     if path not in cached or cached[path][0] != version]
+            fresh = self._outline_all(stale)
+            if fresh or len(versions) != len(cached):
+                self._ranked = None
+            self._outlines = {
+                path: (version, fresh[path] if path in fresh else cached[path][1])
+                for path, version in versions.items()
+            }
+            return {path: outline for path, (_, outline) in self._outlines.items()}
+
+    def _outline_all(self, paths: List[str]) -> Dict[str, FileOutline]:
+        """Outline files, in worker processes when there are enough of them."""
+        if len(paths) < PARALLEL_MIN_FILES or self.workers < 2:
+            return {path: outline_file(self.root, path) for path in paths}
+        # Not forked, as the session has threads running
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            results = pool.map(outline_file, [self.root] * len(paths), paths,
+                               chunksize=max(len(paths) // (self.workers * 4), 1))
+            return dict(zip(paths, results))
+
+    def render(self, max_tokens: int = DEFAULT_MAP_TOKENS) -> str:
+        """Render the map within a token budget.
+
+        Every file's path is listed if the paths fit, most imported first;
+        the rest of the budget goes to the symbols of files in that order.
+        If even the paths don't fit, the top ones are listed and the rest
+        counted.
+
+        Args:
+            max_tokens: Token budget for the map
+
+        Returns:
+            The map
+        """
+        outlines = self.outlines()
+        with self._lock:
+            if self._ranked is None:
+                self._ranked = rank_files(outlines)
+            ranked = self._ranked
+        header = f"{len(ranked)} files, most imported first:"
+        # Room for the line counting the files left out
+        budget = max_tokens - estimate_tokens(header) - 10
+        costs = [estimate_tokens(path) + 1 for path in ranked]
+        shown = len(ranked)
+        if sum(costs) > budget:
+            shown, used = 0, 0
+            while shown < len(ranked) and used + costs[shown] <= budget:
+                used += costs[shown]
+                shown += 1
+        budget -= sum(costs[:shown])
+
+        lines = [header]
+        for path in ranked[:shown]:
+            lines.append(path)
+            for symbol in outlines[path].symbols:
+                cost = estimate_tokens(symbol) + 1
+                if cost > budget:
+                    # Lower ranked files get no symbols once one is dropped
+                    budget = 0
+                    break
+                lines.append("  " + symbol)
+                budget -= cost
+        if shown < len(ranked):
+            lines.append(f"... {len(ranked) - shown} more files")
+        return "\n".join(lines)
+
+
+_maps: Dict[str, RepoMap] = {}
+_maps_lock = threading.Lock()
+
+
+def get_repo_map(root: Optional[str] = None) -> RepoMap:
+    """Get the repository map of a workspace.
+
+    Args:
+        root: Workspace directory, the current directory by default
+
+    Returns:
+        The shared map of that directory
+    """
+    root = os.path.abspath(root or os.getcwd())
+    with _maps_lock:
+        if root not in _maps:
+            _maps[root] = RepoMap(root)
+        return _maps[root]
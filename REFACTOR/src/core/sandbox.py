@@ -3,15 +3,28 @@ Command execution sandbox using macOS seatbelt for security.
 """
 
 import asyncio
+import atexit
+import codecs
 import enum
+import functools
+import hashlib
+import itertools
 import os
 import platform
+import resource
+import secrets
 import shlex
+import shutil
+import signal
+import sys
 import tempfile
+import threading
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
 from rich.console import Console
+from . import landlock
 
 console = Console()
 
@@ -19,6 +32,8 @@ class SandboxType(enum.Enum):
     """Type of sandbox to use."""
     NONE = "none"
     MACOS_SEATBELT = "macos_seatbelt"
+    LINUX_LANDLOCK = "linux_landlock"
+    LINUX_BWRAP = "linux_bwrap"
 
 @dataclass
 class ExecResult:
@@ -27,126 +42,1029 @@ class ExecResult:
     stderr: str
     code: int
     error: Optional[str] = None
+    # Bytes dropped from the middle of each stream to bound memory use
+    stdout_omitted: int = 0
+    stderr_omitted: int = 0
+    # Wall-clock seconds the command ran
+    duration: Optional[float] = None
+    # Peak resident set size in bytes, when it could be measured; in a
+    # shell session it is sampled, so short commands have none
+    peak_rss: Optional[int] = None
+    # Whether the command was killed for exceeding its time limit
+    killed: bool = False
+
+
+@dataclass
+class ResourceLimits:
+    """Resource limits applied to commands with setrlimit."""
+    cpu_seconds: Optional[int] = None
+    memory_bytes: Optional[int] = None
+    
+    def command_prefix(self) -> List[str]:
+        """Command line prefix running a command with the limits applied.
+        
+        A shell sets the limits and execs the command; setting them
+        between fork and exec, as a ``preexec_fn``, isn't safe in a
+        process that runs other threads.
+        
+        Returns:
+            The prefix, empty without limits
+        """
+        limits = []
+        if self.cpu_seconds is not None:
+            limits.append(f"ulimit -t {self.cpu_seconds}")
+        if self.memory_bytes is not None:
+            limits.append(f"ulimit -v {self.memory_bytes // 1024}")
+        if not limits:
+            return []
+        return ["/bin/sh", "-c", " && ".join(limits) + ' && exec "$@"', "sh"]
+
+
+@dataclass
+class OutputChunk:
+    """A piece of command output, delivered while the command runs."""
+    stream: str  # "stdout" or "stderr"
+    text: str
+
+
+# Size of the reads from a command's output pipes
+READ_BLOCK_SIZE = 64 * 1024
+
+# Output kept from the start and the end of each stream; the middle of
+# longer output is counted but not stored
+DEFAULT_HEAD_BYTES = 32 * 1024
+DEFAULT_TAIL_BYTES = 32 * 1024
+
+# Wall-clock limit for a single command, in seconds
+DEFAULT_COMMAND_TIMEOUT = 600.0
+
+# How often a shell session samples the memory of a running command, in
+# seconds; its processes are not our children, so rusage can't tell
+RSS_SAMPLE_INTERVAL = 0.1
+
+
+# Seatbelt profile up to the list of writable paths
+_SEATBELT_PROFILE = """
+(version 1)
+(allow default)
+(deny file-write*)
+(allow file-write*
+    (subpath "/private/tmp")
+    (subpath "/private/var/tmp")
+    (literal "/dev/null")
+    (literal "/dev/zero")
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _detect_sandbox_type() -> SandboxType:
+    """Determine which sandbox implementation to use, warning only once."""
+    system = platform.system()
+    if system == "Darwin":
+        return SandboxType.MACOS_SEATBELT
+    if system == "Linux":
+        # Landlock confines a process at the cost of two system calls;
+        # bubblewrap needs a user and mount namespace per process tree
+        if landlock.abi_version() > 0:
+            return SandboxType.LINUX_LANDLOCK
+        if shutil.which("bwrap"):
+            return SandboxType.LINUX_BWRAP
+    console.print("[yellow]Warning: No sandbox available for this platform. Running without sandbox.[/yellow]")
+    return SandboxType.NONE
+
+
+def _kill_group(pid: int) -> None:
+    """Kill a process and everything it started in its process group."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _max_rss(who: int = resource.RUSAGE_CHILDREN) -> int:
+    """Largest resident set size, by default of any waited-for child, in bytes."""
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _children(pid: int) -> List[int]:
+    """Child processes of a process, read from /proc on Linux."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "rb") as f:
+            return [int(child) for child in f.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+def _descendants_peak_rss(pid: int) -> Optional[int]:
+    """Largest peak resident set size among a process's descendants, in bytes.
+    
+    Processes that have already exited are not seen.
+    
+    Returns:
+        The peak, or None if there are no descendants or /proc is unavailable
+    """
+    peak = None
+    pending = _children(pid)
+    while pending:
+        child = pending.pop()
+        try:
+            with open(f"/proc/{child}/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"VmHWM:"):
+                        rss = int(line.split()[1]) * 1024
+                        peak = rss if peak is None else max(peak, rss)
+                        break
+        except (OSError, ValueError):
+            continue
+        pending += _children(child)
+    return peak
+
+
+async def _sample_peak_rss(pid: int, peaks: List[int]) -> None:
+    """Record the peak memory of a shell's descendants until cancelled."""
+    while True:
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+        rss = _descendants_peak_rss(pid)
+        if rss is not None:
+            peaks.append(rss)
+
+
+class OutputBuffer:
+    """Keeps the first and last bytes of a stream and counts the rest."""
+    
+    def __init__(self, head_bytes: int = DEFAULT_HEAD_BYTES,
+                 tail_bytes: int = DEFAULT_TAIL_BYTES):
+        """Initialize the buffer.
+        
+        Args:
+            head_bytes: Bytes kept from the start of the stream
+            tail_bytes: Bytes kept from the end of the stream
+        """
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        
+    def feed(self, data: bytes) -> None:
+        """Add data read from the stream.
+        
+        Args:
+            data: Bytes read
+        """
+        self.total += len(data)
+        room = self.head_bytes - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data and self.tail_bytes:
+            self._tail += data
+            # Trim in batches so each byte is moved a bounded number of times
+            if len(self._tail) > 2 * self.tail_bytes:
+                del self._tail[:-self.tail_bytes]
+                
+    @property
+    def omitted(self) -> int:
+        """Bytes dropped between head and tail."""
+        return max(self.total - self.head_bytes - self.tail_bytes, 0)
+        
+    def text(self) -> str:
+        """Decode the kept output, marking where bytes were dropped."""
+        tail = self._tail[-self.tail_bytes:] if self.tail_bytes else b""
+        if not self.omitted:
+            return (bytes(self._head) + bytes(tail)).decode(errors="replace")
+        return (self._head.decode(errors="replace")
+                + f"\n... [{self.omitted} bytes omitted] ...\n"
+                + bytes(tail).decode(errors="replace"))
+
+
+class _OutputStreams:
+    """Reads a process's stdout and stderr concurrently as data arrives.
+    
+    With a marker, each stream is read up to the line starting with the
+    marker, which frames one command of a shell session; the rest of that
+    line on stdout is kept as the trailer.
+    """
+    
+    def __init__(self, stdout: asyncio.StreamReader, stderr: asyncio.StreamReader,
+                 head_bytes: int, tail_bytes: int, marker: Optional[bytes] = None):
+        self.buffers = {"stdout": OutputBuffer(head_bytes, tail_bytes),
+                        "stderr": OutputBuffer(head_bytes, tail_bytes)}
+        self.trailer: Optional[bytes] = None
+        self._marker = marker
+        self._started = time.perf_counter()
+        # Bounded, so a slow consumer makes the readers wait instead of
+        # piling up output in memory
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        self._tasks = [asyncio.ensure_future(self._pump(stdout, "stdout")),
+                       asyncio.ensure_future(self._pump(stderr, "stderr"))]
+        
+    async def __aiter__(self) -> AsyncIterator[OutputChunk]:
+        decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+                    for name in self.buffers}
+        open_streams = len(self._tasks)
+        while open_streams:
+            name, data = await self._queue.get()
+            if data is None:
+                open_streams -= 1
+                text = decoders[name].decode(b"", final=True)
+            else:
+                self.buffers[name].feed(data)
+                text = decoders[name].decode(data)
+            if text:
+                yield OutputChunk(stream=name, text=text)
+        # Surface read errors
+        await asyncio.gather(*self._tasks)
+        
+    def result(self, code: int) -> ExecResult:
+        """Build the result from the kept output.
+        
+        Args:
+            code: Exit code of the command
+            
+        Returns:
+            ExecResult of the command
+        """
+        stdout, stderr = self.buffers["stdout"], self.buffers["stderr"]
+        return ExecResult(stdout=stdout.text(), stderr=stderr.text(), code=code,
+                          stdout_omitted=stdout.omitted, stderr_omitted=stderr.omitted,
+                          duration=time.perf_counter() - self._started)
+                          
+    def cancel(self) -> None:
+        """Stop reading."""
+        for task in self._tasks:
+            task.cancel()
+            
+    async def _pump(self, stream: asyncio.StreamReader, name: str) -> None:
+        try:
+            if self._marker is None:
+                while True:
+                    block = await stream.read(READ_BLOCK_SIZE)
+                    if not block:
+                        break
+                    await self._queue.put((name, block))
+            else:
+                trailer = await self._pump_frame(stream, name)
+                if name == "stdout":
+                    self.trailer = trailer
+        except Exception:
+            # Let the consumer finish, it re-raises from the task
+            await self._queue.put((name, None))
+            raise
+        await self._queue.put((name, None))
+        
+    async def _pump_frame(self, stream: asyncio.StreamReader, name: str) -> Optional[bytes]:
+        """Pass data on up to the marker line and return the rest of it."""
+        marker = self._marker
+        pending = bytearray()
+        while True:
+            index = pending.find(marker)
+            if index != -1:
+                end = pending.find(b"\n", index + len(marker))
+                if end != -1:
+                    if index:
+                        await self._queue.put((name, bytes(pending[:index])))
+                    return bytes(pending[index + len(marker):end])
+            else:
+                # Hold back only what could be the start of a split marker;
+                # the marker begins with the only newline it contains
+                safe = pending.rfind(b"\n", max(len(pending) - len(marker) + 1, 0))
+                if safe == -1 or not marker.startswith(pending[safe:]):
+                    safe = len(pending)
+                if safe > 0:
+                    await self._queue.put((name, bytes(pending[:safe])))
+                    del pending[:safe]
+            block = await stream.read(READ_BLOCK_SIZE)
+            if not block:
+                if pending:
+                    await self._queue.put((name, bytes(pending)))
+                return None
+            pending += block
+
+
+class ShellSession:
+    """A long-lived shell that runs commands one after another.
+    
+    Commands are sent to the shell's stdin and framed by a sentinel line
+    the shell prints after each command, carrying its exit code and the
+    working directory. State such as the working directory and exported
+    variables carries over between commands, and no process is spawned per
+    command.
+    """
+    
+    def __init__(self, argv: List[str], cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None,
+                 pass_fds: Sequence[int] = ()):
+        """Initialize the session.
+        
+        Args:
+            argv: Command line that starts a shell reading from stdin
+            cwd: Initial working directory
+            env: Environment of the shell
+            pass_fds: Descriptors the shell inherits, e.g. a Landlock
+                ruleset its command line applies
+        """
+        self.argv = argv
+        self.env = env
+        self.cwd = cwd
+        self.pass_fds = tuple(pass_fds)
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        # Loop the shell was started in; its pipes only work there
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._token = secrets.token_hex(8)
+        self._counter = itertools.count()
+        
+    @property
+    def is_alive(self) -> bool:
+        """Whether the shell is running and usable from the current loop."""
+        if self._proc is None or self._proc.returncode is not None:
+            return False
+        try:
+            return self._loop is asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+            
+    async def start(self) -> None:
+        """Start the shell.
+        
+        Raises:
+            OSError: If the shell cannot be started
+        """
+        self.kill()
+        self._proc = await asyncio.create_subprocess_exec(
+            *self.argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env,
+            # Own process group, so a command can be killed with all its children
+            start_new_session=True,
+            pass_fds=self.pass_fds
+        )
+        self._loop = asyncio.get_running_loop()
+        
+    async def ensure_started(self) -> None:
+        """Start the shell unless it is running already."""
+        async with self._get_lock():
+            if not self.is_alive:
+                await self.start()
+                
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None or self._lock_loop is not asyncio.get_running_loop():
+            # A lock is bound to the loop it was first used in. The shell
+            # stays tied to its own loop, so is_alive is false here and
+            # the shell is restarted in this one.
+            self._lock = asyncio.Lock()
+            self._lock_loop = asyncio.get_running_loop()
+        return self._lock
+        
+    async def run_stream(self, command: str, cwd: Optional[str] = None,
+                         head_bytes: int = DEFAULT_HEAD_BYTES,
+                         tail_bytes: int = DEFAULT_TAIL_BYTES,
+                         timeout: Optional[float] = None,
+                         isolated: bool = False
+                         ) -> AsyncIterator[Union[OutputChunk, ExecResult]]:
+        """Run a command in the session, starting the shell if needed.
+        
+        A command that runs out of time is killed together with the shell,
+        which is restarted in the last known directory for the next command.
+        
+        Args:
+            command: Command to run
+            cwd: Directory to change to before running it
+            head_bytes: Bytes kept from the start of each output stream
+            tail_bytes: Bytes kept from the end of each output stream
+            timeout: Wall-clock limit in seconds
+            isolated: Run the command in a subshell, so it cannot change
+                the session's state
+            
+        Yields:
+            OutputChunks as output arrives, then the ExecResult
+            
+        Raises:
+            OSError: If the shell cannot be started or written to
+        """
+        async with self._get_lock():
+            if not self.is_alive:
+                await self.start()
+            sentinel = f"__codex_{self._token}_{next(self._counter)}__"
+            script = f"cd -- {shlex.quote(cwd)} && " if cwd else ""
+            script += f"eval {shlex.quote(command)}"
+            if isolated:
+                script = f"( {script} )"
+            # stdin is the command channel, keep commands from reading it
+            script += (
+                f" </dev/null\n"
+                f"__codex_rc=$?\n"
+                f"printf '\\n%s %d %s\\n' {sentinel} \"$__codex_rc\" \"$PWD\"\n"
+                f"printf '\\n%s\\n' {sentinel} >&2\n"
+            )
+            self._proc.stdin.write(script.encode())
+            await self._proc.stdin.drain()
+            
+            streams = _OutputStreams(self._proc.stdout, self._proc.stderr,
+                                     head_bytes, tail_bytes, f"\n{sentinel}".encode())
+            killed = []
+            timer = None
+            if timeout is not None:
+                pid = self._proc.pid
+                timer = self._loop.call_later(
+                    max(timeout, 0), lambda: (killed.append(True), _kill_group(pid))
+                )
+            # Sampled, so processes shorter than the interval are missed
+            peaks: List[int] = []
+            sampler = None
+            if sys.platform.startswith("linux"):
+                sampler = asyncio.ensure_future(_sample_peak_rss(self._proc.pid, peaks))
+            completed = False
+            try:
+                async for chunk in streams:
+                    yield chunk
+                if streams.trailer is None:
+                    # The command ended the shell, e.g. with exit, or was killed
+                    code = await self._proc.wait()
+                    self._proc = None
+                else:
+                    code, _, cwd = streams.trailer.decode(errors="replace").strip().partition(" ")
+                    code = int(code)
+                    self.cwd = cwd or self.cwd
+                completed = True
+                result = streams.result(code)
+                result.killed = bool(killed)
+                result.peak_rss = max(peaks, default=None)
+                yield result
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                if sampler is not None:
+                    sampler.cancel()
+                streams.cancel()
+                if not completed:
+                    # The rest of the abandoned command's output would
+                    # end up in the next command's frame
+                    self.kill()
+                    
+    async def run(self, command: str, cwd: Optional[str] = None,
+                  timeout: Optional[float] = None) -> ExecResult:
+        """Run a command in the session and wait for its result.
+        
+        Args:
+            command: Command to run
+            cwd: Directory to change to before running it
+            timeout: Wall-clock limit in seconds
+            
+        Returns:
+            ExecResult of the command
+        """
+        async for item in self.run_stream(command, cwd=cwd, timeout=timeout):
+            if isinstance(item, ExecResult):
+                return item
+                
+    async def aclose(self) -> None:
+        """Stop the shell."""
+        if self.is_alive:
+            self._proc.stdin.close()
+            try:
+                await asyncio.wait_for(self._proc.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                _kill_group(self._proc.pid)
+                await self._proc.wait()
+        else:
+            self.kill()
+        self._proc = None
+        
+    def kill(self) -> None:
+        """Kill the shell without waiting for it.
+        
+        Also used for a shell left behind by an event loop that has ended.
+        """
+        if self._proc is not None and self._proc.returncode is None:
+            _kill_group(self._proc.pid)
+        self._proc = None
+
+
+class ShellPool:
+    """Pre-started shell sessions that run independent commands.
+    
+    Starting a confined process is the expensive part of running a
+    command in a sandbox. A pool keeps workers that are already confined
+    and waiting for commands on their stdin; each command runs in a
+    subshell of an idle worker, so commands start from the same state as
+    a new process would without paying for the setup.
+    """
+    
+    def __init__(self, size: int, argv: List[str], cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None,
+                 pass_fds: Sequence[int] = ()):
+        """Initialize the pool.
+        
+        Args:
+            size: Number of workers
+            argv: Command line that starts a shell reading from stdin
+            cwd: Working directory of the workers
+            env: Environment of the workers
+            pass_fds: Descriptors each worker inherits
+        """
+        self.env = env
+        self.workers = [ShellSession(argv, cwd=cwd, env=env, pass_fds=pass_fds)
+                        for _ in range(size)]
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+    async def start(self) -> None:
+        """Start every worker that is not running.
+        
+        Raises:
+            OSError: If a worker cannot be started
+        """
+        await asyncio.gather(*(worker.ensure_started() for worker in self.workers))
+        
+    async def run_stream(self, command: str, cwd: Optional[str] = None,
+                         head_bytes: int = DEFAULT_HEAD_BYTES,
+                         tail_bytes: int = DEFAULT_TAIL_BYTES,
+                         timeout: Optional[float] = None
+                         ) -> AsyncIterator[Union[OutputChunk, ExecResult]]:
+        """Run a command on an idle worker.
+        
+        Args:
+            command: Command to run
+            cwd: Working directory of the command
+            head_bytes: Bytes kept from the start of each output stream
+            tail_bytes: Bytes kept from the end of each output stream
+            timeout: Wall-clock limit in seconds
+            
+        Yields:
+            OutputChunks as output arrives, then the ExecResult
+            
+        Raises:
+            OSError: If the worker cannot be started or written to
+        """
+        idle = self._get_idle()
+        worker = await idle.get()
+        try:
+            async for item in worker.run_stream(command, cwd=cwd, head_bytes=head_bytes,
+                                                tail_bytes=tail_bytes, timeout=timeout,
+                                                isolated=True):
+                yield item
+        finally:
+            if not worker.is_alive:
+                # Replace a killed worker before it is needed again
+                asyncio.ensure_future(worker.ensure_started()).add_done_callback(
+                    lambda task: task.cancelled() or task.exception()
+                )
+            idle.put_nowait(worker)
+            
+    def _get_idle(self) -> asyncio.Queue:
+        if self._idle is None or self._loop is not asyncio.get_running_loop():
+            self._idle = asyncio.Queue()
+            self._loop = asyncio.get_running_loop()
+            for worker in self.workers:
+                self._idle.put_nowait(worker)
+        return self._idle
+        
+    async def aclose(self) -> None:
+        """Stop all workers."""
+        await asyncio.gather(*(worker.aclose() for worker in self.workers))
+        
+    def kill(self) -> None:
+        """Kill all workers without waiting for them."""
+        for worker in self.workers:
+            worker.kill()
+
+
+class PolicyCache:
+    """Sandbox policies compiled once per set of writable paths.
+    
+    Seatbelt profiles are written to a directory private to this process,
+    named by the hash of their content, and Landlock rulesets are kept
+    open, so starting a command only looks up a ready policy. Everything
+    is released when the process exits.
+    """
+    
+    def __init__(self):
+        self._dir: Optional[str] = None
+        self._profiles: Dict[Tuple[str, ...], str] = {}
+        self._rulesets: Dict[Tuple[str, ...], landlock.WriteRuleset] = {}
+        self._bwrap: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        
+    @staticmethod
+    def _resolve(writable_paths: List[str]) -> Tuple[str, ...]:
+        """Canonical form of a set of writable paths."""
+        return tuple(sorted({str(Path(path).resolve()) for path in writable_paths}))
+        
+    def _register_cleanup(self) -> None:
+        if not self._atexit_registered:
+            atexit.register(self.close)
+            self._atexit_registered = True
+            
+    def seatbelt_profile(self, writable_paths: List[str]) -> str:
+        """Get a seatbelt profile allowing writes beneath the given paths.
+        
+        Args:
+            writable_paths: Paths that should be writable
+            
+        Returns:
+            Path to the profile file
+        """
+        key = tuple(writable_paths)
+        with self._lock:
+            profile_path = self._profiles.get(key)
+            if profile_path is not None:
+                return profile_path
+            profile = _SEATBELT_PROFILE + "".join(
+                f'    (subpath "{path}")\n' for path in self._resolve(writable_paths)
+            ) + ")\n"
+            digest = hashlib.sha256(profile.encode()).hexdigest()[:16]
+            if self._dir is None:
+                self._dir = tempfile.mkdtemp(prefix="sandbox-policies-")
+                self._register_cleanup()
+            profile_path = os.path.join(self._dir, f"{digest}.sb")
+            if not os.path.exists(profile_path):
+                # Written under a temporary name so a profile is never seen half-written
+                temp_path = f"{profile_path}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    f.write(profile)
+                os.replace(temp_path, profile_path)
+            self._profiles[key] = profile_path
+            return profile_path
+            
+    def landlock_ruleset(self, writable_paths: List[str]) -> landlock.WriteRuleset:
+        """Get a Landlock ruleset allowing writes beneath the given paths.
+        
+        Args:
+            writable_paths: Paths that should be writable
+            
+        Returns:
+            The ruleset, owned by the cache
+            
+        Raises:
+            OSError: If the ruleset cannot be built
+        """
+        key = tuple(writable_paths)
+        with self._lock:
+            ruleset = self._rulesets.get(key)
+            if ruleset is None:
+                resolved = self._resolve(writable_paths)
+                # Different spellings of the same paths share one ruleset
+                ruleset = next((r for k, r in self._rulesets.items()
+                                if self._resolve(list(k)) == resolved), None)
+                if ruleset is None:
+                    ruleset = landlock.WriteRuleset(resolved)
+                    self._register_cleanup()
+                self._rulesets[key] = ruleset
+            return ruleset
+            
+    def bwrap_prefix(self, writable_paths: List[str]) -> List[str]:
+        """Command line prefix running a command under bubblewrap.
+        
+        The whole file system is mounted read-only in a new mount
+        namespace, with the writable paths bound read-write on top.
+        
+        Args:
+            writable_paths: Paths that should be writable
+            
+        Returns:
+            The prefix, ending with ``--``
+        """
+        key = tuple(writable_paths)
+        with self._lock:
+            prefix = self._bwrap.get(key)
+            if prefix is None:
+                argv = ["bwrap", "--ro-bind", "/", "/", "--dev", "/dev", "--die-with-parent"]
+                for path in ("/tmp", "/var/tmp") + self._resolve(writable_paths):
+                    if os.path.exists(path):
+                        argv += ["--bind", path, path]
+                prefix = self._bwrap[key] = tuple(argv + ["--"])
+            return list(prefix)
+            
+    def close(self) -> None:
+        """Remove the profile files and release the rulesets."""
+        with self._lock:
+            for ruleset in set(self._rulesets.values()):
+                ruleset.close()
+            self._rulesets.clear()
+            self._profiles.clear()
+            self._bwrap.clear()
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+                self._dir = None
+                
+                
+# Shared by all sandboxes, so recreating one for a new context doesn't
+# compile its policy again
+default_policy_cache = PolicyCache()
+
 
 class Sandbox:
     """Command execution sandbox."""
     
-    def __init__(self, writable_paths: List[str] = None):
+    def __init__(self, writable_paths: List[str] = None, persistent: bool = False,
+                 head_bytes: int = DEFAULT_HEAD_BYTES,
+                 tail_bytes: int = DEFAULT_TAIL_BYTES,
+                 on_output: Optional[Callable[[OutputChunk], None]] = None,
+                 timeout: Optional[float] = DEFAULT_COMMAND_TIMEOUT,
+                 limits: Optional[ResourceLimits] = None,
+                 pool_size: int = 0,
+                 sandbox_type: Optional[SandboxType] = None,
+                 policies: Optional[PolicyCache] = None):
         """Initialize the sandbox.
         
         Args:
             writable_paths: List of paths that should be writable within the sandbox
+            persistent: Run commands in one long-lived shell session, so
+                the working directory and exported variables carry over
+                between commands. Commands fall back to a one-shot shell
+                when they need a different environment or the session
+                cannot be used.
+            head_bytes: Bytes of each output stream kept from its start
+            tail_bytes: Bytes of each output stream kept from its end
+            on_output: Called with each OutputChunk while ``exec`` runs
+            timeout: Default wall-clock limit per command in seconds; a
+                command running longer is killed with its process group
+            limits: CPU and memory limits applied to commands
+            pool_size: Without ``persistent``, run commands on this many
+                pre-started, already confined shells instead of starting a
+                new process for each command. Each command runs in a
+                subshell, so commands don't share state.
+            sandbox_type: Backend to use instead of the detected one
+            policies: Cache of compiled policies, shared by default
         """
         self.writable_paths = writable_paths or []
-        self.sandbox_type = self._get_sandbox_type()
+        self.sandbox_type = sandbox_type or self._get_sandbox_type()
+        self.persistent = persistent
+        self.pool_size = pool_size
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.on_output = on_output
+        self.timeout = timeout
+        self.limits = limits
+        self.policies = policies or default_policy_cache
+        # time.monotonic() by which every command must have finished, e.g.
+        # the end of the agent turn it belongs to
+        self.deadline: Optional[float] = None
+        self._session: Optional[ShellSession] = None
+        self._pool: Optional[ShellPool] = None
         
     def _get_sandbox_type(self) -> SandboxType:
         """Determine which sandbox implementation to use."""
-        if platform.system() == "Darwin":
-            return SandboxType.MACOS_SEATBELT
-        console.print("[yellow]Warning: No sandbox available for this platform. Running without sandbox.[/yellow]")
-        return SandboxType.NONE
+        return _detect_sandbox_type()
         
-    def _create_seatbelt_profile(self, writable_paths: List[str]) -> str:
-        """Create a seatbelt sandbox profile.
+    @property
+    def cwd(self) -> Optional[str]:
+        """Working directory of the shell session, if one is running."""
+        return self._session.cwd if self._session else None
+        
+    def _shell_argv(self, argv: List[str]) -> List[str]:
+        """Wrap a shell command line for the sandbox backend and limits.
+        
+        Confinement and limits are applied by wrappers the command line
+        execs, since this process runs other threads and can't safely
+        run Python code between fork and exec.
         
         Args:
-            writable_paths: List of paths that should be writable
+            argv: Command line starting the shell
             
         Returns:
-            Path to the created profile file
+            The command line to run, with the descriptors from
+            ``_pass_fds`` passed to it
         """
-        profile = """
-(version 1)
-(allow default)
-(deny file-write*)
-(allow file-write*
-    (subpath "/private/tmp")
-    (subpath "/private/var/tmp")
-    (literal "/dev/null")
-    (literal "/dev/zero")
-"""
+        if self.limits:
+            argv = self.limits.command_prefix() + argv
+        if self.sandbox_type == SandboxType.LINUX_LANDLOCK:
+            # Built once per set of paths and inherited by the wrapper
+            return self.policies.landlock_ruleset(self.writable_paths).command_prefix() + argv
+        if self.sandbox_type == SandboxType.MACOS_SEATBELT:
+            profile_path = self.policies.seatbelt_profile(self.writable_paths)
+            return ["sandbox-exec", "-f", profile_path] + argv
+        if self.sandbox_type == SandboxType.LINUX_BWRAP:
+            return self.policies.bwrap_prefix(self.writable_paths) + argv
+        return argv
         
-        # Add writable paths
-        for path in writable_paths:
-            abs_path = str(Path(path).resolve())
-            profile += f'    (subpath "{abs_path}")\n'
-            
-        profile += ")\n"
+    def _pass_fds(self) -> Tuple[int, ...]:
+        """Descriptors the command line from ``_shell_argv`` needs."""
+        if self.sandbox_type == SandboxType.LINUX_LANDLOCK:
+            return (self.policies.landlock_ruleset(self.writable_paths).fd,)
+        return ()
+        
+    async def warm_up(self, cwd: Optional[str] = None,
+                      env: Optional[Dict[str, str]] = None) -> None:
+        """Start the shell session or worker pool before the first command.
         
-        # Write profile to temp file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.sb', delete=False) as f:
-            f.write(profile)
-            return f.name
+        Args:
+            cwd: Working directory the first commands will use
+            env: Environment the commands will use
+        """
+        try:
+            if self.persistent:
+                session = self._get_session(cwd, env)
+                if session is not None:
+                    await session.ensure_started()
+            elif self.pool_size:
+                pool = self._get_pool(env)
+                if pool is not None:
+                    await pool.start()
+        except OSError:
+            # The first command reports the problem and falls back
+            pass
             
     async def exec(self, 
                    command: str,
                    cwd: Optional[str] = None,
-                   env: Optional[Dict[str, str]] = None) -> ExecResult:
+                   env: Optional[Dict[str, str]] = None,
+                   timeout: Optional[float] = None) -> ExecResult:
         """Execute a command in the sandbox.
         
+        Output is passed to ``on_output`` as it arrives.
+        
         Args:
             command: Command to execute
             cwd: Working directory for the command
             env: Environment variables for the command
+            timeout: Wall-clock limit in seconds, instead of the default
             
         Returns:
             ExecResult containing stdout, stderr, and exit code
         """
-        try:
-            if self.sandbox_type == SandboxType.MACOS_SEATBELT:
-                # Create sandbox profile
-                profile_path = self._create_seatbelt_profile(self.writable_paths)
-                
-                # Wrap command in sandbox-exec
-                sandbox_cmd = [
-                    "sandbox-exec",
-                    "-f", profile_path,
-                    "/bin/sh", "-c", command
-                ]
-                
-                # Run command
-                proc = await asyncio.create_subprocess_exec(
-                    *sandbox_cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                    cwd=cwd,
-                    env=env
-                )
-                
-                # Get output
-                stdout, stderr = await proc.communicate()
-                
-                # Clean up profile
-                os.unlink(profile_path)
-                
-                return ExecResult(
-                    stdout=stdout.decode(),
-                    stderr=stderr.decode(),
-                    code=proc.returncode
-                )
-                
-            else:
-                # No sandbox, run directly
-                proc = await asyncio.create_subprocess_exec(
-                    "/bin/sh", "-c", command,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                    cwd=cwd,
-                    env=env
-                )
-                
-                stdout, stderr = await proc.communicate()
-                return ExecResult(
-                    stdout=stdout.decode(),
-                    stderr=stderr.decode(),
-                    code=proc.returncode
-                )
+        async for item in self.exec_stream(command, cwd=cwd, env=env, timeout=timeout):
+            if isinstance(item, ExecResult):
+                return item
+            if self.on_output is not None:
+                self.on_output(item)
                 
+    async def exec_stream(self,
+                          command: str,
+                          cwd: Optional[str] = None,
+                          env: Optional[Dict[str, str]] = None,
+                          timeout: Optional[float] = None
+                          ) -> AsyncIterator[Union[OutputChunk, ExecResult]]:
+        """Execute a command in the sandbox, streaming its output.
+        
+        Output is read incrementally and only the first ``head_bytes`` and
+        last ``tail_bytes`` of each stream are kept for the result. The
+        command is killed with its process group when it runs out of time
+        or the caller stops iterating.
+        
+        Args:
+            command: Command to execute
+            cwd: Working directory for the command
+            env: Environment variables for the command
+            timeout: Wall-clock limit in seconds, instead of the default
+            
+        Yields:
+            OutputChunks as output arrives, then the ExecResult
+        """
+        timeout = self._effective_timeout(timeout)
+        if self.persistent:
+            session = self._get_session(cwd, env)
+            if session is not None:
+                try:
+                    async for item in session.run_stream(command, cwd=cwd,
+                                                         head_bytes=self.head_bytes,
+                                                         tail_bytes=self.tail_bytes,
+                                                         timeout=timeout):
+                        yield item
+                    return
+                except OSError as e:
+                    # Raised before any output, when starting or writing to the shell
+                    console.print(f"[yellow]Shell session failed ({e}), running commands one at a time.[/yellow]")
+                    self.persistent = False
+                    await self.aclose()
+        elif self.pool_size:
+            pool = self._get_pool(env)
+            if pool is not None:
+                try:
+                    async for item in pool.run_stream(command, cwd=cwd,
+                                                      head_bytes=self.head_bytes,
+                                                      tail_bytes=self.tail_bytes,
+                                                      timeout=timeout):
+                        yield item
+                    return
+                except OSError as e:
+                    console.print(f"[yellow]Shell pool failed ({e}), running commands one at a time.[/yellow]")
+                    self.pool_size = 0
+                    await self.aclose()
+                    
+        async for item in self._exec_one_shot(command, cwd, env, timeout):
+            yield item
+            
+    def _effective_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        """Combine a command's timeout with the default and the deadline."""
+        if timeout is None:
+            timeout = self.timeout
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+        
+    async def _exec_one_shot(self, command: str, cwd: Optional[str],
+                             env: Optional[Dict[str, str]], timeout: Optional[float]
+                             ) -> AsyncIterator[Union[OutputChunk, ExecResult]]:
+        """Run a command in a new shell process."""
+        rss_before = _max_rss()
+        try:
+            argv = self._shell_argv(["/bin/sh", "-c", command])
+            proc = await asyncio.create_subprocess_exec(
+                *argv,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                # Own process group, so the command can be killed with
+                # all its children
+                start_new_session=True,
+                pass_fds=self._pass_fds()
+            )
         except Exception as e:
-            return ExecResult(
-                stdout="",
-                stderr=str(e),
-                code=1,
-                error=str(e)
+            yield ExecResult(stdout="", stderr=str(e), code=1, error=str(e))
+            return
+            
+        streams = _OutputStreams(proc.stdout, proc.stderr, self.head_bytes, self.tail_bytes)
+        killed = []
+        timer = None
+        if timeout is not None:
+            timer = asyncio.get_running_loop().call_later(
+                max(timeout, 0), lambda: (killed.append(True), _kill_group(proc.pid))
             )
+        try:
+            async for chunk in streams:
+                yield chunk
+            result = streams.result(await proc.wait())
+            result.killed = bool(killed)
+            # The high-water mark over all children only moves when this
+            # command set a new peak
+            rss_after = _max_rss()
+            if rss_after > rss_before:
+                result.peak_rss = rss_after
+            yield result
+        finally:
+            if timer is not None:
+                timer.cancel()
+            streams.cancel()
+            if proc.returncode is None:
+                _kill_group(proc.pid)
+                
+    def _get_session(self, cwd: Optional[str],
+                     env: Optional[Dict[str, str]]) -> Optional[ShellSession]:
+        """Get the shell session for a command.
+        
+        Args:
+            cwd: Working directory of the command
+            env: Environment of the command
+            
+        Returns:
+            The session, or None if the command needs a different
+            environment than the running session has
+        """
+        if self._session is None:
+            argv = self._long_lived_shell()
+            self._session = ShellSession(argv, cwd=cwd, env=dict(env) if env is not None else None,
+                                         pass_fds=self._pass_fds())
+        elif env is not None and env != self._session.env:
+            return None
+        return self._session
+        
+    def _get_pool(self, env: Optional[Dict[str, str]]) -> Optional[ShellPool]:
+        """Get the worker pool for a command.
+        
+        Args:
+            env: Environment of the command
+            
+        Returns:
+            The pool, or None if the command needs a different environment
+            than the pool's workers have
+        """
+        if self._pool is None:
+            self._pool = ShellPool(self.pool_size, self._long_lived_shell(),
+                                   env=dict(env) if env is not None else None,
+                                   pass_fds=self._pass_fds())
+        elif env is not None and env != self._pool.env:
+            return None
+        return self._pool
+        
+    def _long_lived_shell(self) -> List[str]:
+        """Command line for a shell reading commands from stdin."""
+        return self._shell_argv(["/bin/sh"])
+        
+    async def aclose(self) -> None:
+        """Stop the shell session and worker pool, if running."""
+        if self._session is not None:
+            await self._session.aclose()
+        if self._pool is not None:
+            await self._pool.aclose()
+        self.close()
+        
+    def close(self) -> None:
+        """Kill the shell session and workers without waiting."""
+        if self._session is not None:
+            self._session.kill()
+            self._session = None
+        if self._pool is not None:
+            self._pool.kill()
+            self._pool = None
@@ -0,0 +1,615 @@
+"""
+Workspace search for the search tool.
+Keeps the list of files in a workspace, honoring .gitignore, with a
+trigram signature of each file's contents, so a query only reads the
+files that can contain its literal text.
+"""
+
+import fnmatch
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from .filecache import default_file_cache
+
+# Bits in a file's trigram signature; about a quarter are set for a
+# typical source file
+SIGNATURE_BITS = 2048
+# Larger files are not indexed and are read by every content query
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+# A NUL byte in this much of the start of a file marks it as binary
+BINARY_SNIFF_BYTES = 8 * 1024
+DEFAULT_MAX_RESULTS = 200
+MAX_LINE_CHARS = 200
+# A query older than this after the last refresh starts a new one
+REFRESH_INTERVAL = 5.0
+INDEX_WORKERS = 4
+# Trigram signatures of this many distinct words are kept for reuse
+MAX_CACHED_WORDS = 200_000
+
+_WORDS = re.compile(rb"\w{3,}")
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                out.append(re.escape("["))
+                i += 1
+                continue
+            chars = pattern[i + 1:end].replace("\\", "\\\\")
+            if chars[0] in "!^":
+                chars = "^" + chars[1:]
+            out.append(f"[{chars}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+@dataclass(frozen=True)
+class IgnoreRule:
+    """One pattern of a .gitignore file."""
+    # Directory of the .gitignore, relative to the workspace root
+    base: str
+    regex: "re.Pattern[str]"
+    negate: bool
+    dir_only: bool
+    # For a .gitignore above the workspace, the root relative to its directory
+    outer: str = ""
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        """Check whether the rule matches a path relative to the root."""
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not path.startswith(self.base + "/"):
+                return False
+            path = path[len(self.base) + 1:]
+        elif self.outer:
+            path = f"{self.outer}/{path}"
+        return self.regex.fullmatch(path) is not None
+
+
+def parse_ignore_file(path: str, base: str = "", outer: str = "") -> List[IgnoreRule]:
+    """Read the rules of a .gitignore file.
+
+    Args:
+        path: Path to the file
+        base: Directory the rules apply to, relative to the workspace root
+        outer: For a file above the workspace, the workspace root relative
+            to the file's directory
+
+    Returns:
+        The rules in file order, or none if the file can't be read
+    """
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith(("\\#", "\\!")):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but at the end anchors the pattern to its directory
+        anchored = "/" in line
+        regex = _glob_to_regex(line.lstrip("/"))
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        rules.append(IgnoreRule(base, re.compile(regex, re.S), negate, dir_only, outer))
+    return rules
+
+
+def outer_ignore_rules(root: str) -> Tuple[IgnoreRule, ...]:
+    """Read the ignore rules a repository applies from above a workspace.
+
+    These are the repository's .git/info/exclude and the .gitignore files
+    from the repository root down to the workspace's parent directory.
+
+    Args:
+        root: Workspace directory
+
+    Returns:
+        The rules, outermost first; none if the workspace is in no repository
+    """
+    above = []
+    directory = root
+    while not os.path.exists(os.path.join(directory, ".git")):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return ()
+        directory = parent
+        above.append(directory)
+    repository = directory
+
+    def outer(directory: str) -> str:
+        return os.path.relpath(root, directory).replace(os.sep, "/") if directory != root else ""
+
+    rules = parse_ignore_file(os.path.join(repository, ".git", "info", "exclude"),
+                              outer=outer(repository))
+    for directory in reversed(above):
+        rules += parse_ignore_file(os.path.join(directory, ".gitignore"), outer=outer(directory))
+    return tuple(rules)
+
+
+def is_ignored(rules: Tuple[IgnoreRule, ...], path: str, is_dir: bool) -> bool:
+    """Check a path against rules; the last matching rule decides.
+
+    Args:
+        rules: Rules of the .gitignore files above the path, outermost first
+        path: Path relative to the workspace root
+        is_dir: Whether the path is a directory
+
+    Returns:
+        True if the path is ignored
+    """
+    ignored = False
+    for rule in rules:
+        if rule.negate == ignored and rule.matches(path, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+@dataclass
+class FileEntry:
+    """What the index knows about one file."""
+    mtime_ns: int
+    size: int
+    binary: bool = False
+    # None if the file was too large to index
+    signature: Optional[int] = None
+
+
+def _literals(pattern: str) -> Optional[List[str]]:
+    """Find literal text every match of a regular expression contains.
+
+    Returns:
+        The literals, or None if the pattern has alternatives, which
+        would need any one of several sets of literals
+    """
+    if "|" in pattern:
+        return None
+    literals, current = [], []
+    depth = 0
+    i = 0
+
+    def flush() -> None:
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            escaped = pattern[i + 1:i + 2]
+            i += 2
+            if depth or not escaped or escaped.isalnum():
+                # A class like \w, a backreference, an anchor or a code
+                # like \x41, whose digits aren't literal either
+                flush()
+                if escaped == "N":
+                    close = pattern.find("}", i)
+                    i = len(pattern) if close < 0 else close + 1
+                elif escaped and escaped in "xuU":
+                    i += {"x": 2, "u": 4, "U": 8}[escaped]
+                elif escaped.isdigit():
+                    while i < len(pattern) and pattern[i].isdigit():
+                        i += 1
+            else:
+                current.append(escaped)
+            continue
+        if c == "[":
+            end = i + 1
+            if pattern[end:end + 1] == "^":
+                end += 1
+            end = pattern.find("]", end + 1)
+            i = len(pattern) if end < 0 else end + 1
+            flush()
+            continue
+        i += 1
+        if c == "(":
+            depth += 1
+            flush()
+        elif c == ")":
+            depth = max(depth - 1, 0)
+        elif depth:
+            continue
+        elif c in "*?{":
+            # The previous character is optional
+            if current:
+                current.pop()
+            flush()
+            if c == "{":
+                close = pattern.find("}", i)
+                i = len(pattern) if close < 0 else close + 1
+        elif c in ".^$+":
+            flush()
+        else:
+            current.append(c)
+    flush()
+    return literals
+
+
+class SearchIndex:
+    """File list and content index of one workspace.
+
+    The index is built on a thread pool and refreshed by comparing
+    modification times and sizes, so only changed files are read again.
+    Queries use whatever the index knows and start a refresh in the
+    background once it is older than REFRESH_INTERVAL; candidates are read
+    from disk, so results never show stale content. After a command that
+    may have changed any file, the index is invalidated and the next query
+    waits for a refresh, so it sees the command's changes.
+    """
+
+    def __init__(self, root: str, workers: int = INDEX_WORKERS):
+        """Initialize the index.
+
+        Args:
+            root: Workspace directory
+            workers: Threads reading files while indexing
+        """
+        self.root = os.path.abspath(root)
+        self.workers = workers
+        self._entries: Dict[str, FileEntry] = {}
+        # Rules in effect for each directory walked, by relative path
+        self._dir_rules: Dict[str, Tuple[IgnoreRule, ...]] = {}
+        self._word_bits: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self._refresh: Optional[Future] = None
+        self._refreshed_at: Optional[float] = None
+        # time.monotonic() of the last invalidate()
+        self._invalidated_at: Optional[float] = None
+
+    def start(self) -> Future:
+        """Build or refresh the index in the background.
+
+        Returns:
+            Future of the refresh; a refresh already running is reused
+        """
+        with self._lock:
+            if self._refresh is None or self._refresh.done():
+                self._refresh = Future()
+                # A daemon thread, so a build of a large workspace never
+                # holds up exiting
+                threading.Thread(target=self._run_refresh, args=(self._refresh,),
+                                 name="search-index", daemon=True).start()
+            return self._refresh
+
+    def _run_refresh(self, future: Future) -> None:
+        """Refresh on the background thread and report to the future."""
+        future.set_running_or_notify_cancel()
+        try:
+            self.refresh()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    def wait(self) -> None:
+        """Wait for the background refresh, if one is running."""
+        refresh = self._refresh
+        if refresh is not None:
+            refresh.result()
+
+    def refresh(self) -> None:
+        """Walk the workspace and index new and changed files."""
+        started = time.monotonic()
+        found: Dict[str, os.stat_result] = {}
+        dir_rules: Dict[str, Tuple[IgnoreRule, ...]] = {}
+        self._walk("", outer_ignore_rules(self.root), found, dir_rules)
+
+        old = self._entries
+        changed = [
+            (path, st) for path, st in found.items()
+            if path not in old or (old[path].mtime_ns, old[path].size) != (st.st_mtime_ns, st.st_size)
+        ]
+        entries = {path: old[path] for path in found if path in old}
+        if len(changed) > 1 and self.workers > 1:
+            # Reading releases the GIL, so threads overlap waiting for the disk
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix="search-index") as pool:
+                for (path, _), entry in zip(changed, pool.map(lambda item: self._index_file(*item), changed)):
+                    entries[path] = entry
+        else:
+            for path, st in changed:
+                entries[path] = self._index_file(path, st)
+        if len(self._word_bits) > MAX_CACHED_WORDS:
+            self._word_bits = {}
+        with self._lock:
+            self._entries = entries
+            self._dir_rules = dir_rules
+            self._refreshed_at = started
+
+    def _walk(self, rel_dir: str, rules: Tuple[IgnoreRule, ...],
+              found: Dict[str, os.stat_result],
+              dir_rules: Dict[str, Tuple[IgnoreRule, ...]]) -> None:
+        """Collect the files below a directory that are not ignored."""
+        directory = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        rules = rules + tuple(parse_ignore_file(os.path.join(directory, ".gitignore"), rel_dir))
+        dir_rules[rel_dir] = rules
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            return
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir():
+                    if entry.name != ".git" and not is_ignored(rules, rel, True):
+                        self._walk(rel, rules, found, dir_rules)
+                elif entry.is_file() and not is_ignored(rules, rel, False):
+                    found[rel] = entry.stat()
+            except OSError:
+                # Removed while walking
+                continue
+
+    def _index_file(self, path: str, st: os.stat_result) -> FileEntry:
+        """Read a file and compute its trigram signature."""
+        entry = FileEntry(mtime_ns=st.st_mtime_ns, size=st.st_size)
+        if st.st_size > MAX_INDEXED_FILE_BYTES:
+            return entry
+        try:
+            with open(os.path.join(self.root, path), "rb") as f:
+                data = f.read(MAX_INDEXED_FILE_BYTES + 1)
+        except OSError:
+            return entry
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            entry.binary = True
+            return entry
+        if len(data) <= MAX_INDEXED_FILE_BYTES:
+            entry.signature = self._signature(data)
+        return entry
+
+    def _signature(self, data: bytes) -> int:
+        """Set a bit for each trigram of the words in some text."""
+        bits = 0
+        word_bits = self._word_bits
+        for word in set(_WORDS.findall(data.lower())):
+            # Words recur across files, so their trigrams are hashed once
+            word_signature = word_bits.get(word)
+            if word_signature is None:
+                word_signature = word_bits[word] = _trigram_bits(word)
+            bits |= word_signature
+        return bits
+
+    def update(self, paths: List[str]) -> None:
+        """Index files known to have changed, without walking the workspace.
+
+        Args:
+            paths: Changed, added or removed files
+        """
+        for path in paths:
+            rel = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+            if rel.startswith("../"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, rel))
+            except OSError:
+                with self._lock:
+                    self._entries.pop(rel, None)
+                continue
+            # Only files in walked directories whose rules keep them
+            rules = self._dir_rules.get(os.path.dirname(rel))
+            if rules is None or is_ignored(rules, rel, False):
+                continue
+            entry = self._index_file(rel, st)
+            with self._lock:
+                self._entries[rel] = entry
+
+    def invalidate(self) -> None:
+        """Mark the index out of date, e.g. after a shell command.
+
+        The next query waits for a refresh that started afterwards.
+        """
+        self._invalidated_at = time.monotonic()
+
+    def _stale(self) -> bool:
+        """Whether the index can't answer until it is refreshed."""
+        return self._refreshed_at is None or (
+            self._invalidated_at is not None and self._refreshed_at < self._invalidated_at
+        )
+
+    def _maybe_refresh(self) -> None:
+        """Refresh in the background if the index is getting old.
+
+        Until the first build is done, or after the index was invalidated,
+        there is nothing reliable to answer from, so the refresh is waited
+        for.
+        """
+        if self._stale():
+            # A refresh already running may have walked past a change
+            while self._stale():
+                self.start().result()
+        elif time.monotonic() - self._refreshed_at > REFRESH_INTERVAL:
+            self.start()
+
+    def files(self) -> List[str]:
+        """Get the indexed files, relative to the root, sorted."""
+        self._maybe_refresh()
+        return sorted(self._entries)
+
+    def find_files(self, pattern: str, max_results: int = DEFAULT_MAX_RESULTS) -> List[str]:
+        """Find files whose relative path matches a regular expression.
+
+        Args:
+            pattern: Regular expression searched in each path
+            max_results: Most paths to return
+
+        Returns:
+            Matching paths, sorted
+
+        Raises:
+            re.error: If the pattern is invalid
+        """
+        regex = re.compile(pattern)
+        return [path for path in self.files() if regex.search(path)][:max_results]
+
+    def search(self, pattern: str, glob: Optional[str] = None, ignore_case: bool = False,
+               max_results: int = DEFAULT_MAX_RESULTS) -> List[str]:
+        """Search file contents for a regular expression.
+
+        Args:
+            pattern: Regular expression searched in each line
+            glob: Only search files whose path, or name if the glob has no
+                slash, matches this pattern
+            ignore_case: Match regardless of case
+            max_results: Most matching lines to return
+
+        Returns:
+            Matches as ``path:line:text``, in path order
+
+        Raises:
+            re.error: If the pattern is invalid
+        """
+        self._maybe_refresh()
+        regex = re.compile(pattern, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+        # Whitespace and comments of a verbose pattern aren't text to match
+        mask = 0 if regex.flags & re.VERBOSE else self._query_mask(pattern)
+        results: List[str] = []
+        for path in self._candidates(mask, glob):
+            for line_number, line in self._matching_lines(path, regex):
+                if len(results) == max_results:
+                    results.append("... more matches not shown")
+                    return results
+                results.append(f"{path}:{line_number}:{line[:MAX_LINE_CHARS]}")
+        return results
+
+    def _query_mask(self, pattern: str) -> int:
+        """Signature bits every file containing a match must have."""
+        mask = 0
+        for literal in _literals(pattern) or ():
+            for word in _WORDS.findall(literal.encode("utf-8").lower()):
+                mask |= _trigram_bits(word)
+        return mask
+
+    def _candidates(self, mask: int, glob: Optional[str]) -> List[str]:
+        """Files that may contain a match, sorted."""
+        candidates = []
+        for path, entry in self._entries.items():
+            if entry.binary:
+                continue
+            if entry.signature is not None and entry.signature & mask != mask:
+                continue
+            if glob and not fnmatch.fnmatchcase(path if "/" in glob else os.path.basename(path), glob):
+                continue
+            candidates.append(path)
+        candidates.sort()
+        return candidates
+
+    def _matching_lines(self, path: str, regex: "re.Pattern[str]") -> List[Tuple[int, str]]:
+        """Find the lines of a file matching a regular expression."""
+        try:
+            # Hot files come from the cache, without a scan evicting them
+            data = default_file_cache.read_bytes(os.path.join(self.root, path), store=False)
+        except OSError:
+            return []
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            return []
+        text = data.decode("utf-8", errors="replace")
+        lines = []
+        pos, line_number, counted = 0, 1, 0
+        while pos < len(text):
+            match = regex.search(text, pos)
+            # An empty match after the last newline isn't on a line
+            if match is None or match.start() == len(text) and text.endswith("\n"):
+                break
+            start = text.rfind("\n", 0, match.start()) + 1
+            end = text.find("\n", match.start())
+            if end < 0:
+                end = len(text)
+            line_number += text.count("\n", counted, start)
+            counted = start
+            lines.append((line_number, text[start:end]))
+            pos = end + 1
+        return lines
+
+
+def _trigram_bits(word: bytes) -> int:
+    """Signature bits of the trigrams of one word."""
+    bits = 0
+    for i in range(len(word) - 2):
+        bits |= 1 << (hash(word[i:i + 3]) & (SIGNATURE_BITS - 1))
+    return bits
+
+
+_indexes: Dict[str, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root: Optional[str] = None) -> SearchIndex:
+    """Get the search index of a workspace, starting to build it if new.
+
+    Args:
+        root: Workspace directory, the current directory by default
+
+    Returns:
+        The shared index of that directory
+    """
+    root = os.path.abspath(root or os.getcwd())
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = SearchIndex(root)
+            index.start()
+    return index
+
+
+def notify_changed(paths: List[str]) -> None:
+    """Update the indexes of the workspaces some changed files are in.
+
+    Args:
+        paths: Changed, added or removed files
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        inside = [path for path in paths if path.startswith(index.root + os.sep)]
+        if inside:
+            index.update(inside)
+
+
+def invalidate_all() -> None:
+    """Mark every index out of date, after a command that may have changed any file."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.invalidate()
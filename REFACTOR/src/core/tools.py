@@ -1,9 +1,85 @@
 """Tool call handling and definitions."""
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Union, Any
+from typing import AsyncIterator, Dict, List, Optional, Union, Any
+import asyncio
+import inspect
 import json
-from .sandbox import ExecResult
-from .patch import process_patch
+import os
+import re
+import typing
+from .sandbox import ExecResult, Sandbox
+from .patch import apply_patch_to_files, identify_files_added, identify_files_needed
+from .reader import default_reader
+from .repomap import DEFAULT_MAP_TOKENS, get_repo_map
+from .search import DEFAULT_MAX_RESULTS, get_index, invalidate_all, notify_changed
+
+
+# JSON schema types for the annotations used by tool functions
+_JSON_TYPES = {str: 'string', int: 'integer', float: 'number', bool: 'boolean',
+               list: 'array', dict: 'object'}
+
+
+def _json_type(annotation: Any) -> str:
+    """Map a type annotation to a JSON schema type name."""
+    origin = typing.get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _json_type(args[0]) if len(args) == 1 else 'string'
+    return _JSON_TYPES.get(origin or annotation, 'string')
+
+
+def _docstring_args(doc: str) -> Dict[str, str]:
+    """Extract parameter descriptions from a docstring's Args section."""
+    match = re.search(r'^\s*Args:\s*\n(.*?)(?:^\s*\w+:\s*$|\Z)', doc, re.M | re.S)
+    if not match:
+        return {}
+    return dict(re.findall(r'^\s*(\w+)(?:\s*\([^)]*\))?:\s*(.+)$', match.group(1), re.M))
+
+
+def _function_schema(name: str, func: Any) -> Dict[str, Any]:
+    """Build an Ollama tool schema from a function's signature and docstring."""
+    doc = inspect.getdoc(func) or ''
+    descriptions = _docstring_args(doc)
+    hints = typing.get_type_hints(func)
+    properties = {}
+    required = []
+    for param in inspect.signature(func).parameters.values():
+        prop = {'type': _json_type(hints.get(param.name, str))}
+        if param.name in descriptions:
+            prop['description'] = descriptions[param.name]
+        properties[param.name] = prop
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+    return {
+        'type': 'function',
+        'function': {
+            'name': name,
+            'description': doc.split('\n')[0],
+            'parameters': {'type': 'object', 'properties': properties, 'required': required}
+        }
+    }
+
+
+def _parse_arguments(arguments: Union[str, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+    """Normalize tool call arguments.
+    
+    Ollama sends arguments as an object, OpenAI-style APIs as a JSON string.
+    
+    Args:
+        arguments: Raw arguments
+        
+    Returns:
+        Arguments as a dict, or None if a string is not (yet) valid JSON
+    """
+    if arguments is None or arguments == "":
+        return {}
+    if isinstance(arguments, dict):
+        return arguments
+    try:
+        parsed = json.loads(arguments)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
 
 
 @dataclass
@@ -16,35 +92,113 @@ class ToolCall:
     def from_response(response: Dict[str, Any]) -> Optional[List['ToolCall']]:
         """Extract tool calls from an LLM response.
         
+        Accepts Ollama's native format (arguments as an object, ``type``
+        often omitted) as well as the OpenAI format (``type: function``
+        with arguments as a JSON string).
+        
         Args:
             response: Response from LLM
             
         Returns:
             List of tool calls if present, None otherwise
         """
-        if not response.get('message', {}).get('tool_calls'):
+        raw_calls = response.get('message', {}).get('tool_calls') or response.get('tool_calls')
+        if not raw_calls:
             return None
             
         tool_calls = []
-        for call in response['message']['tool_calls']:
-            if call.get('type') != 'function':
+        for call in raw_calls:
+            if call.get('type', 'function') != 'function':
                 continue
                 
             function = call.get('function', {})
             if not function.get('name'):
                 continue
                 
-            try:
-                arguments = json.loads(function.get('arguments', '{}'))
-            except json.JSONDecodeError:
-                arguments = {}
-                
             tool_calls.append(ToolCall(
                 name=function['name'],
-                arguments=arguments
+                arguments=_parse_arguments(function.get('arguments')) or {}
             ))
             
         return tool_calls if tool_calls else None
+        
+    def to_dict(self) -> Dict[str, Any]:
+        """Format the call for an assistant message sent back to Ollama."""
+        return {'function': {'name': self.name, 'arguments': self.arguments}}
+
+
+class ToolCallAssembler:
+    """Assembles tool calls from a stream of response chunks.
+    
+    Complete calls (Ollama's format) are released as soon as they arrive.
+    Calls streamed in fragments (OpenAI-style deltas keyed by ``index`` with
+    partial argument strings) are released once their arguments form a
+    complete JSON object or a later call starts, so each call can be
+    executed before the rest of the response has streamed.
+    """
+    
+    def __init__(self):
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self.calls: List[ToolCall] = []
+        
+    def feed(self, raw_calls: Optional[List[Dict[str, Any]]]) -> List[ToolCall]:
+        """Add the tool calls of a chunk.
+        
+        Args:
+            raw_calls: Tool calls as found in the chunk
+            
+        Returns:
+            Calls that became complete
+        """
+        completed = []
+        for call in raw_calls or []:
+            if call.get('type', 'function') != 'function':
+                continue
+            function = call.get('function', {})
+            index = call.get('index')
+            if index is None:
+                completed.extend(self._complete(function.get('name'), function.get('arguments')))
+                continue
+                
+            # A new index means every earlier fragmented call is finished
+            for earlier in sorted(i for i in self._pending if i < index):
+                completed.extend(self._release(earlier, force=True))
+            pending = self._pending.setdefault(index, {'name': '', 'arguments': ''})
+            pending['name'] += function.get('name') or ''
+            arguments = function.get('arguments')
+            if isinstance(arguments, dict):
+                pending['arguments'] = arguments
+            elif arguments:
+                pending['arguments'] += arguments
+            completed.extend(self._release(index))
+        return completed
+        
+    def finish(self) -> List[ToolCall]:
+        """Release every call still pending at the end of the stream.
+        
+        Returns:
+            Calls that had not been released yet
+        """
+        completed = []
+        for index in sorted(self._pending):
+            completed.extend(self._release(index, force=True))
+        return completed
+        
+    def _release(self, index: int, force: bool = False) -> List[ToolCall]:
+        pending = self._pending[index]
+        arguments = pending['arguments']
+        if not force and (not pending['name'] or _parse_arguments(arguments) is None
+                          or (isinstance(arguments, str) and not arguments)):
+            return []
+        del self._pending[index]
+        return self._complete(pending['name'], arguments)
+        
+    def _complete(self, name: Optional[str], arguments: Any) -> List[ToolCall]:
+        if not name:
+            return []
+        call = ToolCall(name=name, arguments=_parse_arguments(arguments) or {})
+        self.calls.append(call)
+        return [call]
 
 
 class ToolRegistry:
@@ -53,17 +207,62 @@ class ToolRegistry:
     def __init__(self):
         """Initialize registry."""
         self._tools = {}
+        self._read_only = set()
+        self._schemas: Optional[List[Dict[str, Any]]] = None
         
-    def register(self, name: str):
+    def register(self, name: str, read_only: bool = False):
         """Register a tool.
         
         Args:
             name: Name of the tool
+            read_only: Whether the tool leaves files and processes untouched,
+                so calls to it may run concurrently
         """
         def decorator(func):
             self._tools[name] = func
+            self._schemas = None
+            if read_only:
+                self._read_only.add(name)
+            else:
+                self._read_only.discard(name)
             return func
         return decorator
+
+    def is_read_only(self, name: str) -> bool:
+        """Check whether a tool was registered as read-only.
+        
+        Args:
+            name: Name of the tool
+            
+        Returns:
+            True if calls to the tool may run concurrently
+        """
+        return name in self._read_only
+
+    def descriptions(self) -> Dict[str, str]:
+        """Get a one-line description of each tool.
+        
+        Returns:
+            Map of tool names to the first line of their docstring, in
+            registration order
+        """
+        return {
+            name: (func.__doc__ or "").strip().split("\n")[0]
+            for name, func in self._tools.items()
+        }
+        
+    def schemas(self) -> List[Dict[str, Any]]:
+        """Get the tool schemas to send with a chat request.
+        
+        Built from each tool's signature, type hints and docstring once and
+        reused, so every request carries byte-identical tool definitions.
+        
+        Returns:
+            Schemas in Ollama's ``tools`` format, in registration order
+        """
+        if self._schemas is None:
+            self._schemas = [_function_schema(name, func) for name, func in self._tools.items()]
+        return self._schemas
         
     async def execute(self, tool: ToolCall) -> Any:
         """Execute a tool call.
@@ -83,25 +282,143 @@ class ToolRegistry:
         return await self._tools[tool.name](**tool.arguments)
 
 
+@dataclass
+class ToolResult:
+    """Outcome of a tool call."""
+    call: ToolCall
+    output: Any = None
+    error: Optional[Exception] = None
+
+
+class ToolScheduler:
+    """Runs the tool calls of a turn as they are submitted.
+    
+    Read-only calls run concurrently, bounded by a semaphore. A mutating
+    call waits for everything submitted before it and everything after it
+    waits for the mutating call, so side effects happen in the order the
+    model asked for them. Results are reported in submission order.
+    """
+    
+    def __init__(self, registry: "ToolRegistry", max_concurrency: int = 4):
+        """Initialize the scheduler.
+        
+        Args:
+            registry: Registry to execute tools from
+            max_concurrency: Maximum read-only calls running at once
+        """
+        self.registry = registry
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: List[asyncio.Task] = []
+        self._barrier: Optional[asyncio.Task] = None
+        self._since_barrier: List[asyncio.Task] = []
+        
+    def __len__(self) -> int:
+        return len(self._tasks)
+        
+    def submit(self, call: ToolCall) -> None:
+        """Start a tool call as soon as its ordering constraints allow.
+        
+        Args:
+            call: Tool call to run
+        """
+        if self.registry.is_read_only(call.name):
+            task = asyncio.ensure_future(self._run_read_only(call, self._barrier))
+            self._since_barrier.append(task)
+        else:
+            waits_for = self._since_barrier + ([self._barrier] if self._barrier else [])
+            task = asyncio.ensure_future(self._run_mutating(call, waits_for))
+            self._barrier = task
+            self._since_barrier = []
+        self._tasks.append(task)
+        
+    async def results(self) -> AsyncIterator[ToolResult]:
+        """Wait for the submitted calls.
+        
+        Yields:
+            Results in submission order, each as soon as it and all calls
+            before it have finished
+        """
+        try:
+            for task in self._tasks:
+                yield await task
+        finally:
+            self.cancel()
+            
+    def cancel(self) -> None:
+        """Cancel calls still running and forget all submitted calls."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._barrier = None
+        self._since_barrier = []
+            
+    async def _run_read_only(self, call: ToolCall, barrier: Optional[asyncio.Task]) -> ToolResult:
+        if barrier is not None:
+            await asyncio.wait([barrier])
+        async with self._semaphore:
+            return await self._execute(call)
+            
+    async def _run_mutating(self, call: ToolCall, waits_for: List[asyncio.Task]) -> ToolResult:
+        if waits_for:
+            await asyncio.wait(waits_for)
+        return await self._execute(call)
+        
+    async def _execute(self, call: ToolCall) -> ToolResult:
+        try:
+            return ToolResult(call=call, output=await self.registry.execute(call))
+        except Exception as e:
+            return ToolResult(call=call, error=e)
+
+
 # Global registry
 registry = ToolRegistry()
 
 
+# Sandbox shared by all shell tool calls, so the session persists
+_sandbox: Optional[Sandbox] = None
+
+
+def get_sandbox() -> Sandbox:
+    """Get the sandbox used by the shell tool, creating it on first use."""
+    global _sandbox
+    if _sandbox is None:
+        _sandbox = Sandbox(persistent=True)
+    return _sandbox
+
+
+def set_sandbox(sandbox: Sandbox) -> None:
+    """Set the sandbox used by the shell tool.
+    
+    Args:
+        sandbox: Sandbox to run shell tool calls in
+    """
+    global _sandbox
+    _sandbox = sandbox
+
+
+def resolve_path(path: Optional[str] = None) -> str:
+    """Resolve a tool's path against the shell session's working directory.
+    
+    The session keeps the directory a command changed to, so files are
+    found where the model's commands would find them.
+    
+    Args:
+        path: Absolute or relative path, the working directory by default
+        
+    Returns:
+        Absolute path
+    """
+    cwd = (_sandbox.cwd if _sandbox is not None else None) or os.getcwd()
+    return os.path.join(cwd, path) if path else cwd
+
+
 @registry.register('shell')
 async def shell_command(command: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> ExecResult:
-    # If the command is a cd command, handle it specially
-    if command.strip().startswith('cd '):
-        target_dir = command.strip()[3:].strip()
-        if not os.path.exists(target_dir):
-            return ExecResult(
-                stdout='',
-                stderr=f'cd: no such file or directory: {target_dir}\n',
-                code=1
-            )
-        # Update the cwd for this and future commands
-        cwd = target_dir
     """Execute a shell command in the sandbox.
     
+    The shell session persists between calls, so ``cd`` and exported
+    variables carry over to later commands.
+    
     Args:
         command: Command to execute
         cwd: Optional working directory
@@ -110,37 +427,79 @@ async def shell_command(command: str, cwd: Optional[str] = None, env: Optional[D
     Returns:
         Execution result
     """
-    from .sandbox import Sandbox
-    sandbox = Sandbox()
-    return await sandbox.exec(command, cwd=cwd, env=env)
+    try:
+        return await get_sandbox().exec(command, cwd=cwd, env=env)
+    finally:
+        # The command may have changed any file
+        invalidate_all()
 
 
-@registry.register('search')
-async def search_files(query: str, path: Optional[str] = None) -> List[str]:
-    """Search for files.
+@registry.register('search', read_only=True)
+async def search_files(query: str, path: Optional[str] = None, glob: Optional[str] = None,
+                       filenames: bool = False, ignore_case: bool = False) -> str:
+    """Search file contents, or file names, for a regular expression.
+    
+    Files ignored by .gitignore are skipped.
     
     Args:
-        query: Search query
-        path: Optional path to search in
+        query: Regular expression to search for
+        path: Optional directory to search in, the workspace by default
+        glob: Only search files matching this pattern, like "*.py"
+        filenames: Match the query against file paths instead of contents
+        ignore_case: Match regardless of case
         
     Returns:
-        List of matching files
+        Matching lines as path:line:text, or matching file paths
     """
-    return []
+    try:
+        re.compile(query)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression {query!r}: {e}") from e
+    index = get_index(resolve_path(path))
+    if filenames:
+        results = await asyncio.to_thread(index.find_files, query, DEFAULT_MAX_RESULTS + 1)
+        if len(results) > DEFAULT_MAX_RESULTS:
+            results[DEFAULT_MAX_RESULTS:] = ["... more files not shown"]
+    else:
+        results = await asyncio.to_thread(index.search, query, glob=glob, ignore_case=ignore_case)
+    return "\n".join(results) if results else "No matches."
 
 
-@registry.register('read')
-async def read_file(path: str) -> str:
-    """Read a file.
+@registry.register('repo_map', read_only=True)
+async def repo_map(path: Optional[str] = None, max_tokens: int = DEFAULT_MAP_TOKENS) -> str:
+    """Outline the project: its files, most imported first, with their classes and functions.
+    
+    Cheaper than listing and reading files to learn the project's layout.
+    
+    Args:
+        path: Optional directory to map, the workspace by default
+        max_tokens: Token budget for the outline
+        
+    Returns:
+        The outline
+    """
+    return await asyncio.to_thread(get_repo_map(resolve_path(path)).render, max_tokens)
+
+
+@registry.register('read', read_only=True)
+async def read_file(path: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+                    offset: Optional[int] = None, length: Optional[int] = None) -> str:
+    """Read a file, or a range of its lines or bytes.
+    
+    Long output is cut off with a marker telling where to continue.
     
     Args:
         path: Path to file
+        start_line: First line to read, starting at 1
+        end_line: Last line to read, inclusive
+        offset: First byte to read, instead of lines
+        length: Number of bytes to read from offset
         
     Returns:
         File contents
     """
-    with open(path) as f:
-        return f.read()
+    return await asyncio.to_thread(default_reader.read, resolve_path(path), start_line=start_line,
+                                   end_line=end_line, offset=offset, length=length)
 
 
 @registry.register('apply_patch')
@@ -153,16 +512,11 @@ async def apply_patch(patch_text: str) -> str:
     Returns:
         Status message
     """
-    def open_fn(path: str) -> str:
-        with open(path) as f:
-            return f.read()
-            
-    def write_fn(path: str, content: str) -> None:
-        with open(path, 'w') as f:
-            f.write(content)
-            
-    def remove_fn(path: str) -> None:
-        import os
-        os.remove(path)
-        
-    return process_patch(patch_text, open_fn, write_fn, remove_fn)
+    cwd = resolve_path()
+    # Staging, syncing and renaming files would block the event loop
+    status = await asyncio.to_thread(apply_patch_to_files, patch_text, cwd)
+    moved = [line[len("*** Move to: "):] for line in patch_text.splitlines()
+             if line.startswith("*** Move to: ")]
+    notify_changed([os.path.join(cwd, path) for path in
+                    identify_files_needed(patch_text) + identify_files_added(patch_text) + moved])
+    return status
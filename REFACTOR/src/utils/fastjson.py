@@ -0,0 +1,54 @@
+"""
+JSON encoding and decoding with an optional accelerated backend.
+Uses orjson or msgspec when installed and falls back to the standard
+library, so callers never need to care which one is active.
+"""
+
+import json
+from typing import Any, Callable, Dict, Tuple, Type
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _load_backends() -> Dict[str, Tuple[Callable[[Any], Any], Callable[[Any], bytes], Tuple[Type[Exception], ...]]]:
+    """Find the available backends as name -> (loads, dumps, decode errors)."""
+    backends = {"json": (json.loads, _stdlib_dumps, (ValueError,))}
+    try:
+        import msgspec
+        backends["msgspec"] = (
+            msgspec.json.Decoder().decode,
+            msgspec.json.Encoder().encode,
+            (msgspec.DecodeError, ValueError)
+        )
+    except ImportError:
+        pass
+    try:
+        import orjson
+        backends["orjson"] = (orjson.loads, orjson.dumps, (orjson.JSONDecodeError,))
+    except ImportError:
+        pass
+    return backends
+
+
+BACKENDS = _load_backends()
+# Fastest available first
+BACKEND = next(name for name in ("orjson", "msgspec", "json") if name in BACKENDS)
+loads, dumps, DecodeError = BACKENDS[BACKEND]
+
+
+def use_backend(name: str) -> None:
+    """Switch the active backend.
+
+    Args:
+        name: One of the names in BACKENDS
+
+    Raises:
+        ValueError: If the backend is not installed
+    """
+    global BACKEND, loads, dumps, DecodeError
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend not available: {name}")
+    BACKEND = name
+    loads, dumps, DecodeError = BACKENDS[name]
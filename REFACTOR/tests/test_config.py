@@ -2,7 +2,13 @@
 import os
 from pathlib import Path
 import pytest
-from src.core.config import load_config, Config, get_api_key_for_provider
+from src.core.config import (
+    DEFAULT_KEEP_ALIVE,
+    Config,
+    get_api_key_for_provider,
+    load_config,
+    resolve_model_settings,
+)
 
 def test_get_api_key_for_provider():
     # Test Ollama (no key required)
@@ -42,3 +48,23 @@ def test_load_config_with_project_doc(tmp_path):
     # Test loading with project doc
     config = load_config(project_doc_path=str(project_doc))
     assert 'Test Project' in config.instructions
+
+def test_resolve_model_settings():
+    # Arguments override the stored config
+    stored = {'model': 'llama3.1:8b', 'keepAlive': '1h'}
+    model, base_url, keep_alive = resolve_model_settings('ollama', stored_config=stored)
+    assert model == 'llama3.1:8b'
+    assert keep_alive == '1h'
+    assert 'localhost:11434' in base_url
+    
+    model, base_url, keep_alive = resolve_model_settings(
+        'ollama', model='qwen2.5-coder', base_url='http://host:1234/api',
+        keep_alive=-1, stored_config=stored
+    )
+    assert model == 'qwen2.5-coder'
+    assert base_url == 'http://host:1234/api'
+    assert keep_alive == -1
+    
+    # Defaults
+    _, _, keep_alive = resolve_model_settings('ollama', stored_config={})
+    assert keep_alive == DEFAULT_KEEP_ALIVE
@@ -0,0 +1,73 @@
+"""Tests for conversation history and context budgeting."""
+from src.core.context import (
+    ContextBudget,
+    Conversation,
+    MESSAGE_OVERHEAD_TOKENS,
+    estimate_tokens,
+    truncate_middle,
+)
+from src.core.llm import Message
+
+
+def test_estimate_tokens():
+    """Test the token estimate."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_truncate_middle():
+    """Test long texts keep their head and tail."""
+    assert truncate_middle("short", 10) == "short"
+    
+    text = "a" * 100 + "b" * 100
+    result = truncate_middle(text, 10)
+    assert result.startswith("a" * 20)
+    assert result.endswith("b" * 20)
+    assert "characters omitted" in result
+
+
+def test_conversation_caches_token_estimates():
+    """Test totals are tracked as messages are added."""
+    conversation = Conversation()
+    conversation.append(Message(role="user", content="a" * 40))
+    conversation.append(Message(role="assistant", content="b" * 80))
+    assert conversation.total_tokens == 30 + 2 * MESSAGE_OVERHEAD_TOKENS
+    assert conversation.fit() == conversation.messages
+
+
+def test_conversation_truncates_tool_output():
+    """Test oversized tool output is shortened when added."""
+    conversation = Conversation(ContextBudget(max_tool_output_tokens=10))
+    conversation.append(Message(role="tool", content="x" * 1000))
+    assert len(conversation.messages[0].content) < 100
+
+
+def test_conversation_compacts_old_turns():
+    """Test old turns are summarized while system and latest turns stay."""
+    budget = ContextBudget(context_size=400, reserve_tokens=100, summary_tokens=50)
+    conversation = Conversation(budget)
+    conversation.append(Message(role="system", content="You are a coding agent."))
+    for i in range(10):
+        conversation.append(Message(role="user", content=f"request {i} " + "x" * 100))
+        conversation.append(Message(role="assistant", content="y" * 100))
+    conversation.append(Message(role="user", content="latest"))
+    
+    messages = conversation.fit()
+    assert conversation.total_tokens <= budget.prompt_tokens
+    assert messages[0].content == "You are a coding agent."
+    assert messages[1].role == "system"
+    assert "earlier messages were removed" in messages[1].content
+    # The most recent dropped request is listed in the summary
+    kept = {m.content.split()[1] for m in messages[2:] if m.content.startswith("request")}
+    last_dropped = min(int(i) for i in kept) - 1
+    assert f"request {last_dropped} " in messages[1].content
+    assert messages[-1].content == "latest"
+    
+    # Compacting again keeps a single, cumulative summary
+    for i in range(10, 15):
+        conversation.append(Message(role="user", content=f"request {i} " + "x" * 100))
+    messages = conversation.fit()
+    summaries = [m for m in messages[1:] if m.role == "system"]
+    assert len(summaries) == 1
+    assert conversation.total_tokens <= budget.prompt_tokens
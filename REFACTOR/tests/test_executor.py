@@ -1,9 +1,10 @@
 """Tests for command execution and tool handling."""
 import json
+import time
 import pytest
 import httpx
-from src.core.executor import CommandExecutor, ExecutionContext, ToolCall
-from src.core.llm import Message, ModelResponse
+from src.core.executor import CommandExecutor, ExecResult, ExecutionContext, OutputChunk
+from src.core.llm import Message, ModelResponse, OllamaClient
 
 @pytest.mark.asyncio
 async def test_execute_command():
@@ -51,20 +52,50 @@ async def test_process_message_shell_command(respx_mock):
         "done": True
     }
     
-    respx_mock.post(api_url).mock(return_value=httpx.Response(
-        200,
-        content=json.dumps(mock_response)
-    ))
+    final_response = {"message": {"content": "Done."}, "done": True}
+    respx_mock.post(api_url).mock(side_effect=[
+        httpx.Response(200, content=json.dumps(mock_response)),
+        httpx.Response(200, content=json.dumps(final_response)),
+    ])
     
     executor = CommandExecutor()
     responses = []
     async for response in executor.process_message("Run a test command"):
         responses.append(response)
         
-    # Should have one response - the LLM's response
-    # The command execution is handled internally
-    assert len(responses) == 1
+    # The LLM's response, the command's result, then the final answer
+    assert len(responses) == 3
     assert responses[0] == "Let me help you with that."
+    assert responses[1].stdout.strip() == "Hello from shell"
+    assert responses[2] == "Done."
+
+@pytest.mark.asyncio
+async def test_process_message_native_tool_calls(respx_mock):
+    """Test Ollama's tool call format and that tool schemas are sent."""
+    api_url = "http://localhost:11434/api/chat"
+    chunks = [
+        {"message": {"content": "", "tool_calls": [{
+            "function": {"name": "shell", "arguments": {"command": "echo native"}}
+        }]}, "done": False},
+        {"message": {"content": ""}, "done": True},
+    ]
+    final_response = {"message": {"content": "Done."}, "done": True}
+    route = respx_mock.post(api_url).mock(side_effect=[
+        httpx.Response(200, content="\n".join(json.dumps(c) for c in chunks)),
+        httpx.Response(200, content=json.dumps(final_response)),
+    ])
+    
+    async with CommandExecutor() as executor:
+        responses = [r async for r in executor.process_message("Run it")]
+    
+    assert responses[0].stdout.strip() == "native"
+    first = json.loads(route.calls[0].request.content)
+    assert "shell" in [tool["function"]["name"] for tool in first["tools"]]
+    second = json.loads(route.calls[1].request.content)
+    assert second["messages"][-2]["tool_calls"] == [
+        {"function": {"name": "shell", "arguments": {"command": "echo native"}}}
+    ]
+    assert second["tools"] == first["tools"]
 
 @pytest.mark.asyncio
 async def test_update_context():
@@ -86,3 +117,150 @@ async def test_update_context():
     # Test command with new context
     result = await executor.execute_command("pwd")
     assert "/tmp" in result.stdout
+
+@pytest.mark.asyncio
+async def test_executor_shares_client():
+    """Test the executor reuses an injected client and leaves it open."""
+    async with OllamaClient() as client:
+        async with CommandExecutor(client=client) as executor:
+            assert executor.client is client
+        assert not client.is_closed
+    
+    executor = CommandExecutor()
+    own_client = executor.client
+    assert executor.client is own_client
+    await executor.aclose()
+    assert own_client.is_closed
+
+@pytest.mark.asyncio
+async def test_process_message_keeps_history(respx_mock):
+    """Test earlier turns are sent with the next message."""
+    api_url = "http://localhost:11434/api/chat"
+    route = respx_mock.post(api_url).mock(return_value=httpx.Response(
+        200,
+        content=json.dumps({"message": {"content": "Hi!"}, "done": True})
+    ))
+    
+    async with CommandExecutor(context_size=4096) as executor:
+        async for _ in executor.process_message("Hello"):
+            pass
+        async for _ in executor.process_message("Again"):
+            pass
+    
+    first = json.loads(route.calls[0].request.content)
+    request = json.loads(route.calls[1].request.content)
+    assert request["messages"][0]["role"] == "system"
+    assert [m["content"] for m in request["messages"][1:]] == ["Hello", "Hi!", "Again"]
+    assert request["options"]["num_ctx"] == 4096
+    
+    # The second prompt extends the first one unchanged
+    assert request["messages"][:len(first["messages"])] == first["messages"]
+
+@pytest.mark.asyncio
+async def test_process_message_agent_loop(respx_mock):
+    """Test tool results are fed back until the model stops calling tools."""
+    api_url = "http://localhost:11434/api/chat"
+    tool_response = {
+        "message": {"content": "Running it."},
+        "tool_calls": [{
+            "type": "function",
+            "function": {
+                "name": "shell",
+                "arguments": json.dumps({"command": "echo 'Hello from shell'"})
+            }
+        }],
+        "done": True
+    }
+    final_response = {"message": {"content": "It printed hello."}, "done": True}
+    route = respx_mock.post(api_url).mock(side_effect=[
+        httpx.Response(200, content=json.dumps(tool_response)),
+        httpx.Response(200, content=json.dumps(final_response)),
+    ])
+    
+    async with CommandExecutor() as executor:
+        responses = [r async for r in executor.process_message("Run a test command")]
+    
+    assert responses[0] == "Running it."
+    assert responses[1].stdout.strip() == "Hello from shell"
+    assert responses[2] == "It printed hello."
+    
+    second = json.loads(route.calls[1].request.content)["messages"]
+    assert second[-2]["role"] == "assistant"
+    assert second[-2]["tool_calls"][0]["function"]["name"] == "shell"
+    assert second[-1]["role"] == "tool"
+    assert "Hello from shell" in second[-1]["content"]
+    
+    turn = executor.metrics.turns[-1]
+    assert [i.tool_calls for i in turn.iterations] == [1, 0]
+
+@pytest.mark.asyncio
+async def test_process_message_max_iterations(respx_mock):
+    """Test the agent loop stops after max_iterations model calls."""
+    api_url = "http://localhost:11434/api/chat"
+    tool_response = {
+        "message": {"content": ""},
+        "tool_calls": [{
+            "type": "function",
+            "function": {"name": "read", "arguments": json.dumps({"path": "/dev/null"})}
+        }],
+        "done": True
+    }
+    route = respx_mock.post(api_url).mock(
+        return_value=httpx.Response(200, content=json.dumps(tool_response))
+    )
+    
+    async with CommandExecutor(max_iterations=3) as executor:
+        responses = [r async for r in executor.process_message("Loop forever")]
+    
+    assert route.call_count == 3
+    assert "Stopped after 3 model calls" in responses[-1]
+
+@pytest.mark.asyncio
+async def test_process_message_stream_output(respx_mock):
+    """Test command output is yielded while the command runs."""
+    api_url = "http://localhost:11434/api/chat"
+    tool_response = {
+        "message": {"content": "", "tool_calls": [{
+            "function": {"name": "shell", "arguments": {"command": "echo one; echo two >&2"}}
+        }]},
+        "done": True
+    }
+    final_response = {"message": {"content": "Done."}, "done": True}
+    respx_mock.post(api_url).mock(side_effect=[
+        httpx.Response(200, content=json.dumps(tool_response)),
+        httpx.Response(200, content=json.dumps(final_response)),
+    ])
+    
+    async with CommandExecutor() as executor:
+        responses = [r async for r in executor.process_message("Run it", stream_output=True)]
+    
+    chunks = [r for r in responses if isinstance(r, OutputChunk)]
+    assert "".join(c.text for c in chunks if c.stream == "stdout") == "one\n"
+    assert "".join(c.text for c in chunks if c.stream == "stderr") == "two\n"
+    result_index = next(i for i, r in enumerate(responses) if isinstance(r, ExecResult))
+    assert all(responses.index(c) < result_index for c in chunks)
+    assert responses[-1] == "Done."
+    assert executor.sandbox.on_output is None
+
+@pytest.mark.asyncio
+async def test_process_message_turn_timeout(respx_mock):
+    """Test the turn stops and kills commands when its time runs out."""
+    api_url = "http://localhost:11434/api/chat"
+    tool_response = {
+        "message": {"content": "Waiting.", "tool_calls": [{
+            "function": {"name": "shell", "arguments": {"command": "sleep 10"}}
+        }]},
+        "done": True
+    }
+    respx_mock.post(api_url).mock(
+        return_value=httpx.Response(200, content=json.dumps(tool_response))
+    )
+    
+    async with CommandExecutor(turn_timeout=0.5) as executor:
+        start = time.perf_counter()
+        responses = [r async for r in executor.process_message("Wait")]
+        
+    assert time.perf_counter() - start < 5
+    assert responses[0] == "Waiting."
+    assert "time limit" in responses[-1]
+    assert executor.sandbox.deadline is None
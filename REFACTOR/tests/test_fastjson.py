@@ -0,0 +1,28 @@
+"""Tests for the JSON backend selection."""
+import pytest
+from src.utils import fastjson
+
+
+@pytest.mark.parametrize("backend", sorted(fastjson.BACKENDS))
+def test_backend_roundtrip(backend):
+    """Test every available backend encodes and decodes the same data."""
+    loads, dumps, decode_error = fastjson.BACKENDS[backend]
+    data = {"message": {"content": "héllo"}, "done": False, "count": 3}
+    encoded = dumps(data)
+    assert isinstance(encoded, bytes)
+    assert loads(encoded) == data
+    with pytest.raises(decode_error):
+        loads(b"{not json")
+
+
+def test_use_backend():
+    """Test switching backends."""
+    previous = fastjson.BACKEND
+    try:
+        fastjson.use_backend("json")
+        assert fastjson.BACKEND == "json"
+        assert fastjson.loads(b'{"a": 1}') == {"a": 1}
+        with pytest.raises(ValueError):
+            fastjson.use_backend("missing")
+    finally:
+        fastjson.use_backend(previous)
@@ -0,0 +1,65 @@
+"""Tests for the file content cache."""
+import os
+
+from src.core.filecache import FileContentCache, default_file_cache
+from src.core.patch import apply_patch_to_files
+
+
+def test_cache_hits_until_file_changes(tmp_path):
+    """Test unchanged files are hits and changed ones are read again."""
+    path = tmp_path / "a.txt"
+    path.write_text("one\n")
+    cache = FileContentCache()
+    assert cache.read_bytes(str(path)) == b"one\n"
+    assert cache.read_bytes(str(path)) == b"one\n"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Same size and mtime, but a new inode
+    os.unlink(path)
+    path.write_text("two\n")
+    os.utime(path, ns=(0, 0))
+    assert cache.read_bytes(str(path)) == b"two\n"
+    assert cache.read_bytes(str(path)) == b"two\n"
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cache_text(tmp_path):
+    """Test text reads translate newlines like text mode and are cached."""
+    path = tmp_path / "crlf.txt"
+    path.write_bytes(b"a\r\nb\rc\n")
+    cache = FileContentCache()
+    assert cache.read_text(str(path)) == "a\nb\nc\n"
+    assert cache.read_text(str(path)) == "a\nb\nc\n"
+    assert cache.read_bytes(str(path)) == b"a\r\nb\rc\n"
+    assert cache.stats() == {"hits": 2, "misses": 1, "files": 1, "bytes": 13}
+
+
+def test_cache_budget(tmp_path):
+    """Test least recently used files are evicted and big ones not kept."""
+    for name in "abc":
+        (tmp_path / name).write_bytes(name.encode() * 40)
+    (tmp_path / "big").write_bytes(b"x" * 200)
+    cache = FileContentCache(max_bytes=100, max_file_bytes=100)
+    cache.read_bytes(str(tmp_path / "a"))
+    cache.read_bytes(str(tmp_path / "b"))
+    cache.read_bytes(str(tmp_path / "a"))
+    cache.read_bytes(str(tmp_path / "c"))
+    cache.read_bytes(str(tmp_path / "big"))
+    assert cache.stats() == {"hits": 1, "misses": 4, "files": 2, "bytes": 80}
+
+    # b was evicted, and a scan doesn't bring it back
+    cache.read_bytes(str(tmp_path / "b"), store=False)
+    cache.read_bytes(str(tmp_path / "c"), store=False)
+    assert cache.stats() == {"hits": 2, "misses": 5, "files": 2, "bytes": 80}
+
+
+def test_apply_patch_invalidates(tmp_path):
+    """Test files written by a patch are dropped from the shared cache."""
+    path = tmp_path / "f.txt"
+    path.write_text("old\n")
+    assert default_file_cache.read_text(str(path)) == "old\n"
+    files = default_file_cache.stats()["files"]
+    apply_patch_to_files("*** Begin Patch\n*** Update File: f.txt\n@@\n-old\n+new\n*** End Patch",
+                         cwd=str(tmp_path))
+    assert default_file_cache.stats()["files"] == files - 1
+    assert default_file_cache.read_text(str(path)) == "new\n"
@@ -0,0 +1,54 @@
+"""Tests for image encoding."""
+import base64
+import io
+import os
+import pytest
+from src.core.images import ImageEncoder
+from src.core.llm import Message
+
+
+def test_encode_is_cached_by_mtime(tmp_path, monkeypatch):
+    """Test a file is only re-encoded when it changes."""
+    path = tmp_path / "image.bin"
+    path.write_bytes(b"\x89PNG" + bytes(range(256)) * 1000)
+    encoder = ImageEncoder(max_size=None)
+    
+    reads = []
+    original = encoder._encode_file
+    monkeypatch.setattr(encoder, "_encode_file", lambda p: reads.append(p) or original(p))
+    
+    encoded = encoder.encode(str(path))
+    assert base64.b64decode(encoded) == path.read_bytes()
+    assert encoder.encode(str(path)) == encoded
+    assert len(reads) == 1
+    
+    path.write_bytes(b"changed")
+    os.utime(path, ns=(1, 1))
+    assert base64.b64decode(encoder.encode(str(path))) == b"changed"
+    assert len(reads) == 2
+
+
+def test_encode_downscales_large_images(tmp_path):
+    """Test images larger than max_size are downscaled."""
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "large.png"
+    Image.new("RGB", (400, 200), "red").save(path)
+    
+    encoder = ImageEncoder(max_size=100)
+    with Image.open(io.BytesIO(base64.b64decode(encoder.encode(str(path))))) as image:
+        assert image.size == (100, 50)
+        assert image.format == "PNG"
+    
+    small = tmp_path / "small.png"
+    Image.new("RGB", (50, 50), "blue").save(small)
+    assert base64.b64decode(encoder.encode(str(small))) == small.read_bytes()
+
+
+def test_message_sends_images_field(tmp_path):
+    """Test images go to the images field, not the message text."""
+    path = tmp_path / "image.bin"
+    path.write_bytes(b"data")
+    message = Message(role="user", content="Describe this", images=[str(path)])
+    formatted = message.to_dict()
+    assert formatted["content"] == "Describe this"
+    assert formatted["images"] == [base64.b64encode(b"data").decode()]
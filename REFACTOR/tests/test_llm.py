@@ -1,8 +1,10 @@
 """Tests for LLM functionality."""
 import json
+import time
 import pytest
 import httpx
-from src.core.llm import OllamaClient, Message, ModelResponse
+from src.core.llm import OllamaClient, Message, ModelResponse, StreamBuffer
+from src.utils import fastjson
 
 @pytest.mark.asyncio
 async def test_ollama_generate(respx_mock):
@@ -109,3 +111,161 @@ async def test_ollama_error_handling(respx_mock):
         with pytest.raises(ValueError, match="Ollama error: Model not found"):
             async for _ in client.generate("nonexistent-model", messages):
                 pass
+
+@pytest.mark.asyncio
+async def test_ollama_generate_delta(respx_mock):
+    """Test delta streaming yields only new fragments."""
+    api_url = "http://localhost:11434/api/chat"
+    mock_responses = [
+        {"message": {"content": "Hello"}},
+        {"message": {"content": " World"}, "done": True}
+    ]
+    
+    respx_mock.post(api_url).mock(
+        return_value=httpx.Response(
+            200,
+            content="\n".join(json.dumps(r) for r in mock_responses)
+        )
+    )
+    
+    async with OllamaClient() as client:
+        messages = [Message(role="user", content="Say hello")]
+        responses = []
+        
+        async for response in client.generate("qwen2.5-coder", messages, delta=True):
+            responses.append(response)
+            
+        assert [r.content for r in responses] == ["Hello", " World"]
+        assert responses[-1].text == "Hello World"
+        assert responses[-1].done
+
+def test_stream_buffer():
+    """Test the stream buffer joins lazily and caches the result."""
+    buffer = StreamBuffer()
+    assert buffer.text == ""
+    
+    for fragment in ["a", "", "b", "c"]:
+        buffer.append(fragment)
+    assert len(buffer) == 3
+    assert buffer.text == "abc"
+    
+    buffer.append("d")
+    assert buffer.text == "abcd"
+
+@pytest.mark.asyncio
+async def test_ollama_client_reuse(respx_mock):
+    """Test the client stays usable across calls until closed."""
+    respx_mock.get("http://localhost:11434/api/tags").mock(
+        return_value=httpx.Response(200, json={"models": [{"name": "qwen2.5-coder"}]})
+    )
+    
+    client = OllamaClient()
+    assert await client.get_model_list() == ["qwen2.5-coder"]
+    assert await client.get_model_list() == ["qwen2.5-coder"]
+    assert not client.is_closed
+    
+    await client.aclose()
+    assert client.is_closed
+
+@pytest.mark.asyncio
+async def test_ollama_client_external_http_client():
+    """Test an injected HTTP client is not closed by OllamaClient."""
+    http_client = httpx.AsyncClient()
+    async with OllamaClient(http_client=http_client):
+        pass
+    assert not http_client.is_closed
+    await http_client.aclose()
+
+@pytest.mark.asyncio
+async def test_ollama_keep_alive_and_warm_up(respx_mock):
+    """Test keep_alive is sent with every request, including the warm-up."""
+    api_url = "http://localhost:11434/api/chat"
+    route = respx_mock.post(api_url).mock(
+        return_value=httpx.Response(
+            200,
+            content=json.dumps({"message": {"content": ""}, "done": True})
+        )
+    )
+    
+    async with OllamaClient(keep_alive="30m") as client:
+        await client.warm_up("qwen2.5-coder")
+        warm_up_request = json.loads(route.calls[0].request.content)
+        assert warm_up_request["messages"] == []
+        assert warm_up_request["keep_alive"] == "30m"
+        
+        messages = [Message(role="user", content="Hello")]
+        async for _ in client.generate("qwen2.5-coder", messages):
+            pass
+        chat_request = json.loads(route.calls[1].request.content)
+        assert chat_request["keep_alive"] == "30m"
+
+@pytest.mark.asyncio
+async def test_ollama_generate_stats(respx_mock):
+    """Test statistics are read from the final chunk."""
+    api_url = "http://localhost:11434/api/chat"
+    mock_responses = [
+        {"message": {"content": "Hi"}},
+        {"message": {"content": ""}, "done": True, "eval_count": 2,
+         "eval_duration": 1_000_000, "prompt_eval_count": 12, "load_duration": 5}
+    ]
+    respx_mock.post(api_url).mock(
+        return_value=httpx.Response(
+            200,
+            content="\n".join(json.dumps(r) for r in mock_responses)
+        )
+    )
+    
+    async with OllamaClient() as client:
+        messages = [Message(role="user", content="Hello")]
+        responses = [r async for r in client.generate("qwen2.5-coder", messages)]
+        
+    assert responses[0].stats is None
+    stats = responses[-1].stats
+    assert stats.eval_count == 2
+    assert stats.prompt_eval_count == 12
+    assert stats.load_duration == 5
+    assert stats.tokens_per_second == 2000
+
+def _recorded_stream(n_chunks: int) -> bytes:
+    """Build an NDJSON stream shaped like Ollama's /api/chat output."""
+    lines = [
+        json.dumps({
+            "model": "qwen2.5-coder",
+            "created_at": "2024-01-01T00:00:00.000000Z",
+            "message": {"role": "assistant", "content": f" tok{i}"},
+            "done": False
+        })
+        for i in range(n_chunks)
+    ]
+    lines.append(json.dumps({
+        "model": "qwen2.5-coder",
+        "created_at": "2024-01-01T00:00:00.000000Z",
+        "message": {"role": "assistant", "content": ""},
+        "done": True, "total_duration": 1, "eval_count": n_chunks, "eval_duration": 1
+    }))
+    return "\n".join(lines).encode()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", sorted(fastjson.BACKENDS))
+async def test_ollama_generate_stream_throughput(backend, monkeypatch):
+    """Micro-benchmark: replay a 10k-chunk stream and report chunks/sec."""
+    n_chunks = 10_000
+    body = _recorded_stream(n_chunks)
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    
+    monkeypatch.setattr(fastjson, "loads", fastjson.BACKENDS[backend][0])
+    monkeypatch.setattr(fastjson, "DecodeError", fastjson.BACKENDS[backend][2])
+    
+    async with httpx.AsyncClient(transport=transport) as http_client:
+        client = OllamaClient(http_client=http_client)
+        messages = [Message(role="user", content="bench")]
+        start = time.perf_counter()
+        count = 0
+        async for response in client.generate("qwen2.5-coder", messages, delta=True):
+            count += 1
+        elapsed = time.perf_counter() - start
+        
+    assert count == n_chunks + 1
+    assert response.done
+    assert response.text.endswith(f" tok{n_chunks - 1}")
+    print(f"\n{backend}: {count / elapsed:,.0f} chunks/sec")
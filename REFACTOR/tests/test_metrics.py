@@ -0,0 +1,51 @@
+"""Tests for latency and throughput metrics."""
+import json
+from src.core.llm import GenerationStats
+from src.core.metrics import SessionMetrics
+
+
+def test_generation_stats_throughput():
+    """Test throughput is derived from Ollama's counters."""
+    stats = GenerationStats.from_chunk({
+        "done": True,
+        "prompt_eval_count": 100,
+        "prompt_eval_duration": 500_000_000,
+        "eval_count": 50,
+        "eval_duration": 1_000_000_000,
+    })
+    assert stats.tokens_per_second == 50
+    assert stats.prompt_tokens_per_second == 200
+    assert GenerationStats().tokens_per_second is None
+
+
+def test_session_metrics(tmp_path):
+    """Test turns are aggregated and written as JSON lines."""
+    path = tmp_path / "stats.jsonl"
+    metrics = SessionMetrics("qwen2.5-coder", jsonl_path=str(path))
+    
+    for _ in range(2):
+        timer = metrics.start_turn()
+        timer.first_token()
+        timer.first_token()
+        timer.metrics.add_stats(GenerationStats(eval_count=10, eval_duration=500_000_000,
+                                                prompt_eval_count=20))
+        metrics.finish_turn(timer)
+        
+    summary = metrics.summary()
+    assert summary["turns"] == 2
+    assert summary["eval_count"] == 20
+    assert summary["prompt_eval_count"] == 40
+    assert summary["tokens_per_second"] == 20
+    assert summary["mean_time_to_first_token"] is not None
+    assert "2 turns" in metrics.format_summary()
+    
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["turn"] for line in lines] == [1, 2]
+    assert json.loads(lines[0])["tokens_per_second"] == 20
+
+
+def test_session_metrics_empty():
+    """Test an empty session summarizes without errors."""
+    metrics = SessionMetrics("qwen2.5-coder")
+    assert metrics.summary()["turns"] == 0
+    assert "0 turns" in metrics.format_summary()
@@ -9,11 +9,15 @@ from src.core.patch import (
     ActionType,
     Chunk,
     Commit,
+    ContextMatcher,
     DiffError,
     FileChange,
+    FileTransaction,
+    LineIndex,
     Patch,
     PatchAction,
     Parser,
+    apply_patch_to_files,
     find_context,
     identify_files_added,
     identify_files_needed,
@@ -43,6 +47,80 @@ def test_find_context():
         find_context(lines, context, 0, False)
 
 
+def test_find_context_index():
+    """Test indexed search matches a plain scan from the start line."""
+    lines = ["x", "a", "b", "x", "a", "b", "c", "a"]
+    index = LineIndex(lines)
+    for context in (["a", "b"], ["a", "b", "c"], ["x"], ["b", "x", "a"], ["c", "a"]):
+        for start in range(len(lines)):
+            expected = next(
+                ((i, i + len(context)) for i in range(start, len(lines))
+                 if lines[i:i + len(context)] == context),
+                None
+            )
+            if expected is None:
+                with pytest.raises(DiffError):
+                    find_context(lines, context, start, False, index)
+            else:
+                assert find_context(lines, context, start, False, index) == expected
+
+    # The last context line may be missing at the end of the file
+    assert find_context(lines, ["c", "a", ""], 0, True, index) == (6, 8)
+    with pytest.raises(DiffError):
+        find_context(lines, ["c", "a", ""], 0, False, index)
+
+
+def test_patch_to_commit_several_chunks():
+    """Test chunks that change the line count apply in file order."""
+    patch = Patch(actions={
+        "test.py": PatchAction(
+            type=ActionType.UPDATE,
+            chunks=[
+                Chunk(orig_index=0, del_lines=["a", "b"], ins_lines=["a", "b1", "b2", "b3"]),
+                Chunk(orig_index=2, del_lines=["a", "c"], ins_lines=["a"]),
+                Chunk(orig_index=4, del_lines=["d"], ins_lines=["d", "e"]),
+            ]
+        )
+    })
+    orig = {"test.py": "a\nb\na\nc\nd\n"}
+    commit = patch_to_commit(patch, orig)
+    assert commit.changes["test.py"].new_content == "a\nb1\nb2\nb3\na\nd\ne\n"
+
+    # Chunks out of order or past the end are rejected
+    patch.actions["test.py"].chunks[1].orig_index = 1
+    with pytest.raises(DiffError):
+        patch_to_commit(patch, orig)
+    patch.actions["test.py"].chunks[1].orig_index = 2
+    patch.actions["test.py"].chunks[2].orig_index = 5
+    with pytest.raises(DiffError):
+        patch_to_commit(patch, orig)
+
+
+def test_process_patch_several_chunks():
+    """Test a parsed multi-chunk patch lands every chunk at its own lines."""
+    files = {"test.py": "".join(f"line {i}\n" for i in range(10))}
+    text = """*** Begin Patch
+*** Update File: test.py
+@@ -1,2 +1,4 @@
+line 1
++inserted 1
++inserted 2
+@@ -5,3 +7,2 @@
+line 4
+-line 5
+line 6
+@@ -9,1 +10,1 @@
+-line 9
++last
+*** End Patch"""
+
+    process_patch(text, files.__getitem__, files.__setitem__, files.__delitem__)
+    assert files["test.py"].splitlines() == [
+        "line 0", "line 1", "inserted 1", "inserted 2", "line 2", "line 3",
+        "line 4", "line 6", "line 7", "line 8", "last"
+    ]
+
+
 def test_identify_files():
     """Test identifying files in patch."""
     text = """*** Begin Patch
@@ -85,6 +163,54 @@ a
     assert action.chunks[0].ins_lines == ["a", "c"]
 
 
+@pytest.mark.parametrize("file_line,fuzz", [
+    ("b = 1", 0),
+    ("b = 1   ", 1),
+    ("    b = 1", 100),
+    ("\u00a0b\u00a0=\u00a01", 1000),
+])
+def test_context_matcher_tiers(file_line, fuzz):
+    """Test context is found with the least lenient comparison that works."""
+    matcher = ContextMatcher(["a", file_line, "c"])
+    assert matcher.find(["a", "b = 1"], 0, False) == (0, 2, fuzz)
+
+
+def test_text_to_patch_fuzz():
+    """Test patches with whitespace drift apply and report their fuzz."""
+    text = """*** Begin Patch
+*** Update File: test.py
+@@ -1,3 +1,3 @@
+def f():
+-    return \"x\"
++    return \"y\"
+*** End Patch"""
+
+    orig = {"test.py": "def f():  \n    return \u201cx\u201d\n"}
+    patch, fuzz = text_to_patch(text, orig)
+    assert fuzz == 1000
+    assert patch.actions["test.py"].chunks[0].orig_index == 0
+    commit = patch_to_commit(patch, orig)
+    # Context lines keep the file's text; only the changed line is the patch's
+    assert commit.changes["test.py"].new_content == 'def f():  \n    return "y"\n'
+
+    indented = """*** Begin Patch
+*** Update File: test.py
+@@
+  if ok:
+-   x = 1
++   x = 2
+  y = “z”
+*** End Patch"""
+    orig = {"test.py": "if ok:\n    x = 1\n    y = \"z\"\n"}
+    patch, fuzz = text_to_patch(indented, orig)
+    assert fuzz
+    commit = patch_to_commit(patch, orig)
+    assert commit.changes["test.py"].new_content == 'if ok:\n   x = 2\n    y = "z"\n'
+
+    with pytest.raises(DiffError, match="Context not found"):
+        text_to_patch(text, {"test.py": "def g():\n    return 'x'\n"})
+
+
 def test_patch_to_commit():
     """Test converting patch to commit."""
     patch = Patch(actions={
@@ -175,3 +301,147 @@ a
         # Verify result
         with open(test_py) as f:
             assert f.read() == "a\nc\nc\n"
+
+
+def test_apply_patch_to_files(tmp_path):
+    """Test a patch adding, updating, moving and deleting files at once."""
+    (tmp_path / "update.py").write_text("a\nb\n")
+    (tmp_path / "update.py").chmod(0o755)
+    (tmp_path / "move.py").write_text("x\n")
+    (tmp_path / "delete.py").write_text("gone\n")
+    text = """*** Begin Patch
+*** Update File: update.py
+@@ -1,2 +1,2 @@
+a
+-b
++c
+*** Update File: move.py
+*** Move to: moved/into/place.py
+@@ -1 +1 @@
+-x
++y
+*** Delete File: delete.py
+*** Add File: new/file.py
++hello
+*** End Patch"""
+
+    assert apply_patch_to_files(text, cwd=str(tmp_path)) == "Done!"
+    assert (tmp_path / "update.py").read_text() == "a\nc\n"
+    assert (tmp_path / "update.py").stat().st_mode & 0o777 == 0o755
+    assert (tmp_path / "moved/into/place.py").read_text() == "y\n"
+    assert (tmp_path / "new/file.py").read_text() == "hello\n"
+    assert not (tmp_path / "move.py").exists()
+    assert not (tmp_path / "delete.py").exists()
+    # No staged or backup files left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["moved", "new", "update.py"]
+
+
+@pytest.mark.parametrize("count", [2, 20])
+def test_file_transaction_rollback(tmp_path, count):
+    """Test a failing transaction leaves every file as it was."""
+    for i in range(count):
+        (tmp_path / f"f{i}.txt").write_text(f"old {i}")
+    transaction = FileTransaction(str(tmp_path))
+    for i in range(count):
+        transaction.write(f"f{i}.txt", f"new {i}")
+    transaction.write("sub/added.txt", "added")
+    transaction.remove("f0.txt")
+    # Fails after every write has been renamed into place
+    transaction.remove("missing.txt")
+
+    with pytest.raises(FileNotFoundError):
+        transaction.commit()
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"f{i}.txt" for i in range(count))
+    for i in range(count):
+        assert (tmp_path / f"f{i}.txt").read_text() == f"old {i}"
+
+    transaction = FileTransaction(str(tmp_path), fsync=False)
+    for i in range(count):
+        transaction.write(f"f{i}.txt", f"new {i}")
+    transaction.commit()
+    for i in range(count):
+        assert (tmp_path / f"f{i}.txt").read_text() == f"new {i}"
+
+
+def test_process_patch_streams_files():
+    """Test each file is read only when its section is reached."""
+    files = {"a.py": "a\n", "b.py": "b\n"}
+    events = []
+
+    def open_fn(path: str) -> str:
+        events.append(("open", path))
+        return files[path]
+
+    def write_fn(path: str, content: str) -> None:
+        events.append(("write", path))
+
+    text = """*** Begin Patch
+*** Update File: a.py
+-a
++A
+*** Update File: b.py
+@@
+-b
++B
+*** End Patch"""
+
+    process_patch(text, open_fn, write_fn, files.__delitem__)
+    assert events == [("open", "a.py"), ("write", "a.py"), ("open", "b.py"), ("write", "b.py")]
+
+
+def test_text_to_patch_blank_context_lines():
+    """Test empty lines in a chunk are context, at the end the file's end."""
+    text = """*** Begin Patch
+*** Update File: test.py
+@@ -1,4 +1,4 @@
+a
+
+-b
++c
+
+*** End Patch"""
+
+    orig = {"test.py": "a\n\nb\n"}
+    patch, fuzz = text_to_patch(text, orig)
+    assert fuzz == 0
+    assert patch_to_commit(patch, orig).changes["test.py"].new_content == "a\n\nc\n"
+
+
+def test_text_to_patch_blank_line_before_end():
+    """Test a trailing empty line that doesn't match the file's end is ignored."""
+    text = """*** Begin Patch
+*** Update File: test.py
+@@
+a
+-b
++c
+
+*** End Patch"""
+
+    orig = {"test.py": "a\nb\nx\n"}
+    patch, fuzz = text_to_patch(text, orig)
+    assert fuzz == 0
+    assert patch_to_commit(patch, orig).changes["test.py"].new_content == "a\nc\nx\n"
+
+
+def test_apply_patch_to_files_failure_leaves_files(tmp_path):
+    """Test a patch failing in a later section changes no file."""
+    (tmp_path / "a.py").write_text("a\n")
+    (tmp_path / "b.py").write_text("b\n")
+    text = """*** Begin Patch
+*** Update File: a.py
+@@
+-a
++A
+*** Add File: new/c.py
++c
+*** Update File: b.py
+@@
+-not in b
++B
+*** End Patch"""
+
+    with pytest.raises(DiffError):
+        apply_patch_to_files(text, cwd=str(tmp_path))
+    assert (tmp_path / "a.py").read_text() == "a\n"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.py", "b.py"]
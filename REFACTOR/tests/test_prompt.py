@@ -0,0 +1,44 @@
+"""Tests for prefix-stable prompt assembly."""
+from src.core.context import Conversation
+from src.core.llm import GenerationStats, Message
+from src.core.prompt import PromptBuilder, build_system_prompt
+
+
+def test_build_system_prompt():
+    """Test tools and instructions are part of the system prompt."""
+    prompt = build_system_prompt("Use tabs.", {"shell": "Run a command."})
+    assert "- shell: Run a command." in prompt
+    assert prompt.endswith("Use tabs.")
+    assert build_system_prompt() == build_system_prompt("", {})
+
+
+def test_prompt_builder_reuses_prefix():
+    """Test consecutive requests share the previous request as prefix."""
+    conversation = Conversation()
+    builder = PromptBuilder(conversation, "system prompt")
+    
+    conversation.append(Message(role="user", content="first"))
+    first = builder.build()
+    report = builder.record(GenerationStats(prompt_eval_count=10, prompt_eval_duration=2_000_000))
+    assert first[0].role == "system"
+    assert report.turn == 1
+    assert report.reused_tokens == 0
+    
+    conversation.append(Message(role="assistant", content="answer"))
+    conversation.append(Message(role="user", content="second"))
+    second = builder.build()
+    assert second[:len(first)] == first
+    assert all(a is b for a, b in zip(first, second))
+    
+    report = builder.record(GenerationStats(prompt_eval_count=4))
+    assert report.turn == 2
+    assert report.reused_tokens == conversation.tokens_before(len(first))
+    assert 0 < report.estimated_cache_hit_ratio < 1
+    assert "cache hit, estimated" in str(report)
+
+
+def test_message_formatting_is_cached():
+    """Test a message is formatted once and reused."""
+    message = Message(role="user", content="hi")
+    assert message.to_dict() is message.to_dict()
+    assert message.to_dict() == {"role": "user", "content": "hi"}
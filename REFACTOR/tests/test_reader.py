@@ -0,0 +1,64 @@
+"""Tests for ranged file reads."""
+import os
+
+import pytest
+
+from src.core import reader
+from src.core.reader import FileReader
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("".join(f"line {i}\n" for i in range(1, 1001)))
+    return str(path)
+
+
+def test_read_whole_file(log_file):
+    """Test reading without a range returns the file."""
+    with open(log_file) as f:
+        assert FileReader().read(log_file, max_bytes=10**6) == f.read()
+
+
+def test_read_line_range(log_file):
+    """Test line ranges, including ones past the checkpoints and the end."""
+    file_reader = FileReader()
+    assert file_reader.read(log_file, start_line=1, end_line=2) == "line 1\nline 2\n"
+    assert file_reader.read(log_file, start_line=400, end_line=402) == "line 400\nline 401\nline 402\n"
+    assert file_reader.read(log_file, start_line=129, end_line=129) == "line 129\n"
+    assert file_reader.read(log_file, start_line=999) == "line 999\nline 1000\n"
+    assert file_reader.read(log_file, start_line=2000) == ""
+
+
+def test_read_byte_range(log_file):
+    """Test byte ranges are served as is."""
+    assert FileReader().read(log_file, offset=7, length=6) == "line 2"
+
+
+def test_read_truncated(log_file):
+    """Test long ranges are cut at a line boundary with a marker."""
+    text = FileReader().read(log_file, start_line=10, max_bytes=30)
+    assert text == "line 10\nline 11\nline 12\n... [truncated, 8806 more bytes; continue from line 13] ..."
+
+    text = FileReader().read(log_file, offset=0, max_bytes=10)
+    assert text.endswith("... [truncated, 8883 more bytes; continue from offset 10] ...")
+
+
+def test_read_binary(tmp_path):
+    """Test binary files are reported instead of returned."""
+    path = tmp_path / "blob.bin"
+    path.write_bytes(b"\x89PNG\r\n\x00\x00" + bytes(range(256)))
+    assert FileReader().read(str(path)) == "[Binary file, 264 bytes]"
+
+
+def test_read_index_follows_changes(tmp_path, monkeypatch):
+    """Test a changed file gets a new line index."""
+    monkeypatch.setattr(reader, "LINE_INDEX_STEP", 2)
+    path = tmp_path / "f.txt"
+    path.write_text("a\nb\nc\nd\ne\n")
+    file_reader = FileReader()
+    assert file_reader.read(str(path), start_line=5) == "e\n"
+
+    path.write_text("1\n22\n333\n4444\n55555\n666666\n")
+    os.utime(path, ns=(0, 10**9))
+    assert file_reader.read(str(path), start_line=5, end_line=5) == "55555\n"
@@ -0,0 +1,63 @@
+"""Tests for incremental rendering of streamed output."""
+import asyncio
+import io
+from rich.console import Console
+from src.cli import interactive
+from src.cli.render import MarkdownStreamRenderer
+from src.core.executor import ExecResult
+
+
+def _make_console() -> Console:
+    return Console(file=io.StringIO(), force_terminal=False, width=80)
+
+
+def test_renderer_commits_blocks():
+    """Test completed blocks are printed as soon as they end."""
+    console = _make_console()
+    renderer = MarkdownStreamRenderer(console)
+    
+    for fragment in ["Hel", "lo", " world\n", "\n", "Second"]:
+        renderer.feed(fragment)
+        
+    output = console.file.getvalue()
+    assert "Hello world" in output
+    assert "Second" not in output
+    assert renderer.pending_text == "Second"
+    
+    renderer.finish()
+    assert "Second" in console.file.getvalue()
+    assert renderer.pending_text == ""
+
+
+def test_renderer_keeps_code_fences_together():
+    """Test blank lines inside a fenced block do not split it."""
+    console = _make_console()
+    renderer = MarkdownStreamRenderer(console)
+    
+    renderer.feed("```python\nx = 1\n\ny = 2\n")
+    assert console.file.getvalue() == ""
+    
+    renderer.feed("```\n\n")
+    output = console.file.getvalue()
+    assert "x = 1" in output
+    assert "y = 2" in output
+
+
+def test_renderer_context_manager():
+    """Test leaving the context flushes pending text."""
+    console = _make_console()
+    with MarkdownStreamRenderer(console) as renderer:
+        renderer.feed("partial")
+    assert "partial" in console.file.getvalue()
+
+
+def test_full_stdout_disables_truncation(monkeypatch):
+    """Test long command output is truncated unless full output is requested."""
+    result = ExecResult(stdout="a" * 600 + "b" * 600, stderr="", code=0)
+    for full_stdout, truncated in ((False, True), (True, False)):
+        console = _make_console()
+        monkeypatch.setattr(interactive, "console", console)
+        asyncio.run(interactive._display_exec_result(result, full_stdout=full_stdout))
+        output = console.file.getvalue().replace("\n", "")
+        assert ("output truncated" in output) == truncated
+        assert ("a" * 600 in output) == full_stdout
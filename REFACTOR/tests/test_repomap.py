@@ -0,0 +1,110 @@
+"""Tests for the repository map."""
+import asyncio
+import os
+
+import pytest
+
+from src.core import repomap
+from src.core.repomap import RepoMap, outline_file, rank_files
+from src.core.tools import registry, repo_map
+
+
+@pytest.fixture
+def project(tmp_path):
+    files = {
+        "pkg/__init__.py": "",
+        "pkg/util.py": (
+            "MAX_SIZE = 10\n_PRIVATE = 1\n\n"
+            "def helper(a, b=1, *args, key=None, **kwargs):\n    import json\n\n"
+            "class Store(Base):\n    def get(self, key):\n        pass\n"
+            "    def _hidden(self):\n        pass\n    async def fetch(self):\n        pass\n"
+            "def _private():\n    pass\n"
+        ),
+        "pkg/app.py": "from .util import helper\nfrom pkg import util\n\ndef main():\n    pass\n",
+        "pkg/cli.py": "from pkg.util import Store\nimport pkg.app\n",
+        "web/index.ts": (
+            "import { x } from './api';\nexport class Page {}\nexport function render() {}\n"
+            "export const ROUTES = [];\n"
+        ),
+        "web/api.ts": "export async function get() {}\n",
+        "broken.py": "def ok():\n    pass\ndef broken(:\n",
+        "README.md": "# Project\n",
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return tmp_path
+
+
+def test_outline_python(project):
+    """Test Python files are outlined from their syntax tree."""
+    outline = outline_file(str(project), "pkg/util.py")
+    assert outline.symbols == [
+        "MAX_SIZE",
+        "def helper(a, b, *args, key, **kwargs)",
+        "class Store(Base)",
+        "  def get(key)",
+        "  async def fetch()",
+    ]
+    assert outline.imports == ["json"]
+    assert outline_file(str(project), "pkg/app.py").imports == [
+        "pkg.util", "pkg.util.helper", "pkg", "pkg.util",
+    ]
+
+
+def test_outline_other_languages(project):
+    """Test regex outlines, and the fallback for Python that doesn't parse."""
+    outline = outline_file(str(project), "web/index.ts")
+    assert outline.symbols == ["export class Page", "export function render", "export const ROUTES"]
+    assert outline.imports == ["./api"]
+    assert outline_file(str(project), "broken.py").symbols == ["def ok", "def broken"]
+    assert outline_file(str(project), "README.md").symbols == []
+
+
+def test_rank_files(project):
+    """Test files imported by more files rank first."""
+    outlines = {path: outline_file(str(project), path) for path in [
+        "README.md", "pkg/__init__.py", "pkg/app.py", "pkg/cli.py", "pkg/util.py",
+        "web/api.ts", "web/index.ts",
+    ]}
+    # Ties go to files with symbols, then shallower ones
+    assert rank_files(outlines) == [
+        "pkg/util.py", "pkg/app.py", "web/api.ts", "pkg/__init__.py",
+        "web/index.ts", "README.md", "pkg/cli.py",
+    ]
+
+
+def test_render_budget(project):
+    """Test the map lists every path first and trims symbols to the budget."""
+    repo = RepoMap(str(project))
+    full = repo.render(max_tokens=1000)
+    assert full.splitlines()[:3] == ["8 files, most imported first:", "pkg/util.py", "  MAX_SIZE"]
+    assert "  def main()" in full
+
+    small = repo.render(max_tokens=60)
+    assert [line for line in small.splitlines() if not line.startswith("  ")] == \
+        [line for line in full.splitlines() if not line.startswith("  ")]
+    assert "  def main()" not in small
+
+    tiny = repo.render(max_tokens=20)
+    assert tiny.splitlines()[-1].endswith("more files")
+
+
+def test_outlines_cached(project, monkeypatch):
+    """Test only changed files are outlined again."""
+    repo = RepoMap(str(project))
+    repo.outlines()
+    outlined = []
+    monkeypatch.setattr(repomap, "outline_file", lambda root, path: outlined.append(path) or
+                        repomap.FileOutline())
+    (project / "pkg" / "app.py").write_text("def main(argv):\n    pass\n")
+    os.utime(project / "pkg" / "app.py", ns=(0, 10**9))
+    repo.outlines()
+    assert outlined == ["pkg/app.py"]
+
+
+def test_repo_map_tool(project):
+    """Test the tool is registered as read-only and renders the map."""
+    assert registry.is_read_only("repo_map")
+    assert asyncio.run(repo_map(path=str(project))).startswith("8 files")
@@ -1,8 +1,15 @@
 """Tests for sandbox functionality."""
+import asyncio
+import gc
 import os
 import platform
+import shlex
+import shutil
+import sys
+import tempfile
 import pytest
-from src.core.sandbox import Sandbox, SandboxType, ExecResult
+from src.core.sandbox import (Sandbox, SandboxType, ExecResult, OutputBuffer, OutputChunk,
+                              PolicyCache, ResourceLimits, ShellSession)
 
 @pytest.mark.asyncio
 async def test_sandbox_echo():
@@ -77,3 +84,217 @@ async def test_sandbox_with_cwd():
     result = await sandbox.exec("pwd", cwd="/tmp")
     assert result.code == 0
     assert "/tmp" in result.stdout
+
+@pytest.mark.asyncio
+async def test_sandbox_persistent_session():
+    """Test the shell session keeps cwd and exported variables."""
+    sandbox = Sandbox(persistent=True)
+    try:
+        result = await sandbox.exec("cd /tmp && export SESSION_VAR=kept")
+        assert result.code == 0
+        result = await sandbox.exec("pwd; echo $SESSION_VAR; printf 'no newline'")
+        assert result.stdout == "/tmp\nkept\nno newline"
+        assert sandbox.cwd == "/tmp"
+        
+        result = await sandbox.exec("echo out; echo err >&2; exit 3")
+        assert (result.stdout, result.stderr, result.code) == ("out\n", "err\n", 3)
+        # The session restarts in the last known directory
+        result = await sandbox.exec("pwd")
+        assert result.stdout.strip() == "/tmp"
+    finally:
+        await sandbox.aclose()
+
+@pytest.mark.asyncio
+async def test_sandbox_persistent_session_other_env():
+    """Test commands with a different environment run one-shot."""
+    sandbox = Sandbox(persistent=True)
+    try:
+        await sandbox.exec("export SESSION_VAR=kept", env={"A": "1"})
+        result = await sandbox.exec("echo $A $SESSION_VAR", env={"A": "2"})
+        assert result.stdout.strip() == "2"
+        result = await sandbox.exec("echo $A $SESSION_VAR", env={"A": "1"})
+        assert result.stdout.strip() == "1 kept"
+    finally:
+        await sandbox.aclose()
+
+def test_output_buffer_head_and_tail():
+    """Test only the head and tail of long output are kept."""
+    buffer = OutputBuffer(head_bytes=4, tail_bytes=4)
+    for _ in range(100):
+        buffer.feed(b"0123456789")
+    assert buffer.total == 1000
+    assert buffer.omitted == 992
+    assert buffer.text() == "0123\n... [992 bytes omitted] ...\n6789"
+
+@pytest.mark.parametrize("persistent", [False, True])
+@pytest.mark.asyncio
+async def test_sandbox_exec_stream(persistent):
+    """Test output is streamed, decoded tolerantly and bounded."""
+    sandbox = Sandbox(persistent=persistent, head_bytes=1024, tail_bytes=1024)
+    try:
+        items = [item async for item in sandbox.exec_stream(
+            "printf 'h\\303'; printf '\\251llo \\377\\n'; head -c 100000 /dev/zero | tr '\\0' x"
+        )]
+        chunks, result = items[:-1], items[-1]
+        assert all(isinstance(chunk, OutputChunk) for chunk in chunks)
+        streamed = "".join(chunk.text for chunk in chunks)
+        assert streamed.startswith("héllo �\n")
+        assert len(streamed) == 8 + 100000
+        
+        assert result.code == 0
+        assert result.stdout.startswith("héllo �\n")
+        assert result.stdout_omitted == 9 + 100000 - 2048
+        assert result.stdout.endswith("x" * 1024)
+    finally:
+        await sandbox.aclose()
+
+@pytest.mark.parametrize("persistent", [False, True])
+@pytest.mark.asyncio
+async def test_sandbox_timeout_kills_process_group(persistent, tmp_path):
+    """Test a command running too long is killed with its children."""
+    sandbox = Sandbox(persistent=persistent, timeout=0.2)
+    marker = tmp_path / "survived"
+    try:
+        result = await sandbox.exec(f"echo started; (sleep 0.5; touch {marker}) & sleep 5")
+        assert result.killed
+        assert result.code != 0
+        assert result.stdout == "started\n"
+        assert result.duration < 2
+        
+        # Later commands still run
+        result = await sandbox.exec("echo next")
+        assert result.stdout == "next\n"
+        assert not result.killed
+    finally:
+        await sandbox.aclose()
+    await asyncio.sleep(0.7)
+    assert not marker.exists()
+
+@pytest.mark.parametrize("persistent", [False, True])
+@pytest.mark.asyncio
+async def test_sandbox_resource_limits(persistent):
+    """Test CPU and memory limits are applied to commands."""
+    sandbox = Sandbox(persistent=persistent,
+                      limits=ResourceLimits(cpu_seconds=30, memory_bytes=256 * 1024 * 1024))
+    try:
+        result = await sandbox.exec("ulimit -Ht; ulimit -v")
+        assert result.stdout.split() == ["30", str(256 * 1024)]
+        assert result.duration is not None
+    finally:
+        await sandbox.aclose()
+
+@pytest.mark.parametrize("options", [{}, {"persistent": True}, {"pool_size": 1}])
+@pytest.mark.asyncio
+async def test_sandbox_peak_rss(options):
+    """Test the peak memory of a command is reported, also in a shell session."""
+    if not sys.platform.startswith("linux"):
+        pytest.skip("Sampling memory needs /proc")
+    sandbox = Sandbox(**options)
+    try:
+        await sandbox.exec("true")
+        script = "import time; data = b'x' * (64 << 20); time.sleep(0.5)"
+        result = await sandbox.exec(f"{shlex.quote(sys.executable)} -c {shlex.quote(script)}")
+        assert result.code == 0
+        assert result.peak_rss >= 64 << 20
+    finally:
+        await sandbox.aclose()
+
+# The first shell's transport belongs to the closed loop and complains
+# when it is collected
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnraisableExceptionWarning")
+def test_shell_session_restarts_in_new_loop():
+    """Test a session used from another event loop starts a new shell."""
+    session = ShellSession(["/bin/sh"])
+    
+    async def shell_pid(close=False):
+        result = await session.run("echo $$")
+        if close:
+            await session.aclose()
+        return result.stdout.strip()
+    
+    first = asyncio.run(shell_pid())
+    # The first shell is still running, tied to the loop that has ended
+    second = asyncio.run(shell_pid(close=True))
+    gc.collect()
+    assert first.isdigit() and second.isdigit()
+    assert first != second
+
+@pytest.mark.parametrize("options", [{}, {"persistent": True}, {"pool_size": 2}])
+@pytest.mark.asyncio
+async def test_sandbox_landlock(options):
+    """Test Linux confinement allows writing only to writable paths."""
+    # Outside /tmp, which is always writable
+    root = tempfile.mkdtemp(dir=os.path.dirname(__file__))
+    work = os.path.join(root, "work")
+    os.mkdir(work)
+    sandbox = Sandbox(writable_paths=[work], **options)
+    try:
+        if sandbox.sandbox_type != SandboxType.LINUX_LANDLOCK:
+            pytest.skip("Landlock is not available")
+        result = await sandbox.exec(f"touch {root}/outside")
+        assert result.code != 0
+        assert "Permission denied" in result.stderr
+        
+        result = await sandbox.exec(f"touch {work}/inside && echo ok > /dev/null")
+        assert result.code == 0
+        assert os.path.exists(os.path.join(work, "inside"))
+    finally:
+        await sandbox.aclose()
+        shutil.rmtree(root)
+
+@pytest.mark.asyncio
+async def test_sandbox_pool_isolates_commands():
+    """Test pooled workers run commands concurrently without shared state."""
+    sandbox = Sandbox(pool_size=2)
+    try:
+        await sandbox.warm_up()
+        await sandbox.exec("cd /tmp; export POOL_VAR=leaked")
+        results = await asyncio.gather(*(
+            sandbox.exec("echo $POOL_VAR; pwd", cwd="/") for _ in range(4)
+        ))
+        assert [r.stdout for r in results] == ["\n/\n"] * 4
+    finally:
+        await sandbox.aclose()
+
+def test_sandbox_bwrap_prefix(tmp_path):
+    """Test the bubblewrap command line binds writable paths read-write."""
+    sandbox = Sandbox(writable_paths=[str(tmp_path)], sandbox_type=SandboxType.LINUX_BWRAP)
+    argv = sandbox._shell_argv(["/bin/sh"])
+    assert argv[:5] == ["bwrap", "--ro-bind", "/", "/", "--dev"]
+    assert argv[-2:] == ["--", "/bin/sh"]
+    index = argv.index(str(tmp_path.resolve()))
+    assert argv[index - 1] == "--bind"
+
+def test_policy_cache_seatbelt_profiles(tmp_path):
+    """Test profiles are written once per set of paths and removed on close."""
+    policies = PolicyCache()
+    first = policies.seatbelt_profile([str(tmp_path)])
+    assert policies.seatbelt_profile([str(tmp_path)]) == first
+    # Same content, same file
+    assert policies.seatbelt_profile([str(tmp_path / "..") + "/" + tmp_path.name]) == first
+    other = policies.seatbelt_profile([])
+    assert other != first
+    with open(first) as f:
+        assert f'(subpath "{tmp_path.resolve()}")' in f.read()
+    
+    policies.close()
+    assert not os.path.exists(first)
+    assert not os.path.exists(os.path.dirname(first))
+
+def test_policy_cache_shared_between_sandboxes(tmp_path):
+    """Test sandboxes with the same paths reuse one compiled policy."""
+    policies = PolicyCache()
+    try:
+        argvs = [
+            Sandbox(writable_paths=[str(tmp_path)], sandbox_type=SandboxType.MACOS_SEATBELT,
+                    policies=policies)._shell_argv(["/bin/sh"])
+            for _ in range(3)
+        ]
+        assert argvs[0] == argvs[1] == argvs[2]
+        assert len(os.listdir(os.path.dirname(argvs[0][2]))) == 1
+        
+        if SandboxType.LINUX_LANDLOCK == Sandbox().sandbox_type:
+            assert (policies.landlock_ruleset([str(tmp_path)])
+                    is policies.landlock_ruleset([str(tmp_path) + "/"]))
+    finally:
+        policies.close()
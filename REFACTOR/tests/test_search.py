@@ -0,0 +1,189 @@
+"""Tests for the workspace search index."""
+import asyncio
+import os
+import re
+
+import pytest
+
+from src.core import search, tools
+from src.core.sandbox import Sandbox
+from src.core.search import SearchIndex, _literals, is_ignored, parse_ignore_file
+from src.core.tools import search_files, shell_command
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    files = {
+        ".gitignore": "*.log\nbuild/\n!keep.log\n",
+        "keep.log": "needle in a kept log\n",
+        "debug.log": "needle in an ignored log\n",
+        "build/out.py": "needle = 'built'\n",
+        "src/app.py": "import os\n\ndef find_needle(haystack):\n    return haystack.index('needle')\n",
+        "src/util.py": "def helper():\n    return 42\n",
+        "src/.gitignore": "/generated.py\n",
+        "src/generated.py": "needle = 'generated'\n",
+        "docs/readme.md": "The Needle is documented here\n",
+        "data/blob.bin": "needle",
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    (tmp_path / "data" / "blob.bin").write_bytes(b"needle\0\x01\x02")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "config").write_text("needle\n")
+    index = SearchIndex(str(tmp_path))
+    index.refresh()
+    return tmp_path, index
+
+
+def test_ignore_rules(tmp_path):
+    """Test negation, directory-only and anchored gitignore patterns."""
+    (tmp_path / ".gitignore").write_text(
+        "# comment\n*.pyc\n!important.pyc\ntmp/\n/root.txt\ndocs/**/draft*.md\n"
+    )
+    rules = tuple(parse_ignore_file(str(tmp_path / ".gitignore")))
+    assert is_ignored(rules, "a/b/c.pyc", False)
+    assert not is_ignored(rules, "a/important.pyc", False)
+    assert is_ignored(rules, "a/tmp", True)
+    assert not is_ignored(rules, "a/tmp", False)
+    assert is_ignored(rules, "root.txt", False)
+    assert not is_ignored(rules, "sub/root.txt", False)
+    assert is_ignored(rules, "docs/a/b/draft1.md", False)
+    assert is_ignored(rules, "docs/draft1.md", False)
+    assert not is_ignored(rules, "docs/final.md", False)
+
+
+def test_ignore_rules_above_workspace(tmp_path):
+    """Test a workspace inside a repository honors the ignore files above it."""
+    (tmp_path / ".git" / "info").mkdir(parents=True)
+    (tmp_path / ".git" / "info" / "exclude").write_text("*.tmp\n")
+    (tmp_path / ".gitignore").write_text("__pycache__/\n/top.txt\npkg/*.log\n")
+    root = tmp_path / "pkg"
+    for name in ("a.py", "b.tmp", "c.log", "top.txt", "__pycache__/a.pyc"):
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text("x\n")
+    index = SearchIndex(str(root))
+    index.refresh()
+    assert index.files() == ["a.py", "top.txt"]
+
+
+def test_index_files(workspace):
+    """Test the file list skips ignored files and the .git directory."""
+    _, index = workspace
+    assert index.files() == [
+        ".gitignore", "data/blob.bin", "docs/readme.md", "keep.log",
+        "src/.gitignore", "src/app.py", "src/util.py",
+    ]
+
+
+def test_search_contents(workspace):
+    """Test content search reports matching lines of candidate files."""
+    _, index = workspace
+    assert index.search(r"needle") == [
+        "keep.log:1:needle in a kept log",
+        "src/app.py:3:def find_needle(haystack):",
+        "src/app.py:4:    return haystack.index('needle')",
+    ]
+    assert index.search(r"needle", ignore_case=True, glob="*.md") == [
+        "docs/readme.md:1:The Needle is documented here",
+    ]
+    assert index.search(r"ret\w+ \d+") == ["src/util.py:2:    return 42"]
+    assert index.search(r"def (helper|find_)") == [
+        "src/app.py:3:def find_needle(haystack):",
+        "src/util.py:1:def helper():",
+    ]
+    assert index.search(r"^$") == ["src/app.py:2:"]
+    assert index.search(r"needle", max_results=1) == [
+        "keep.log:1:needle in a kept log", "... more matches not shown",
+    ]
+
+
+@pytest.mark.parametrize("pattern,literals", [
+    (r"foo", ["foo"]),
+    (r"foo\.bar", ["foo.bar"]),
+    (r"fo+bar", ["fo", "bar"]),
+    (r"colou?r", ["colo", "r"]),
+    (r"a(bc)?def", ["a", "def"]),
+    (r"\bword\b", ["word"]),
+    (r"x[abc]y{2,3}z", ["x", "z"]),
+    (r"\x41BC", ["BC"]),
+    (r"foo|bar", None),
+])
+def test_literals(pattern, literals):
+    """Test the literal text every match of a pattern must contain."""
+    assert _literals(pattern) == literals
+
+
+def test_signature_never_hides_matches(workspace):
+    """Test the prefilter keeps every file a plain scan would match."""
+    root, index = workspace
+    for pattern in [r"needle", r"hay\w+", r"index\('ne", r"import os", r"42$", r"(?i)THE NEEDLE"]:
+        regex = re.compile(pattern, re.M)
+        expected = [
+            path for path in index.files()
+            if path != "data/blob.bin" and regex.search((root / path).read_text())
+        ]
+        found = sorted({line.split(":", 1)[0] for line in index.search(pattern)})
+        assert found == expected, pattern
+
+
+def test_find_files(workspace):
+    """Test filename queries match paths."""
+    _, index = workspace
+    assert index.find_files(r"\.py$") == ["src/app.py", "src/util.py"]
+    assert index.find_files(r"^docs/") == ["docs/readme.md"]
+
+
+def test_refresh_and_update(workspace):
+    """Test changed, added and removed files are picked up."""
+    root, index = workspace
+    (root / "src" / "util.py").write_text("def helper():\n    return 'needle'\n")
+    os.utime(root / "src" / "util.py", ns=(0, 10**9))
+    (root / "src" / "new.py").write_text("needle = 1\n")
+    (root / "keep.log").unlink()
+    index.refresh()
+    assert [line.split(":")[0] for line in index.search("needle")] == [
+        "src/app.py", "src/app.py", "src/new.py", "src/util.py",
+    ]
+
+    (root / "src" / "new.py").unlink()
+    (root / "src" / "added.py").write_text("needle = 2\n")
+    (root / "src" / "generated.py").write_text("needle = 3\n")
+    index.update([str(root / "src" / name) for name in ("new.py", "added.py", "generated.py")])
+    assert "src/new.py" not in index.files()
+    assert "src/added.py:1:needle = 2" in index.search("needle")
+    assert "src/generated.py" not in index.files()
+
+
+def test_search_after_shell_command(workspace, monkeypatch):
+    """Test a file changed by a shell command is found by the next search at once."""
+    root, _ = workspace
+    monkeypatch.setattr(search, "_indexes", {})
+    monkeypatch.setattr(tools, "_sandbox", Sandbox())
+    assert asyncio.run(search_files("needle_token", path=str(root))) == "No matches."
+    asyncio.run(shell_command(f"echo needle_token >> {root}/src/util.py"))
+    assert asyncio.run(search_files("needle_token", path=str(root))) == "src/util.py:3:needle_token"
+
+
+def test_invalidate_waits_for_refresh(workspace):
+    """Test a query after invalidate() sees changes made before it."""
+    root, index = workspace
+    (root / "src" / "util.py").write_text("def helper():\n    return 'needle_token'\n")
+    os.utime(root / "src" / "util.py", ns=(0, 10**9))
+    (root / "src" / "new.py").write_text("needle_token = 1\n")
+    index.invalidate()
+    assert [line.split(":")[0] for line in index.search("needle_token")] == [
+        "src/new.py", "src/util.py",
+    ]
+
+
+def test_search_files_tool(workspace, monkeypatch):
+    """Test the search tool uses the workspace index."""
+    root, _ = workspace
+    monkeypatch.setattr(search, "_indexes", {})
+    assert asyncio.run(search_files("helper", path=str(root))) == "src/util.py:1:def helper():"
+    assert asyncio.run(search_files("util", path=str(root), filenames=True)) == "src/util.py"
+    assert asyncio.run(search_files("nothing here", path=str(root))) == "No matches."
+    with pytest.raises(ValueError):
+        asyncio.run(search_files("(", path=str(root)))
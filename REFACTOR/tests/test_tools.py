@@ -1,7 +1,13 @@
 """Tests for tool handling."""
+import asyncio
+import threading
+import time
+
 import pytest
-from src.core.tools import ToolCall, ToolRegistry, registry
-from src.core.sandbox import ExecResult
+from src.core import tools
+from src.core.reader import default_reader
+from src.core.tools import ToolCall, ToolCallAssembler, ToolRegistry, ToolScheduler, registry
+from src.core.sandbox import ExecResult, Sandbox
 
 
 def test_tool_call_from_response():
@@ -87,11 +93,13 @@ async def test_shell_command():
 
 
 @pytest.mark.asyncio
-async def test_apply_patch():
+async def test_apply_patch(monkeypatch):
     """Test apply patch tool."""
     import tempfile
     import os
     
+    # Without a shell session, paths are relative to the current directory
+    monkeypatch.setattr(tools, '_sandbox', None)
     with tempfile.TemporaryDirectory() as tmpdir:
         # Create test file
         test_py = os.path.join(tmpdir, "test.py")
@@ -122,3 +130,172 @@ a
                 assert f.read() == "a\nc\nc\n"
         finally:
             os.chdir(cwd)
+
+
+@pytest.mark.asyncio
+async def test_tool_scheduler_runs_read_only_calls_concurrently():
+    """Test read-only calls overlap while results keep their order."""
+    registry = ToolRegistry()
+    running = 0
+    peak = 0
+    
+    @registry.register('read', read_only=True)
+    async def read_tool(delay: float, value: str):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(delay)
+        running -= 1
+        return value
+    
+    scheduler = ToolScheduler(registry, max_concurrency=2)
+    for delay, value in [(0.03, 'a'), (0.01, 'b'), (0.02, 'c')]:
+        scheduler.submit(ToolCall(name='read', arguments={'delay': delay, 'value': value}))
+    
+    results = [result.output async for result in scheduler.results()]
+    assert results == ['a', 'b', 'c']
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_tool_scheduler_serializes_mutating_calls():
+    """Test mutating calls act as barriers between read-only calls."""
+    registry = ToolRegistry()
+    events = []
+    
+    @registry.register('read', read_only=True)
+    async def read_tool(name: str):
+        events.append(f'start {name}')
+        await asyncio.sleep(0.01)
+        events.append(f'end {name}')
+        return name
+    
+    @registry.register('write')
+    async def write_tool(name: str):
+        events.append(f'write {name}')
+        return name
+    
+    assert registry.is_read_only('read')
+    assert not registry.is_read_only('write')
+    
+    scheduler = ToolScheduler(registry)
+    for name, arg in [('read', 'r1'), ('read', 'r2'), ('write', 'w1'), ('read', 'r3'),
+                      ('unknown', 'x')]:
+        scheduler.submit(ToolCall(name=name, arguments={'name': arg}))
+    
+    results = [result async for result in scheduler.results()]
+    assert [r.output for r in results[:4]] == ['r1', 'r2', 'w1', 'r3']
+    assert isinstance(results[4].error, ValueError)
+    
+    write = events.index('write w1')
+    assert events.index('end r1') < write and events.index('end r2') < write
+    assert events.index('start r3') > write
+
+@pytest.mark.asyncio
+async def test_tool_scheduler_runs_read_tool_off_the_event_loop(tmp_path, monkeypatch):
+    """Test concurrent calls of the real read tool overlap in worker threads."""
+    threads = set()
+    read = default_reader.read
+
+    def slow_read(*args, **kwargs):
+        threads.add(threading.get_ident())
+        time.sleep(0.1)
+        return read(*args, **kwargs)
+
+    monkeypatch.setattr(default_reader, 'read', slow_read)
+    paths = []
+    for name in 'abc':
+        path = tmp_path / f'{name}.txt'
+        path.write_text(f'{name}\n')
+        paths.append(str(path))
+
+    scheduler = ToolScheduler(registry, max_concurrency=3)
+    for path in paths:
+        scheduler.submit(ToolCall(name='read', arguments={'path': path}))
+    start = time.perf_counter()
+    results = [result.output async for result in scheduler.results()]
+    assert results == ['a\n', 'b\n', 'c\n']
+    assert time.perf_counter() - start < 0.25
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.asyncio
+async def test_apply_patch_runs_off_the_event_loop(monkeypatch):
+    """Test patches are written in a worker thread."""
+    threads = []
+
+    def fake_apply(patch_text, cwd=None):
+        threads.append(threading.get_ident())
+        return 'Done!'
+
+    monkeypatch.setattr(tools, 'apply_patch_to_files', fake_apply)
+    result = await registry.execute(ToolCall(name='apply_patch', arguments={
+        'patch_text': '*** Begin Patch\n*** End Patch'}))
+    assert result == 'Done!'
+    assert threads and threading.get_ident() not in threads
+
+
+@pytest.mark.asyncio
+async def test_tools_follow_shell_directory(tmp_path, monkeypatch):
+    """Test tool paths are resolved where the shell session is."""
+    sandbox = Sandbox(persistent=True)
+    monkeypatch.setattr(tools, '_sandbox', sandbox)
+    sub = tmp_path / 'sub'
+    sub.mkdir()
+    (sub / 'notes.txt').write_text('in sub\n')
+    try:
+        await registry.execute(ToolCall(name='shell', arguments={'command': f'cd {sub}'}))
+        assert tools.resolve_path() == str(sub)
+        result = await registry.execute(ToolCall(name='read', arguments={'path': 'notes.txt'}))
+        assert result == 'in sub\n'
+        patch_text = '*** Begin Patch\n*** Add File: new.txt\n+added\n*** End Patch'
+        await registry.execute(ToolCall(name='apply_patch', arguments={'patch_text': patch_text}))
+        assert (sub / 'new.txt').read_text() == 'added\n'
+        assert tools.resolve_path(str(tmp_path)) == str(tmp_path)
+    finally:
+        await sandbox.aclose()
+
+
+def test_tool_call_from_response_native_format():
+    """Test Ollama's format with object arguments and no type."""
+    response = {
+        'message': {
+            'tool_calls': [{
+                'function': {'name': 'read', 'arguments': {'path': 'a.py'}}
+            }]
+        }
+    }
+    tool_calls = ToolCall.from_response(response)
+    assert tool_calls == [ToolCall(name='read', arguments={'path': 'a.py'})]
+
+def test_registry_schemas():
+    """Test tool schemas are generated from signatures and docstrings."""
+    schemas = {s['function']['name']: s['function'] for s in registry.schemas()}
+    shell = schemas['shell']
+    assert shell['description'] == 'Execute a shell command in the sandbox.'
+    assert shell['parameters']['required'] == ['command']
+    assert shell['parameters']['properties']['command'] == {
+        'type': 'string', 'description': 'Command to execute'
+    }
+    assert shell['parameters']['properties']['env']['type'] == 'object'
+    # Cached, so every request sends identical definitions
+    assert registry.schemas() is registry.schemas()
+
+def test_tool_call_assembler_streamed_arguments():
+    """Test calls streamed in fragments are released once complete."""
+    assembler = ToolCallAssembler()
+    assert assembler.feed([{'index': 0, 'function': {'name': 'read', 'arguments': '{"pa'}}]) == []
+    assert assembler.feed([{'index': 0, 'function': {'arguments': 'th": "a.py"}'}}]) == [
+        ToolCall(name='read', arguments={'path': 'a.py'})
+    ]
+    # A second call is released at the end of the stream
+    assert assembler.feed([{'index': 1, 'function': {'name': 'search', 'arguments': ''}}]) == []
+    assert assembler.finish() == [ToolCall(name='search', arguments={})]
+    assert [call.name for call in assembler.calls] == ['read', 'search']
+
+def test_tool_call_assembler_complete_calls():
+    """Test complete calls are released immediately."""
+    assembler = ToolCallAssembler()
+    calls = assembler.feed([{'function': {'name': 'read', 'arguments': {'path': 'a.py'}}}])
+    assert calls == [ToolCall(name='read', arguments={'path': 'a.py'})]
+    assert assembler.finish() == []